@@ -1,2 +1,4 @@
 from .constructor import FSTConstructor
-from .utils import FST, FSA
\ No newline at end of file
+from .utils import FST, FSA
+from .backend import AutomataBackend, get_backend
+from .cache import AutomataCache, SubexpressionCache
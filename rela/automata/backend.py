@@ -0,0 +1,278 @@
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file defines the interface between the FST construction
+visitors and the automata libraries that implement the fst_* operations.
+"""
+
+from abc import ABC, abstractmethod
+
+from . import utils
+from . import native
+
+
+class AutomataBackend(ABC):
+    """
+    Abstract class for automata backends. A backend provides the fst_*
+    operations used by FSTConstructor, SpecVerifier and
+    CounterExampleGenerator. Automata built by one backend must only be passed
+    to operations of the same backend. See utils.py for the semantics of each
+    operation.
+    """
+    name: str
+
+    # whether images are computed by expanding fst_lazy_* relations on demand;
+    # otherwise the fst_lazy_* operations build ordinary automata
+    lazy: bool = False
+
+    @staticmethod
+    @abstractmethod
+    def fst_zero():
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_one():
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_symbol(symbol):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_symbols(symbols):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_wildcard(symbols):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_neg_symbols(symbols, alphabet):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_concat(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_union(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_priority_union(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_compose(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_intersect(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_star(t):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_complement(t, alphabet):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_prefixes(t):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_path_set(paths):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_forwarding_graph(graph):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_from_fsa_product(l, r):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_image(p, r):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_reverse_image(p, r):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_lazy_product(l, r):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_lazy_concat(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_lazy_union(*args):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_lazy_image(p, r):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_invert(t):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_minus(p, q):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_eq(p, q):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_eq_witness(p, q):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_subseteq(p, q):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_subseteq_witness(p, q):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_determinize(t):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_minimize(t):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def fst_extract_paths(t):
+        raise NotImplementedError
+
+
+class HfstBackend(AutomataBackend):
+    """
+    The default backend, based on the HFST library.
+    """
+    name = 'hfst'
+
+    fst_zero = staticmethod(utils.fst_zero)
+    fst_one = staticmethod(utils.fst_one)
+    fst_from_symbol = staticmethod(utils.fst_from_symbol)
+    fst_from_symbols = staticmethod(utils.fst_from_symbols)
+    fst_from_wildcard = staticmethod(utils.fst_from_wildcard)
+    fst_from_neg_symbols = staticmethod(utils.fst_from_neg_symbols)
+    fst_concat = staticmethod(utils.fst_concat)
+    fst_union = staticmethod(utils.fst_union)
+    fst_priority_union = staticmethod(utils.fst_priority_union)
+    fst_compose = staticmethod(utils.fst_compose)
+    fst_intersect = staticmethod(utils.fst_intersect)
+    fst_star = staticmethod(utils.fst_star)
+    fst_complement = staticmethod(utils.fst_complement)
+    fst_prefixes = staticmethod(utils.fst_prefixes)
+    fst_from_path_set = staticmethod(utils.fst_from_path_set)
+    fst_from_forwarding_graph = staticmethod(utils.fst_from_forwarding_graph)
+    fst_from_fsa_product = staticmethod(utils.fst_from_fsa_product)
+    fst_image = staticmethod(utils.fst_image)
+    fst_reverse_image = staticmethod(utils.fst_reverse_image)
+    fst_lazy_product = staticmethod(utils.fst_from_fsa_product)
+    fst_lazy_concat = staticmethod(utils.fst_concat)
+    fst_lazy_union = staticmethod(utils.fst_union)
+    fst_lazy_image = staticmethod(utils.fst_image)
+    fst_invert = staticmethod(utils.fst_invert)
+    fst_minus = staticmethod(utils.fst_minus)
+    fst_eq = staticmethod(utils.fst_eq)
+    fst_eq_witness = staticmethod(utils.fst_eq_witness)
+    fst_subseteq = staticmethod(utils.fst_subseteq)
+    fst_subseteq_witness = staticmethod(utils.fst_subseteq_witness)
+    fst_determinize = staticmethod(utils.fst_determinize)
+    fst_minimize = staticmethod(utils.fst_minimize)
+    fst_extract_paths = staticmethod(utils.fst_extract_paths)
+
+
+class NativeBackend(AutomataBackend):
+    """
+    A pure-Python backend over integer-state automata, see native.py.
+    """
+    name = 'native'
+    lazy = True
+
+    fst_zero = staticmethod(native.fst_zero)
+    fst_one = staticmethod(native.fst_one)
+    fst_from_symbol = staticmethod(native.fst_from_symbol)
+    fst_from_symbols = staticmethod(native.fst_from_symbols)
+    fst_from_wildcard = staticmethod(native.fst_from_wildcard)
+    fst_from_neg_symbols = staticmethod(native.fst_from_neg_symbols)
+    fst_concat = staticmethod(native.fst_concat)
+    fst_union = staticmethod(native.fst_union)
+    fst_priority_union = staticmethod(native.fst_priority_union)
+    fst_compose = staticmethod(native.fst_compose)
+    fst_intersect = staticmethod(native.fst_intersect)
+    fst_star = staticmethod(native.fst_star)
+    fst_complement = staticmethod(native.fst_complement)
+    fst_prefixes = staticmethod(native.fst_prefixes)
+    fst_from_path_set = staticmethod(native.fst_from_path_set)
+    fst_from_forwarding_graph = staticmethod(native.fst_from_forwarding_graph)
+    fst_from_fsa_product = staticmethod(native.fst_from_fsa_product)
+    fst_image = staticmethod(native.fst_image)
+    fst_reverse_image = staticmethod(native.fst_reverse_image)
+    fst_lazy_product = staticmethod(native.fst_lazy_product)
+    fst_lazy_concat = staticmethod(native.fst_lazy_concat)
+    fst_lazy_union = staticmethod(native.fst_lazy_union)
+    fst_lazy_image = staticmethod(native.fst_lazy_image)
+    fst_invert = staticmethod(native.fst_invert)
+    fst_minus = staticmethod(native.fst_minus)
+    fst_eq = staticmethod(native.fst_eq)
+    fst_eq_witness = staticmethod(native.fst_eq_witness)
+    fst_subseteq = staticmethod(native.fst_subseteq)
+    fst_subseteq_witness = staticmethod(native.fst_subseteq_witness)
+    fst_determinize = staticmethod(native.fst_determinize)
+    fst_minimize = staticmethod(native.fst_minimize)
+    fst_extract_paths = staticmethod(native.fst_extract_paths)
+
+
+_backends = {backend.name: backend for backend in [HfstBackend(), NativeBackend()]}
+
+def get_backend(name: str) -> AutomataBackend:
+    """
+    Get an automata backend by its name, i.e., 'hfst' or 'native'.
+    """
+    if name not in _backends:
+        raise ValueError(f"Unknown automata backend: {name}, should be one of {', '.join(_backends)}")
+    return _backends[name]
@@ -0,0 +1,119 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Hashable, List, Tuple
+import hashlib
+
+from ..language.regularir.dependency_scanner import DependencyScanner
+from ..networkmodel.forwardinggraph import ForwardingGraph
+from ..networkmodel.networkpath import NetworkPath
+from ..networkmodel.symboltable import SymbolTable
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements a content-addressed LRU cache for the
+automata of network states. FECs with identical forwarding graphs (or path
+sets) share one minimized automaton. It also implements the cache of spec
+subexpressions that do not depend on the network state.
+"""
+
+def _digest(canonical: Any) -> str:
+    return hashlib.blake2b(repr(canonical).encode('utf8'), digest_size=16).hexdigest()
+
+def _hop_key(hop) -> Tuple:
+    return tuple(sorted(hop)) if isinstance(hop, list) else (hop,)
+
+def graph_hash(graph: ForwardingGraph, symbols: SymbolTable = None) -> str:
+    """
+    Compute a canonical hash of a forwarding graph. The hash only depends on
+    the sources, sinks and labeled edges of the graph, not on the order in
+    which they are stored, and it is stable across processes. If a symbol
+    table is given, interned symbols are hashed by their names, so that the
+    hash is also stable across network changes.
+    """
+    name = symbols.name if symbols is not None else lambda symbol: symbol
+    nodes = []
+    for node in graph.get_nodes():
+        out_edges = sorted((name(next_node), tuple(sorted(map(name, edges)))) for next_node, edges in graph.get_out_edges(node).items())
+        nodes.append((name(node), graph.is_source(node), graph.is_sink(node), tuple(out_edges)))
+    nodes.sort()
+    return _digest(('graph', tuple(nodes)))
+
+def path_set_hash(paths: List[NetworkPath]) -> str:
+    """
+    Compute a canonical hash of a set of network paths.
+    """
+    canonical = sorted(set(tuple(_hop_key(hop) for hop in path) for path in paths or []))
+    return _digest(('paths', tuple(canonical)))
+
+
+class AutomataCache:
+    """
+    An LRU cache of network state automata, keyed by the backend name and the
+    canonical hash of the state. Automata built from interned symbols are only
+    valid for the symbol table they were built with, so each entry remembers
+    its table and only matches lookups with the same table.
+    """
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Tuple[SymbolTable, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, symbols: SymbolTable = None) -> Any:
+        """
+        Get the automaton cached under the given key, or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not symbols:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any, symbols: SymbolTable = None):
+        """
+        Cache an automaton, evicting the least recently used one if the cache
+        is full.
+        """
+        self._entries[key] = (symbols, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SubexpressionCache(AutomataCache):
+    """
+    An LRU cache of the automata of spec subexpressions that do not reference
+    preState or postState, shared by all FECs verified against a spec.
+    Subexpressions that need the alphabet are cached per alphabet.
+    """
+    def __init__(self, max_size: int = 256):
+        super().__init__(max_size)
+        self._scanner = DependencyScanner()
+
+    def dependencies(self, expr: Any) -> frozenset:
+        """
+        Get the dependencies of an expression, see DependencyScanner.
+        """
+        return self._scanner.visit(expr)
+
+    def get_expr(self, expr: Any, key: Tuple, symbols: SymbolTable = None) -> Any:
+        """
+        Get the automaton cached for an expression under the given key.
+        Expressions are unhashable, so they are keyed by id, and each entry
+        keeps a reference to its expression so that the id is not reused.
+        """
+        entry = self.get((id(expr),) + key, symbols)
+        return entry[1] if entry is not None else None
+
+    def put_expr(self, expr: Any, key: Tuple, value: Any, symbols: SymbolTable = None):
+        """
+        Cache the automaton of an expression under the given key.
+        """
+        self.put((id(expr),) + key, (expr, value), symbols)
@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Tuple
 from dataclasses import dataclass
 import hfst
 
@@ -6,10 +6,15 @@ from ..language.regularir import PNegSymbols, PSymbol, PPredicate, PConcat, PUni
 from ..language.regularir import REmptySet, REpsilon, RIdentity, RProduct, RConcat, RStar, RUnion, RPriorityUnion
 
 from ..language.regularir.rirvisitor import PropVisitor, RelVisitor
+from ..language.hashcons import MemoizingVisitor
 from..networkmodel.fec import FEC, PathFEC, GraphFEC
+from ..networkmodel.symboltable import SymbolTable, Location
+from ..networkmodel.attributeindex import LOCATION_FIELDS, GROUP_FIELD, location_fields
 
-from .utils import fst_zero, fst_one, fst_from_symbol, fst_from_symbols, fst_from_neg_symbols, fst_concat, fst_union, fst_star, fst_intersect, fst_complement, fst_priority_union, fst_compose
-from .utils import fst_from_path_set, fst_from_forwarding_graph, fst_image, fst_reverse_image, fst_from_fsa_product
+from .backend import AutomataBackend, get_backend
+from .cache import AutomataCache, SubexpressionCache, graph_hash, path_set_hash
+from .plan import AtomicPlan, Instruction
+from ..language.regularir.dependency_scanner import STATE, ALPHABET, WILDCARD
 from .utils import FST, FSA
 
 
@@ -21,10 +26,17 @@ Prop and Rel expressions.
 """
 
 @dataclass
-class FSTConstructor(PropVisitor, RelVisitor):
+class FSTConstructor(MemoizingVisitor, PropVisitor, RelVisitor):
     """
     This class implements the visitor pattern for constructing FSTs for Prop and
     Rel expressions.
+
+    Wildcards and complements range over the alphabet: they never match a
+    symbol of the spec that is not in the alphabet. The visitor builds them
+    over the alphabet. Plans (see execute) build them over all symbols
+    instead, so that they can be shared by FECs with different alphabets,
+    and bound them to the strings over the alphabet and the symbols of the
+    spec where the plan says so. Both give the same verdicts.
     """
     
     """Global state for FST constructions."""
@@ -35,112 +47,301 @@ class FSTConstructor(PropVisitor, RelVisitor):
     # fec: the preState and postState to be used for FST construction
     fec: FEC
 
+    # backend: the automata library that implements the FST operations
+    backend: AutomataBackend = get_backend('hfst')
+
+    # symbols: the table interning the alphabet, None if symbols are names
+    symbols: SymbolTable = None
+
+    # cache: the automata of network states shared across FECs, None to disable
+    cache: AutomataCache = None
+
+    # memo: the automata of state-independent subexpressions shared across
+    # FECs, None to disable
+    memo: SubexpressionCache = None
+
+    def construct(self, expr: Any, inverse: bool = False, lazy: bool = False) -> FST:
+        """
+        Constructs the FST of an expression (inverted if inverse is set, and
+        as a lazy relation if lazy is set). A node shared by several parents
+        is constructed once, and if the expression does not depend on the
+        network state, it is reused from the memo.
+        """
+        return self._memoize(expr, (inverse, lazy), lambda: self._construct(expr, inverse, lazy))
+
+    def _construct(self, expr: Any, inverse: bool, lazy: bool) -> FST:
+        if self.memo is None or STATE in self.memo.dependencies(expr):
+            return self._build(expr, inverse, lazy)
+
+        deps = self.memo.dependencies(expr)
+        if ALPHABET in deps or WILDCARD in deps:
+            key = (self.backend.name, inverse, lazy, self._get_alphabet_key())
+        else:
+            key = (self.backend.name, inverse, lazy)
+        t = self.memo.get_expr(expr, key, self.symbols)
+        if t is None:
+            t = self._build(expr, inverse, lazy)
+            self.memo.put_expr(expr, key, t, self.symbols)
+        return t
+
+    def _build(self, expr: Any, inverse: bool, lazy: bool) -> FST:
+        if lazy:
+            return self._build_lazy(expr, inverse)
+        t = expr.accept(self)
+        return self.backend.fst_invert(t) if inverse else t
+
+    def _build_lazy(self, expr: Any, inverse: bool) -> FST:
+        """
+        Constructs a relation that is only expanded where an image reaches it.
+        Products, identities, concatenations and unions are lazy, other
+        relations are built as usual.
+        """
+        if isinstance(expr, RProduct):
+            p, q = self.construct(expr.p), self.construct(expr.q)
+            return self.backend.fst_lazy_product(q, p) if inverse else self.backend.fst_lazy_product(p, q)
+        if isinstance(expr, RIdentity):
+            return self.construct(expr.arg)
+        if isinstance(expr, RConcat):
+            return self.backend.fst_lazy_concat(*[self.construct(sub_expr, inverse, lazy=True) for sub_expr in expr.args])
+        if isinstance(expr, RUnion):
+            return self.backend.fst_lazy_union(*[self.construct(sub_expr, inverse, lazy=True) for sub_expr in expr.args])
+        return self.construct(expr, inverse)
+
+    def __post_init__(self):
+        MemoizingVisitor.__init__(self)
+        self._alphabet_key = None
+        # the symbols of the spec of the running plan that are not in the
+        # alphabet, which wildcards never match, see execute
+        self._foreign = frozenset()
+
+    def _get_alphabet_key(self) -> frozenset:
+        if self._alphabet_key is None:
+            self._alphabet_key = frozenset(self.alphabet)
+        return self._alphabet_key
+
+    def execute(self, plan: AtomicPlan) -> Tuple[FST, FST]:
+        """
+        Runs the program of an atomic plan (see SpecPlanner) and returns the
+        automata of its left and right sides. Instructions that do not depend
+        on the network state are reused from the memo, and registers are
+        released as soon as they are no longer read.
+        """
+        self._foreign = frozenset(self._symbol(name) for name in plan.symbols).difference(self.alphabet)
+        registers: List[Any] = [None] * plan.n_registers
+        for ins in plan.instructions:
+            registers[ins.out] = self._execute(ins, registers)
+            for r in ins.free:
+                registers[r] = None
+        return registers[plan.left], registers[plan.right]
+
+    def _execute(self, ins: Instruction, registers: List[Any]) -> FST:
+        if self.memo is None or STATE in ins.deps:
+            return self._run(ins, registers)
+
+        if ALPHABET in ins.deps:
+            key = (self.backend.name, self._get_alphabet_key())
+        elif WILDCARD in ins.deps:
+            key = (self.backend.name, self._foreign)
+        else:
+            key = (self.backend.name,)
+        t = self.memo.get_expr(ins, key, self.symbols)
+        if t is None:
+            t = self._run(ins, registers)
+            self.memo.put_expr(ins, key, t, self.symbols)
+        return t
+
+    def _run(self, ins: Instruction, registers: List[Any]) -> FST:
+        return _OPERATIONS[ins.op](self, [registers[r] for r in ins.args], ins.params)
+
+    def _symbol(self, name: str) -> Location:
+        """Maps a location name in the spec to a symbol of the alphabet."""
+        return name if self.symbols is None else self.symbols.intern(name)
+
+    def _name(self, symbol: Location) -> str:
+        """Maps a symbol of the alphabet to its location name."""
+        return symbol if self.symbols is None else self.symbols.name(symbol)
 
     def visit_p_symbol(self, expr: PSymbol) -> FSA:
         """Constructs an FST for a Prop symbol expression."""
-        return fst_from_symbol(expr.symbol)
+        return self.backend.fst_from_symbol(self._symbol(expr.symbol))
     
     def visit_p_predicate(self, expr: PPredicate) -> FSA:
         """Constructs an FST for a Prop predicate expression."""
-        return fst_from_symbols({symbol for symbol in self.alphabet if expr.value in symbol})
+        return self._fst_from_predicate(expr.field, expr.value)
+
+    def _fst_from_predicate(self, field: str, value: str) -> FSA:
+        # a predicate matches the locations whose field equals the value, see
+        # location_fields, through the index of the FEC if it has one
+        index = self.fec.get_attribute_index() if self.fec is not None else None
+        if index is not None:
+            symbols = index.lookup(field, value)
+        elif field.lower() in LOCATION_FIELDS:
+            field = field.lower()
+            symbols = {symbol for symbol in self.alphabet if location_fields(self._name(symbol)).get(field) == value}
+        else:
+            symbols = None
+        if symbols is None:
+            raise ValueError(f"Predicate field {field} is not available, should be one of {LOCATION_FIELDS}, or {GROUP_FIELD} with a device-group mapping")
+        return self.backend.fst_from_symbols(symbols & self.alphabet)
     
     def visit_p_neg_symbols(self, expr: PNegSymbols) -> FSA:
         """Constructs an FST for a Prop negated symbol set expression."""
         if self.alphabet is None:
             raise Exception('alphabet is not set')
-        return fst_from_neg_symbols(set(expr.neg_symbols), self.alphabet)
+        return self.backend.fst_from_neg_symbols({self._symbol(symbol) for symbol in expr.neg_symbols}, self.alphabet)
+
+    def _fst_from_wildcard(self, names) -> FSA:
+        # [^names] over all symbols but the foreign ones
+        return self.backend.fst_from_wildcard({self._symbol(symbol) for symbol in names} | self._foreign)
 
     def visit_p_concat(self, expr: PConcat) -> FSA:
         """Constructs an FST for a Prop concatenation expression."""
-        return fst_concat(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_concat(*[self.construct(sub_expr) for sub_expr in expr.args])
 
     def visit_p_union(self, expr: PUnion) -> FSA:
         """Constructs an FST for a Prop union expression."""
-        return fst_union(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_union(*[self.construct(sub_expr) for sub_expr in expr.args])
 
     def visit_p_star(self, expr: PStar) -> FSA:
         """Constructs an FST for a Prop star expression."""
-        return fst_star(expr.arg.accept(self))
+        return self.backend.fst_star(self.construct(expr.arg))
 
     def visit_p_intersect(self, expr: PIntersect) -> FSA:
         """Constructs an FST for a Prop intersection expression."""
-        return fst_intersect(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_intersect(*[self.construct(sub_expr) for sub_expr in expr.args])
 
     def visit_p_complement(self, expr: PComplement) -> FSA:
         """Constructs an FST for a Prop complement expression."""
         if self.alphabet is None:
             raise Exception('alphabet is not set')
-        return fst_complement(expr.arg.accept(self), self.alphabet)
+        return self.backend.fst_complement(self.construct(expr.arg), self.alphabet)
+
+    def _fst_complement(self, t: FSA, bounded: FSA) -> FSA:
+        # [^foreign]* minus t, read as in fst_complement: a string only
+        # leaves the alphabet along a prefix of t. The prefixes are those of t
+        # bounded to the alphabet, as fst_complement would see them.
+        b = self.backend
+        return b.fst_minus(b.fst_concat(b.fst_prefixes(bounded), b.fst_star(b.fst_from_wildcard(set(self._foreign)))), t)
+
+    def _fst_universe(self) -> FSA:
+        # the strings over the alphabet and the foreign symbols
+        return self.backend.fst_star(self.backend.fst_from_symbols(set(self.alphabet) | self._foreign))
     
     def _fst_from_fec(self, fec: FEC, is_pre_state: bool) -> FSA:
         state = fec.get_before_state() if is_pre_state else fec.get_after_state()
         if isinstance(fec, PathFEC):
-            return fst_from_path_set(state)
+            build, state_hash = self.backend.fst_from_path_set, path_set_hash
         elif isinstance(fec, GraphFEC):
-            return fst_from_forwarding_graph(state)
+            build, state_hash = self.backend.fst_from_forwarding_graph, graph_hash
         else:
             raise Exception('Unsupported FEC type')
+        if self.cache is None:
+            return build(state)
+
+        # identical network states share one minimized automaton
+        symbols = fec.get_symbol_table()
+        key = (self.backend.name, state_hash(state))
+        t = self.cache.get(key, symbols)
+        if t is None:
+            t = self.backend.fst_minimize(build(state))
+            self.cache.put(key, t, symbols)
+        return t
 
     def visit_p_network_state_before(self, expr: PNetworkStateBefore) -> FSA:
         """Constructs an FST for a Prop preState expression."""
-        if self.fec is None:
-            raise Exception('fec is not set')
-        return self._fst_from_fec(self.fec, is_pre_state=True)
+        return self._fst_from_state(is_pre_state=True)
 
     def visit_p_network_state_after(self, expr: PNetworkStateAfter) -> FSA:
         """Constructs an FST for a Prop postState expression."""
+        return self._fst_from_state(is_pre_state=False)
+
+    def _fst_from_state(self, is_pre_state: bool) -> FSA:
         if self.fec is None:
             raise Exception('fec is not set')
-        return self._fst_from_fec(self.fec, is_pre_state=False)
+        # the atomic specs of a plan share the state automata of the FEC
+        return self._memoize(self.fec, ('state', is_pre_state), lambda: self._fst_from_fec(self.fec, is_pre_state))
 
     def visit_p_empty_set(self, expr: PEmptySet) -> FSA:
         """Constructs an FST for a Prop empty set expression."""
-        return fst_zero()
+        return self.backend.fst_zero()
 
     def visit_p_epsilon(self, expr: PEpsilon) -> FSA:
         """Constructs an FST for a Prop epsilon expression."""
-        return fst_one()
+        return self.backend.fst_one()
 
     def visit_p_image(self, expr: PImage) -> FSA:
         """Constructs an FST for a Prop image expression."""
-        return fst_image(expr.prop.accept(self), expr.rel.accept(self))
+        if self.backend.lazy:
+            return self.backend.fst_lazy_image(self.construct(expr.prop), self.construct(expr.rel, lazy=True))
+        return self.backend.fst_image(self.construct(expr.prop), self.construct(expr.rel))
 
     def visit_p_reverse_image(self, expr: PReverseImage) -> FSA:
         """Constructs an FST for a Prop reverse image expression."""
-        return fst_reverse_image(expr.prop.accept(self), expr.rel.accept(self))
+        if self.backend.lazy:
+            return self.backend.fst_lazy_image(self.construct(expr.prop), self.construct(expr.rel, inverse=True, lazy=True))
+        return self.backend.fst_image(self.construct(expr.prop), self.construct(expr.rel, inverse=True))
 
     def visit_r_empty_set(self, expr: REmptySet) -> FST:
         """Constructs an FST for a Rel empty set expression."""
-        return fst_zero()
+        return self.backend.fst_zero()
 
     def visit_r_epsilon(self, expr: REpsilon) -> FST:
         """Constructs an FST for a Rel epsilon expression."""
-        return fst_one()
+        return self.backend.fst_one()
 
     def visit_r_identity(self, expr: RIdentity) -> FST:
         """Constructs an FST for a Rel identity expression."""
-        return expr.arg.accept(self)
+        return self.construct(expr.arg)
 
     def visit_r_product(self, expr: RProduct) -> FST:
         """Constructs an FST for a Rel product expression."""
-        return fst_from_fsa_product(expr.p.accept(self), expr.q.accept(self))
+        return self.backend.fst_from_fsa_product(self.construct(expr.p), self.construct(expr.q))
 
     def visit_r_concat(self, expr: RConcat) -> FST:
         """Constructs an FST for a Rel concatenation expression."""
-        return fst_concat(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_concat(*[self.construct(sub_expr) for sub_expr in expr.args])
 
     def visit_r_union(self, expr: RUnion) -> FST:
         """Constructs an FST for a Rel union expression."""
-        return fst_union(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_union(*[self.construct(sub_expr) for sub_expr in expr.args])
 
     def visit_r_star(self, expr: RStar) -> FST:
         """Constructs an FST for a Rel star expression."""
-        return fst_star(expr.arg.accept(self))
+        return self.backend.fst_star(self.construct(expr.arg))
     
     def visit_r_compose(self, expr: RUnion) -> FST:
         """Constructs an FST for a Rel union expression."""
-        return fst_compose(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_compose(*[self.construct(sub_expr) for sub_expr in expr.args])
     
     def visit_r_priority_union(self, expr: RPriorityUnion) -> FST:
         """Constructs an FST for a Rel priority union expression."""
-        return fst_priority_union(*[sub_expr.accept(self) for sub_expr in expr.args])
+        return self.backend.fst_priority_union(*[self.construct(sub_expr) for sub_expr in expr.args])
+
+
+# the implementation of each instruction of a plan, given the constructor, the
+# automata in the argument registers and the parameters of the instruction
+_OPERATIONS: Dict[str, Callable[[FSTConstructor, List[Any], Tuple], FST]] = {
+    'symbol': lambda c, args, params: c.backend.fst_from_symbol(c._symbol(params[0])),
+    'predicate': lambda c, args, params: c._fst_from_predicate(*params),
+    'neg_symbols': lambda c, args, params: c._fst_from_wildcard(params),
+    'zero': lambda c, args, params: c.backend.fst_zero(),
+    'one': lambda c, args, params: c.backend.fst_one(),
+    'pre_state': lambda c, args, params: c._fst_from_state(is_pre_state=True),
+    'post_state': lambda c, args, params: c._fst_from_state(is_pre_state=False),
+    'concat': lambda c, args, params: c.backend.fst_concat(*args),
+    'union': lambda c, args, params: c.backend.fst_union(*args),
+    'star': lambda c, args, params: c.backend.fst_star(*args),
+    'intersect': lambda c, args, params: c.backend.fst_intersect(*args),
+    'complement': lambda c, args, params: c._fst_complement(*args),
+    'universe': lambda c, args, params: c._fst_universe(),
+    'product': lambda c, args, params: c.backend.fst_from_fsa_product(*args),
+    'compose': lambda c, args, params: c.backend.fst_compose(*args),
+    'priority_union': lambda c, args, params: c.backend.fst_priority_union(*args),
+    'invert': lambda c, args, params: c.backend.fst_invert(*args),
+    'lazy_product': lambda c, args, params: c.backend.fst_lazy_product(*args),
+    'lazy_concat': lambda c, args, params: c.backend.fst_lazy_concat(*args),
+    'lazy_union': lambda c, args, params: c.backend.fst_lazy_union(*args),
+    # relations are always lowered lazily, and the fst_lazy_* operations of
+    # eager backends build ordinary automata
+    'image': lambda c, args, params: c.backend.fst_lazy_image(*args),
+}
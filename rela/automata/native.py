@@ -0,0 +1,1162 @@
+from __future__ import annotations
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+from collections import deque
+
+from ..networkmodel.forwardinggraph import ForwardingGraph
+from ..networkmodel.networkpath import NetworkPath
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements a native automata engine in pure Python.
+It mirrors the fst_* operations in utils.py, but works on a compact
+integer-state representation instead of round-tripping through HFST objects.
+"""
+
+# marker for empty input/output labels
+EPSILON = None
+
+Symbol = Hashable
+Label = Tuple[Symbol, Symbol]
+
+
+class Wildcard(NamedTuple):
+    """
+    A label that matches any symbol except the excluded ones, so that
+    wildcards and complements do not depend on the alphabet. An arc with
+    wildcards on both sides maps each matched symbol to itself; a wildcard on
+    one side only matches independently of the other side.
+    """
+    excluded: frozenset = frozenset()
+
+    def matches(self, symbol: Symbol) -> bool:
+        return symbol not in self.excluded
+
+    def meet(self, other: Wildcard) -> Wildcard:
+        return Wildcard(self.excluded | other.excluded)
+
+    def __str__(self) -> str:
+        return '?'
+
+def _is_identity_wildcard(i: Symbol, o: Symbol) -> bool:
+    return isinstance(i, Wildcard) and isinstance(o, Wildcard)
+
+
+class NativeFST:
+    """
+    A finite-state transducer with integer states. State 0 is the initial
+    state. Each state owns a list of arcs (input, output, target). An acceptor
+    (FSA) is a transducer whose arcs all carry identical input and output
+    symbols.
+    """
+    __slots__ = ('arcs', 'finals')
+
+    def __init__(self, n_states: int = 1):
+        self.arcs: List[List[Tuple[Symbol, Symbol, int]]] = [[] for _ in range(n_states)]
+        self.finals: Set[int] = set()
+
+    def add_state(self) -> int:
+        self.arcs.append([])
+        return len(self.arcs) - 1
+
+    def add_transition(self, src: int, dst: int, isymbol: Symbol, osymbol: Symbol):
+        self.arcs[src].append((isymbol, osymbol, dst))
+
+    def set_final(self, state: int):
+        self.finals.add(state)
+
+    def is_final(self, state: int) -> bool:
+        return state in self.finals
+
+    def number_of_states(self) -> int:
+        return len(self.arcs)
+
+    def number_of_arcs(self) -> int:
+        return sum(len(arcs) for arcs in self.arcs)
+
+    def copy(self) -> NativeFST:
+        t = NativeFST(0)
+        t.arcs = [list(arcs) for arcs in self.arcs]
+        t.finals = set(self.finals)
+        return t
+
+    def accepts(self, symbols: Iterable[Symbol]) -> bool:
+        """
+        Check whether the input side of the transducer accepts the given
+        sequence of symbols.
+        """
+        current = _closure(self, {0})
+        for symbol in symbols:
+            current = _closure(self, {dst for s in current for i, _, dst in self.arcs[s] if i == symbol or isinstance(i, Wildcard) and i.matches(symbol)})
+            if not current:
+                return False
+        return not current.isdisjoint(self.finals)
+
+
+def _append(t: NativeFST, other: NativeFST) -> int:
+    """
+    Copy all states and arcs of other into t, and return the offset of the
+    copied states. Final states are not copied. The modification is in-place.
+    """
+    offset = len(t.arcs)
+    t.arcs.extend([[(i, o, dst + offset) for i, o, dst in arcs] for arcs in other.arcs])
+    return offset
+
+def _closure(t: NativeFST, states: Set[int]) -> Set[int]:
+    """
+    Compute the epsilon closure of a set of states.
+    """
+    res = set(states)
+    stack = list(states)
+    while stack:
+        s = stack.pop()
+        for i, o, dst in t.arcs[s]:
+            if i is EPSILON and o is EPSILON and dst not in res:
+                res.add(dst)
+                stack.append(dst)
+    return res
+
+def _has_epsilons(t: NativeFST) -> bool:
+    return any(i is EPSILON and o is EPSILON for arcs in t.arcs for i, o, _ in arcs)
+
+def _remove_epsilons(t: NativeFST) -> NativeFST:
+    """
+    Remove epsilon:epsilon arcs. Only states reachable from the initial state
+    are kept.
+    """
+    if not _has_epsilons(t):
+        return t
+    res = NativeFST(1)
+    states = {0: 0}
+    queue = [0]
+    while queue:
+        s = queue.pop()
+        closure = _closure(t, {s})
+        if not closure.isdisjoint(t.finals):
+            res.set_final(states[s])
+        arcs = set()
+        for c in closure:
+            for i, o, dst in t.arcs[c]:
+                if i is EPSILON and o is EPSILON:
+                    continue
+                if dst not in states:
+                    states[dst] = res.add_state()
+                    queue.append(dst)
+                arcs.add((i, o, states[dst]))
+        res.arcs[states[s]] = list(arcs)
+    return res
+
+def _determinize(t: NativeFST) -> NativeFST:
+    """
+    Determinize the transducer as an acceptor over (input, output) labels with
+    the subset construction. Wildcard identity arcs are split, see _moves.
+    """
+    start = frozenset(_closure(t, {0}))
+    res = NativeFST(1)
+    states = {start: 0}
+    queue = [start]
+    while queue:
+        subset = queue.pop()
+        s = states[subset]
+        if not subset.isdisjoint(t.finals):
+            res.set_final(s)
+        for (i, o), target in _moves(t, subset).items():
+            if target not in states:
+                states[target] = res.add_state()
+                queue.append(target)
+            res.add_transition(s, states[target], i, o)
+    return res
+
+def _trim(t: NativeFST) -> NativeFST:
+    """
+    Remove states that are not reachable from the initial state or cannot
+    reach a final state. The initial state is always kept.
+    """
+    reverse: List[List[int]] = [[] for _ in t.arcs]
+    for s, arcs in enumerate(t.arcs):
+        for _, _, dst in arcs:
+            reverse[dst].append(s)
+    useful = set(t.finals)
+    stack = list(t.finals)
+    while stack:
+        s = stack.pop()
+        for src in reverse[s]:
+            if src not in useful:
+                useful.add(src)
+                stack.append(src)
+
+    res = NativeFST(1)
+    states = {0: 0}
+    queue = [0]
+    while queue:
+        s = queue.pop()
+        if s in t.finals:
+            res.set_final(states[s])
+        for i, o, dst in t.arcs[s]:
+            if dst not in useful:
+                continue
+            if dst not in states:
+                states[dst] = res.add_state()
+                queue.append(dst)
+            res.add_transition(states[s], states[dst], i, o)
+    return res
+
+def _has_wildcards(t: NativeFST) -> bool:
+    return any(isinstance(i, Wildcard) or isinstance(o, Wildcard) for arcs in t.arcs for i, o, _ in arcs)
+
+def _is_empty(t: NativeFST) -> bool:
+    """
+    Check whether the transducer accepts nothing.
+    """
+    seen = {0}
+    stack = [0]
+    while stack:
+        s = stack.pop()
+        if s in t.finals:
+            return False
+        for _, _, dst in t.arcs[s]:
+            if dst not in seen:
+                seen.add(dst)
+                stack.append(dst)
+    return True
+
+def fst_zero() -> NativeFST:
+    """
+    Construct the zero FST/FSA.
+    Contains only the initial (non-accepting) state.
+    """
+    return NativeFST(1)
+
+def fst_one() -> NativeFST:
+    """
+    Construct the one FST/FSA.
+    Contains only the initial state, set to be accepting.
+    """
+    t = NativeFST(1)
+    t.set_final(0)
+    return t
+
+def fst_from_symbol(symbol: Symbol) -> NativeFST:
+    """
+    Construct the FST/FSA that recognizes a single-symbol string.
+    """
+    if not isinstance(symbol, (str, int)) or symbol == '':
+        raise Exception(f'invalid symbol: {symbol}')
+    t = NativeFST(2)
+    t.add_transition(0, 1, symbol, symbol)
+    t.set_final(1)
+    return t
+
+def fst_from_symbols(symbols: Set[Symbol]) -> NativeFST:
+    """
+    Construct the FST/FSA that recognizes a set of symbols.
+    """
+    if not isinstance(symbols, set):
+        raise Exception('symbols must be a set')
+    t = NativeFST(2)
+    t.set_final(1)
+    t.arcs[0] = [(symbol, symbol, 1) for symbol in symbols]
+    return t
+
+def fst_from_wildcard(symbols: Set[Symbol]) -> NativeFST:
+    """
+    Construct the FST/FSA that recognizes any single symbol except the given
+    ones. Contains a single wildcard arc, whatever the alphabet.
+    """
+    if not isinstance(symbols, set):
+        raise Exception('symbols must be a set')
+    w = Wildcard(frozenset(symbols))
+    t = NativeFST(2)
+    t.add_transition(0, 1, w, w)
+    t.set_final(1)
+    return t
+
+def fst_from_neg_symbols(symbols: Set[Symbol], alphabet: Set[Symbol]) -> NativeFST:
+    """
+    Construct the FST/FSA that recognizes negtive symbol groups such as [^ab].
+    """
+    if not isinstance(symbols, set):
+        raise Exception('symbols must be a set')
+    if not isinstance(alphabet, set):
+        raise Exception('alphabet must be a set')
+    return fst_from_symbols(alphabet - symbols)
+
+def fst_concat(*args: NativeFST) -> NativeFST:
+    """
+    Implements the FST/FSA concatenation operation.
+    """
+    if len(args) == 0:
+        return fst_zero()
+    t = args[0].copy()
+    for arg in args[1:]:
+        finals = t.finals
+        offset = _append(t, arg)
+        for f in finals:
+            t.add_transition(f, offset, EPSILON, EPSILON)
+        t.finals = {f + offset for f in arg.finals}
+    return t
+
+def fst_union(*args: NativeFST) -> NativeFST:
+    """
+    Implements the FST/FSA union operation.
+    """
+    if len(args) == 0:
+        return fst_zero()
+    t = NativeFST(1)
+    for arg in args:
+        offset = _append(t, arg)
+        t.add_transition(0, offset, EPSILON, EPSILON)
+        t.finals.update(f + offset for f in arg.finals)
+    return t
+
+def fst_star(t: NativeFST) -> NativeFST:
+    """
+    Implements the FST/FSA Kleene star operation.
+    """
+    res = NativeFST(1)
+    offset = _append(res, t)
+    res.add_transition(0, offset, EPSILON, EPSILON)
+    for f in t.finals:
+        res.add_transition(f + offset, 0, EPSILON, EPSILON)
+    res.set_final(0)
+    return res
+
+def fst_intersect(*args: NativeFST) -> NativeFST:
+    """
+    Implements the FST/FSA intersection operation. Only reachable state
+    pairs are constructed. Wildcard arcs are matched against the symbols of
+    the other side as they are met, so they are never expanded.
+    """
+    if len(args) == 0:
+        return fst_zero()
+    t = args[0]
+    for arg in args[1:]:
+        l = _remove_epsilons(t)
+        r = _remove_epsilons(arg)
+        t = NativeFST(1)
+        states = {(0, 0): 0}
+        queue = [(0, 0)]
+
+        def target(d1, d2):
+            if (d1, d2) not in states:
+                states[(d1, d2)] = t.add_state()
+                queue.append((d1, d2))
+            return states[(d1, d2)]
+
+        while queue:
+            s1, s2 = queue.pop()
+            s = states[(s1, s2)]
+            if s1 in l.finals and s2 in r.finals:
+                t.set_final(s)
+            r_arcs: Dict[Label, List[int]] = {}
+            r_wild: List[Tuple[Wildcard, int]] = []
+            for i, o, dst in r.arcs[s2]:
+                if _is_identity_wildcard(i, o):
+                    r_wild.append((i, dst))
+                else:
+                    r_arcs.setdefault((i, o), []).append(dst)
+            for i, o, d1 in l.arcs[s1]:
+                if _is_identity_wildcard(i, o):
+                    for (x, y), dsts in r_arcs.items():
+                        if x == y and i.matches(x):
+                            for d2 in dsts:
+                                t.add_transition(s, target(d1, d2), x, x)
+                    for w, d2 in r_wild:
+                        w = i.meet(w)
+                        t.add_transition(s, target(d1, d2), w, w)
+                    continue
+                for d2 in r_arcs.get((i, o), ()):
+                    t.add_transition(s, target(d1, d2), i, o)
+                if i == o:
+                    for w, d2 in r_wild:
+                        if w.matches(i):
+                            t.add_transition(s, target(d1, d2), i, o)
+    return t if len(args) > 1 else t.copy()
+
+def _complement(t: NativeFST) -> NativeFST:
+    """
+    Complement the FST/FSA with respect to all strings. Missing transitions
+    are completed by one wildcard arc per state, so the result does not
+    depend on the alphabet.
+    """
+    # determination is necessary for complement algorithm
+    t = _determinize(t)
+
+    # complete the automaton by adding all missing transitions to a sink state
+    sink = t.add_state()
+    for arcs in t.arcs:
+        exist_symbols = {i for i, _, _ in arcs}
+        w = next((i for i in exist_symbols if isinstance(i, Wildcard)), None)
+        if w is None:
+            w = Wildcard(frozenset(exist_symbols))
+            arcs.append((w, w, sink))
+        else:
+            arcs.extend((symbol, symbol, sink) for symbol in w.excluded if symbol not in exist_symbols)
+
+    # revert final states and non-final states
+    t.finals = set(range(t.number_of_states())) - t.finals
+    return t
+
+def fst_complement(t: NativeFST, alphabet: Set[Symbol]) -> NativeFST:
+    """
+    Implements the FST/FSA complement operation. As with HFST, the minimal
+    DFA of the FST/FSA is completed over the alphabet, so symbols outside the
+    alphabet are only read along the prefixes of its strings.
+    """
+    if not isinstance(alphabet, set):
+        raise Exception('alphabet must be a set')
+    return fst_minus(fst_concat(fst_prefixes(t), fst_star(fst_from_symbols(alphabet))), t)
+
+def fst_prefixes(t: NativeFST) -> NativeFST:
+    """
+    Construct the FSA of the prefixes of the strings of the given FSA, and of
+    the empty string. Every state that reaches a final state becomes final.
+    """
+    t = t.copy()
+    reverse: List[List[int]] = [[] for _ in t.arcs]
+    for s, arcs in enumerate(t.arcs):
+        for _, _, dst in arcs:
+            reverse[dst].append(s)
+    stack = list(t.finals)
+    while stack:
+        for src in reverse[stack.pop()]:
+            if src not in t.finals:
+                t.set_final(src)
+                stack.append(src)
+    t.set_final(0)
+    return t
+
+def fst_priority_union(*args: NativeFST) -> NativeFST:
+    """
+    Implements the FST/FSA priority union operation. An input accepted by an
+    earlier argument is never mapped by a later one.
+    """
+    if len(args) == 0:
+        return fst_zero()
+    t = args[0]
+    for arg in args[1:]:
+        domain = fst_input_project(t)
+        t = fst_union(t, fst_compose(_complement(domain), arg))
+    return t if len(args) > 1 else t.copy()
+
+def fst_compose(*args: NativeFST) -> NativeFST:
+    """
+    Implements the FST/FSA composition operation. Only reachable state pairs
+    are constructed. Wildcards on the shared tape are matched against the
+    symbols of the other side as they are met, so they are never expanded.
+    """
+    if len(args) == 0:
+        return fst_zero()
+    t = args[0]
+    for arg in args[1:]:
+        l = _remove_epsilons(t)
+        r = _remove_epsilons(arg)
+        t = NativeFST(1)
+        states = {(0, 0): 0}
+        queue = [(0, 0)]
+
+        def target(d1, d2):
+            if (d1, d2) not in states:
+                states[(d1, d2)] = t.add_state()
+                queue.append((d1, d2))
+            return states[(d1, d2)]
+
+        def add(s, dst, i, o):
+            if _is_identity_wildcard(i, o) and i is not o:
+                # independent wildcards on both sides are split into two arcs,
+                # as arcs with wildcards on both sides are identities
+                mid = t.add_state()
+                t.add_transition(s, mid, i, EPSILON)
+                t.add_transition(mid, dst, EPSILON, o)
+            else:
+                t.add_transition(s, dst, i, o)
+
+        while queue:
+            s1, s2 = queue.pop()
+            s = states[(s1, s2)]
+            if s1 in l.finals and s2 in r.finals:
+                t.set_final(s)
+            r_arcs: Dict[Symbol, List[Tuple[Symbol, int]]] = {}
+            r_wild: List[Tuple[Wildcard, Symbol, int]] = []
+            for i, o, d2 in r.arcs[s2]:
+                if i is EPSILON:
+                    # only the right side moves forward
+                    t.add_transition(s, target(s1, d2), EPSILON, o)
+                elif isinstance(i, Wildcard):
+                    r_wild.append((i, o, d2))
+                else:
+                    r_arcs.setdefault(i, []).append((o, d2))
+            for i, m, d1 in l.arcs[s1]:
+                if m is EPSILON:
+                    # only the left side moves forward
+                    t.add_transition(s, target(d1, s2), i, EPSILON)
+                    continue
+                if isinstance(m, Wildcard):
+                    # an identity arc on the left passes the matched symbol on
+                    tied = isinstance(i, Wildcard)
+                    for x, outs in r_arcs.items():
+                        if m.matches(x):
+                            for o, d2 in outs:
+                                add(s, target(d1, d2), x if tied else i, o)
+                    for w, o, d2 in r_wild:
+                        w = m.meet(w)
+                        add(s, target(d1, d2), w if tied else i, w if isinstance(o, Wildcard) else o)
+                    continue
+                for o, d2 in r_arcs.get(m, ()):
+                    add(s, target(d1, d2), i, o)
+                for w, o, d2 in r_wild:
+                    if w.matches(m):
+                        add(s, target(d1, d2), i, m if isinstance(o, Wildcard) else o)
+    return t if len(args) > 1 else t.copy()
+
+def fst_from_path_set(paths: List[NetworkPath]) -> NativeFST:
+    """
+    Construct the FST/FSA from the network state.
+    Equivalent to the union of all paths.
+
+    The paths are streamed into a prefix tree whose edges are hops (a set of
+    alternative nodes), so the construction is linear in the total length of
+    the paths.
+    """
+    t = NativeFST(1)
+    if paths is None or len(paths) == 0:
+        return t
+    children = {}
+    for path in paths:
+        s = 0
+        for hop in path:
+            if isinstance(hop, (str, int)):
+                hop = (hop,)
+            elif isinstance(hop, list):
+                hop = tuple(sorted(set(hop), key=str))
+            else:
+                raise Exception(f'invalid hop: {hop}')
+            child = children.get((s, hop))
+            if child is None:
+                child = t.add_state()
+                children[(s, hop)] = child
+                t.arcs[s].extend((node, node, child) for node in hop)
+            s = child
+        t.set_final(s)
+    return t
+
+def fst_from_acyclic_forwarding_graph(graph: ForwardingGraph) -> Optional[NativeFST]:
+    """
+    Construct the minimal DFA of an acyclic forwarding graph directly.
+    The nodes reachable from the sources are sorted topologically, and then
+    visited in reverse order: each node is registered by its signature
+    (whether it is a sink, and its out edges to registered classes), so nodes
+    with the same signature share one state, as in Daciuk's register-based
+    minimization. Nodes that cannot reach a sink are dropped.
+    Returns None if the graph has a cycle or a node has two out edges with
+    the same label, in which case the general construction must be used.
+    """
+    # depth-first search from the sources; post-order is reverse topological
+    out: Dict[Symbol, List[Tuple[Symbol, Symbol]]] = {}
+    order = []
+    on_stack = set()
+    sources = [node for node in graph.get_nodes() if graph.is_source(node)]
+    for source in sources:
+        if source in out:
+            continue
+        stack = []
+        next_node = source
+        while True:
+            if next_node is not None:
+                edges = [(edge, n) for n, edge in graph.get_edges(next_node)]
+                if len({edge for edge, _ in edges}) != len(edges):
+                    return None
+                out[next_node] = edges
+                on_stack.add(next_node)
+                stack.append((next_node, iter(edges)))
+            if not stack:
+                break
+            node, successors = stack[-1]
+            next_node = None
+            for _, n in successors:
+                if n in on_stack:
+                    return None
+                if n not in out:
+                    next_node = n
+                    break
+            if next_node is None:
+                stack.pop()
+                on_stack.discard(node)
+                order.append(node)
+
+    # register equivalent nodes bottom-up; a class is (is final, arcs)
+    register: Dict[Tuple[bool, frozenset], int] = {}
+    classes: Dict[Symbol, int] = {}
+    for node in order:
+        arcs = frozenset((edge, classes[next_node]) for edge, next_node in out[node] if classes.get(next_node) is not None)
+        final = graph.is_sink(node)
+        if final or arcs:
+            classes[node] = register.setdefault((final, arcs), len(register))
+        else:
+            classes[node] = None
+    arcs = frozenset((source, classes[source]) for source in sources if classes[source] is not None)
+    initial = register.setdefault((False, arcs), len(register))
+
+    # number the classes so that the initial state is 0
+    states = {initial: 0}
+    for c in range(len(register)):
+        if c != initial:
+            states[c] = len(states)
+    t = NativeFST(len(register))
+    for (final, arcs), c in register.items():
+        if final:
+            t.set_final(states[c])
+        t.arcs[states[c]] = [(edge, edge, states[dst]) for edge, dst in arcs]
+    return t
+
+def fst_from_forwarding_graph(graph: ForwardingGraph) -> NativeFST:
+    """
+    Construct the FST/FSA from the forwarding graph. Acyclic graphs are built
+    as minimal DFAs, see fst_from_acyclic_forwarding_graph.
+    """
+    t = fst_from_acyclic_forwarding_graph(graph)
+    if t is not None:
+        return t
+
+    t = NativeFST(1)
+    states = {}
+
+    # add states
+    for node in graph.get_nodes():
+        states[node] = t.add_state()
+        # set sink nodes as final states
+        if graph.is_sink(node):
+            t.set_final(states[node])
+
+    # add transitions
+    for node, s in states.items():
+        t.arcs[s].extend((edge, edge, states[next_node]) for next_node, edge in graph.get_edges(node))
+
+        # point the initial state to the source nodes
+        if graph.is_source(node):
+            t.add_transition(0, s, node, node)
+
+    return t
+
+def fst_from_fsa_product(l: NativeFST, r: NativeFST) -> NativeFST:
+    """
+    Construct the FST that accepts all string pairs (x, y) where x is accepted
+    by the left FSA and y is accepted by the right FSA. Only state pairs
+    reachable from (0, 0) that can reach a final pair are constructed.
+    """
+    l = _trim(_remove_epsilons(l))
+    r = _trim(_remove_epsilons(r))
+    t = NativeFST(1)
+    states = {(0, 0): 0}
+    queue = [(0, 0)]
+
+    def target(d1, d2):
+        if (d1, d2) not in states:
+            states[(d1, d2)] = t.add_state()
+            queue.append((d1, d2))
+        return states[(d1, d2)]
+
+    while queue:
+        s1, s2 = queue.pop()
+        s = states[(s1, s2)]
+        if s1 in l.finals and s2 in r.finals:
+            t.set_final(s)
+        arcs = t.arcs[s]
+        # 0. only FSA1 moves forward
+        for a, _, d1 in l.arcs[s1]:
+            arcs.append((a, EPSILON, target(d1, s2)))
+        # 1. only FSA2 moves forward
+        for b, _, d2 in r.arcs[s2]:
+            arcs.append((EPSILON, b, target(s1, d2)))
+        # 2. both FSAs move forward; two wildcards are left to the moves
+        # above, as an arc with wildcards on both sides is an identity
+        for a, _, d1 in l.arcs[s1]:
+            for b, _, d2 in r.arcs[s2]:
+                if not _is_identity_wildcard(a, b):
+                    arcs.append((a, b, target(d1, d2)))
+    return t
+
+def fst_image(p: NativeFST, r: NativeFST) -> NativeFST:
+    """
+    Construct the FSA that represents the image of the given FSA under the
+    given relation.
+    """
+    return fst_output_project(fst_compose(p, r))
+
+class LazyFST:
+    """
+    A transducer whose states and arcs are built on demand, so that an image
+    only expands the parts of a relation that the input can reach. States are
+    arbitrary hashable values, and the arcs of each state are built once.
+    """
+    def __init__(self, initial: Hashable):
+        self.initial = initial
+        self._arcs: Dict[Hashable, List[Tuple[Symbol, Symbol, Hashable]]] = {}
+
+    @staticmethod
+    def of(t) -> LazyFST:
+        return t if isinstance(t, LazyFST) else _LazyView(t)
+
+    def arcs(self, state: Hashable) -> List[Tuple[Symbol, Symbol, Hashable]]:
+        res = self._arcs.get(state)
+        if res is None:
+            res = self._arcs[state] = self._expand(state)
+        return res
+
+    def _expand(self, state: Hashable) -> List[Tuple[Symbol, Symbol, Hashable]]:
+        raise NotImplementedError
+
+    def is_final(self, state: Hashable) -> bool:
+        raise NotImplementedError
+
+class _LazyView(LazyFST):
+    """
+    A materialized transducer seen as a lazy one.
+    """
+    def __init__(self, t: NativeFST):
+        super().__init__(0)
+        self.t = t
+
+    def arcs(self, state: int) -> List[Tuple[Symbol, Symbol, int]]:
+        return self.t.arcs[state]
+
+    def is_final(self, state: int) -> bool:
+        return state in self.t.finals
+
+class _LazyProduct(LazyFST):
+    """
+    The product of two FSAs, which reads a string of the left FSA and then
+    writes a string of the right FSA. It relates the same string pairs as
+    fst_from_fsa_product with states of the two FSAs instead of their pairs.
+    """
+    def __init__(self, l: NativeFST, r: NativeFST):
+        super().__init__((0, 0))
+        self.sides = (l, r)
+
+    def _expand(self, state):
+        side, s = state
+        t = self.sides[side]
+        if side == 0:
+            res = [(i, EPSILON, (0, dst)) for i, _, dst in t.arcs[s]]
+            if s in t.finals:
+                res.append((EPSILON, EPSILON, (1, 0)))
+            return res
+        return [(EPSILON, o, (1, dst)) for _, o, dst in t.arcs[s]]
+
+    def is_final(self, state) -> bool:
+        side, s = state
+        return side == 1 and s in self.sides[1].finals
+
+class _LazyConcat(LazyFST):
+    """
+    The concatenation of lazy transducers.
+    """
+    def __init__(self, args: List[LazyFST]):
+        super().__init__((0, args[0].initial))
+        self.args = args
+
+    def _expand(self, state):
+        k, s = state
+        arg = self.args[k]
+        res = [(i, o, (k, dst)) for i, o, dst in arg.arcs(s)]
+        if k + 1 < len(self.args) and arg.is_final(s):
+            res.append((EPSILON, EPSILON, (k + 1, self.args[k + 1].initial)))
+        return res
+
+    def is_final(self, state) -> bool:
+        k, s = state
+        return k + 1 == len(self.args) and self.args[k].is_final(s)
+
+class _LazyUnion(LazyFST):
+    """
+    The union of lazy transducers.
+    """
+    def __init__(self, args: List[LazyFST]):
+        super().__init__(None)
+        self.args = args
+
+    def _expand(self, state):
+        if state is None:
+            return [(EPSILON, EPSILON, (k, arg.initial)) for k, arg in enumerate(self.args)]
+        k, s = state
+        return [(i, o, (k, dst)) for i, o, dst in self.args[k].arcs(s)]
+
+    def is_final(self, state) -> bool:
+        return state is not None and self.args[state[0]].is_final(state[1])
+
+def fst_lazy_product(l: NativeFST, r: NativeFST) -> LazyFST:
+    """
+    Construct a lazy FST that accepts all string pairs (x, y) where x is
+    accepted by the left FSA and y is accepted by the right FSA.
+    """
+    return _LazyProduct(l, r)
+
+def fst_lazy_concat(*args) -> LazyFST:
+    """
+    Implements the concatenation of lazy (or materialized) FSTs.
+    """
+    if len(args) == 0:
+        return LazyFST.of(fst_one())
+    return _LazyConcat([LazyFST.of(arg) for arg in args])
+
+def fst_lazy_union(*args) -> LazyFST:
+    """
+    Implements the union of lazy (or materialized) FSTs.
+    """
+    if len(args) == 0:
+        return LazyFST.of(fst_zero())
+    return _LazyUnion([LazyFST.of(arg) for arg in args])
+
+def _meet(a: Symbol, b: Symbol) -> Optional[Symbol]:
+    """
+    Get the label matched by both given labels, or None if there is none.
+    """
+    if isinstance(a, Wildcard):
+        if isinstance(b, Wildcard):
+            return a.meet(b)
+        return b if a.matches(b) else None
+    if isinstance(b, Wildcard):
+        return a if b.matches(a) else None
+    return a if a == b else None
+
+def fst_lazy_image(p: NativeFST, r) -> NativeFST:
+    """
+    Construct the FSA that represents the image of the given FSA under the
+    given lazy (or materialized) relation. Only the state pairs reachable by
+    reading the FSA are built, so parts of the relation that the FSA cannot
+    reach are never expanded.
+    """
+    p = _remove_epsilons(p)
+    r = LazyFST.of(r)
+    t = NativeFST(1)
+    states = {(0, r.initial): 0}
+    queue = [(0, r.initial)]
+
+    def target(d1, d2):
+        if (d1, d2) not in states:
+            states[(d1, d2)] = t.add_state()
+            queue.append((d1, d2))
+        return states[(d1, d2)]
+
+    while queue:
+        s1, s2 = queue.pop()
+        s = states[(s1, s2)]
+        if s1 in p.finals and r.is_final(s2):
+            t.set_final(s)
+        for i, o, d2 in r.arcs(s2):
+            if i is EPSILON:
+                # only the relation moves forward
+                t.add_transition(s, target(s1, d2), o, o)
+                continue
+            for a, _, d1 in p.arcs[s1]:
+                x = _meet(a, i)
+                if x is not None:
+                    # an identity arc writes the symbol it reads
+                    out = x if _is_identity_wildcard(i, o) else o
+                    t.add_transition(s, target(d1, d2), out, out)
+    return _trim(t)
+
+def fst_reverse_image(p: NativeFST, r: NativeFST) -> NativeFST:
+    """
+    Construct the FSA that represents the reverse image of the given FSA under
+    the given relation.
+    """
+    return fst_image(p, fst_invert(r))
+
+def fst_minus(p: NativeFST, q: NativeFST) -> NativeFST:
+    """
+    Construct the FSA that represents the difference of the given FSAs (p - q).
+    """
+    return fst_intersect(p, _complement(q))
+
+def _interesting_symbols(t: NativeFST, subset: Iterable[int]) -> Set[Symbol]:
+    """
+    Collect the symbols on which the identity arcs of a subset of states
+    may disagree: the symbols of concrete identity arcs and the symbols
+    excluded by wildcards.
+    """
+    res = set()
+    for c in subset:
+        for i, o, _ in t.arcs[c]:
+            if _is_identity_wildcard(i, o):
+                res.update(i.excluded)
+            elif i == o and i is not EPSILON:
+                res.add(i)
+    return res
+
+def _moves(t: NativeFST, subset: frozenset, symbols: Set[Symbol] = None) -> Dict[Label, frozenset]:
+    """
+    Compute the successors of a subset of states for every label, i.e., one
+    step of the subset construction. Wildcard identity arcs overlap with the
+    concrete ones, so they are split: each interesting symbol (see
+    _interesting_symbols, plus the given symbols) gets its own label, and one
+    wildcard label excluding all of them covers the remaining symbols. Given
+    the same symbols, the labels of two automata line up.
+    """
+    moves: Dict[Label, Set[int]] = {}
+    wild: List[Tuple[Wildcard, int]] = []
+    for c in subset:
+        for i, o, dst in t.arcs[c]:
+            if i is EPSILON and o is EPSILON:
+                continue
+            if _is_identity_wildcard(i, o):
+                wild.append((i, dst))
+            else:
+                moves.setdefault((i, o), set()).add(dst)
+    if wild:
+        interesting = _interesting_symbols(t, subset) | (symbols or set())
+        for symbol in interesting:
+            dsts = {dst for w, dst in wild if w.matches(symbol)}
+            if dsts:
+                moves.setdefault((symbol, symbol), set()).update(dsts)
+        w = Wildcard(frozenset(interesting))
+        moves[(w, w)] = {dst for _, dst in wild}
+    return {label: frozenset(_closure(t, dsts)) for label, dsts in moves.items()}
+
+def _trace_to_witness(trace) -> List[Symbol]:
+    """
+    Unroll a trace of labels into a witness string (input side). Wildcards
+    are reported as '?'.
+    """
+    witness = []
+    while trace is not None:
+        (i, _), trace = trace
+        witness.append(str(i) if isinstance(i, Wildcard) else i)
+    witness.reverse()
+    return witness
+
+def fst_eq_witness(p: NativeFST, q: NativeFST) -> Optional[List[Symbol]]:
+    """
+    Check whether two FSTs are equivalent with the Hopcroft-Karp algorithm.
+    Both FSTs are determinized on the fly, and pairs of subsets already known
+    to be equivalent are merged with union-find, so only the reachable part
+    of the product is explored. The search is breadth-first and stops at the
+    first pair that disagrees on acceptance.
+    Returns None if the FSTs are equivalent, otherwise a shortest string
+    (input side) accepted by exactly one of them.
+    """
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    # with wildcards, both sides split their labels over the same symbols
+    wildcards = _has_wildcards(p) or _has_wildcards(q)
+    start = ((0, frozenset(_closure(p, {0}))), (1, frozenset(_closure(q, {0}))))
+    parent[start[0]] = start[1]
+    # each entry carries its trace as a linked list (label, previous trace)
+    queue = deque([(start, None)])
+    while queue:
+        ((_, x), (_, y)), trace = queue.popleft()
+        if x.isdisjoint(p.finals) != y.isdisjoint(q.finals):
+            return _trace_to_witness(trace)
+        symbols = _interesting_symbols(p, x) | _interesting_symbols(q, y) if wildcards else None
+        moves1 = _moves(p, x, symbols)
+        moves2 = _moves(q, y, symbols)
+        for label in moves1.keys() | moves2.keys():
+            pair = ((0, moves1.get(label, frozenset())), (1, moves2.get(label, frozenset())))
+            r1, r2 = find(pair[0]), find(pair[1])
+            if r1 != r2:
+                parent[r1] = r2
+                queue.append((pair, (label, trace)))
+    return None
+
+def fst_eq(p: NativeFST, q: NativeFST) -> bool:
+    """
+    Check whether two FSTs are equivalent, see fst_eq_witness.
+    """
+    return fst_eq_witness(p, q) is None
+
+def fst_subseteq_witness(p: NativeFST, q: NativeFST) -> Optional[List[Symbol]]:
+    """
+    Check whether the language of the first FST is a subset of the language of
+    the second FST with the antichain algorithm. The search pairs each state
+    of p with the subset of q states reachable on the same string, and
+    determinizes only q, on the fly. A pair is skipped if a pair with the same
+    p state and a smaller subset was already visited, since any string that
+    escapes q from the larger subset also escapes it from the smaller one.
+    The complement of q is never built, and the inputs are not modified.
+    Returns None if the inclusion holds, otherwise the first string (input
+    side) found in p but not in q.
+    """
+    # antichain of minimal q subsets visited for each state of p
+    antichain: Dict[int, List[frozenset]] = {}
+
+    def subsumed(s: int, subset: frozenset) -> bool:
+        visited = antichain.setdefault(s, [])
+        if any(other <= subset for other in visited):
+            return True
+        visited[:] = [other for other in visited if not subset <= other]
+        visited.append(subset)
+        return False
+
+    wildcards = _has_wildcards(p) or _has_wildcards(q)
+    start = frozenset(_closure(q, {0}))
+    queue = deque()
+    for s in _closure(p, {0}):
+        if not subsumed(s, start):
+            queue.append((s, start, None))
+    while queue:
+        s, subset, trace = queue.popleft()
+        if s in p.finals and subset.isdisjoint(q.finals):
+            return _trace_to_witness(trace)
+        if wildcards:
+            # split the labels of both sides over the same symbols
+            symbols = _interesting_symbols(p, [s]) | _interesting_symbols(q, subset)
+            moves = _moves(q, subset, symbols)
+            for label, targets in _moves(p, frozenset([s]), symbols).items():
+                target = moves.get(label, frozenset())
+                for c in targets:
+                    if not subsumed(c, target):
+                        queue.append((c, target, (label, trace)))
+            continue
+        moves = None
+        for i, o, dst in p.arcs[s]:
+            if i is EPSILON and o is EPSILON:
+                continue
+            if moves is None:
+                moves = _moves(q, subset)
+            target = moves.get((i, o), frozenset())
+            for c in _closure(p, {dst}):
+                if not subsumed(c, target):
+                    queue.append((c, target, ((i, o), trace)))
+    return None
+
+def fst_subseteq(p: NativeFST, q: NativeFST) -> bool:
+    """
+    Check whether the language of the first FST is a subset of the language of
+    the second FST, see fst_subseteq_witness.
+    """
+    return fst_subseteq_witness(p, q) is None
+
+def fst_lookup_optimize(t: NativeFST) -> NativeFST:
+    """
+    No-op for native FSTs, which are always ready for lookup.
+    """
+    return t
+
+def fst_determinize(t: NativeFST) -> NativeFST:
+    """
+    Determinize the given FST. Returns a new FST.
+    """
+    return _determinize(t)
+
+def fst_minimize(t: NativeFST) -> NativeFST:
+    """
+    Minimize the given FST with partition refinement. Returns a new FST.
+    """
+    t = _trim(_determinize(t))
+    wildcards = _has_wildcards(t)
+    classes = [1 if s in t.finals else 0 for s in range(t.number_of_states())]
+    n_classes = len(set(classes))
+    while True:
+        signatures = {}
+        refined = []
+        for s, arcs in enumerate(t.arcs):
+            if wildcards:
+                sig = (classes[s], frozenset(_canonical_arcs(arcs, classes)))
+            else:
+                sig = (classes[s], frozenset((i, o, classes[dst]) for i, o, dst in arcs))
+            refined.append(signatures.setdefault(sig, len(signatures)))
+        classes = refined
+        if len(signatures) == n_classes:
+            break
+        n_classes = len(signatures)
+
+    # renumber the classes such that the initial state stays at 0
+    order = {classes[0]: 0}
+    for c in classes:
+        if c not in order:
+            order[c] = len(order)
+    res = NativeFST(n_classes)
+    done = set()
+    for s, arcs in enumerate(t.arcs):
+        c = order[classes[s]]
+        if s in t.finals:
+            res.set_final(c)
+        if c in done:
+            continue
+        done.add(c)
+        if wildcards:
+            res.arcs[c] = [(i, o, order[dst]) for i, o, dst in _canonical_arcs(arcs, classes)]
+        else:
+            res.arcs[c] = [(i, o, order[classes[dst]]) for i, o, dst in arcs]
+    return res
+
+def _canonical_arcs(arcs: List[Tuple[Symbol, Symbol, int]], classes: List[int]) -> List[Tuple[Symbol, Symbol, int]]:
+    """
+    Rewrite the arcs of a deterministic state to arcs into state classes. If
+    the state has a wildcard identity arc, the symbols that lead to the same
+    class as the wildcard are folded into it, so that equivalent states get
+    identical arcs.
+    """
+    res = [(i, o, classes[dst]) for i, o, dst in arcs]
+    wild = next((arc for arc in res if _is_identity_wildcard(arc[0], arc[1])), None)
+    if wild is None:
+        return res
+    w, _, default = wild
+    exceptions = dict.fromkeys(w.excluded)
+    others = []
+    for i, o, c in res:
+        if _is_identity_wildcard(i, o):
+            continue
+        if i == o:
+            exceptions[i] = c
+        else:
+            others.append((i, o, c))
+    exceptions = {symbol: c for symbol, c in exceptions.items() if c != default}
+    w = Wildcard(frozenset(exceptions))
+    others.extend((symbol, symbol, c) for symbol, c in exceptions.items() if c is not None)
+    others.append((w, w, default))
+    return others
+
+def fst_input_project(t: NativeFST) -> NativeFST:
+    """
+    Project the input of the given FST.
+    """
+    res = NativeFST(0)
+    res.arcs = [[(i, i, dst) for i, _, dst in arcs] for arcs in t.arcs]
+    res.finals = set(t.finals)
+    return res
+
+def fst_output_project(t: NativeFST) -> NativeFST:
+    """
+    Project the output of the given FST.
+    """
+    res = NativeFST(0)
+    res.arcs = [[(o, o, dst) for _, o, dst in arcs] for arcs in t.arcs]
+    res.finals = set(t.finals)
+    return res
+
+def fst_invert(t: NativeFST) -> NativeFST:
+    """
+    Invert the given FST.
+    """
+    res = NativeFST(0)
+    res.arcs = [[(o, i, dst) for i, o, dst in arcs] for arcs in t.arcs]
+    res.finals = set(t.finals)
+    return res
+
+def fst_extract_paths(t: NativeFST) -> List[List[Symbol]]:
+    """
+    Extract all paths from the given FST, without following cycles.
+    Wildcards are reported as '?'.
+    """
+    t = _remove_epsilons(t)
+    res = []
+    seen = set()
+    stack = [(0, (), frozenset([0]))]
+    while stack:
+        s, path, on_path = stack.pop()
+        if s in t.finals and path not in seen:
+            seen.add(path)
+            res.append(list(path))
+        for i, _, dst in t.arcs[s]:
+            if dst not in on_path:
+                stack.append((dst, path + (str(i) if isinstance(i, Wildcard) else i,), on_path | {dst}))
+    return res
@@ -0,0 +1,366 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from ..language.regularir import Spec, SEqual, SSubsetEq, SPrefixITE, SNot, SAnd, SOr
+from ..language.regularir import PNegSymbols, PSymbol, PPredicate, PConcat, PUnion, PStar, PIntersect, PComplement, PNetworkStateBefore, PNetworkStateAfter, PEmptySet, PEpsilon, PImage, PReverseImage
+from ..language.regularir import REmptySet, REpsilon, RIdentity, RProduct, RConcat, RStar, RUnion, RCompose, RPriorityUnion
+from ..language.regularir.rirvisitor import PropVisitor, RelVisitor, SpecVisitor
+from ..language.regularir.dependency_scanner import DependencyScanner, ALPHABET, WILDCARD
+from ..language.regularir.alphabet_scanner import AlphabetScanner
+from ..language.hashcons import MemoizingVisitor
+from ..language.ip.guard import IPGuard
+from ..networkmodel.fec import FEC
+from ..networkmodel.attributeindex import PREDICATE_FIELDS
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements the lowering of specs into verification
+plans: linear programs of automata operations over numbered registers, which
+are executed per FEC by FSTConstructor.execute instead of walking the spec.
+Plans only hold strings, numbers and guards, so they can be pickled.
+"""
+
+@dataclass(frozen=True, eq=False)
+class Instruction:
+    """
+    An automata operation that writes the automaton built from the given
+    argument registers and parameters into the output register. The
+    dependencies (STATE, ALPHABET and/or WILDCARD) tell whether the result
+    differs between FECs. Registers in free are not read after this instruction.
+    """
+    op: str
+    out: int
+    args: Tuple[int, ...] = ()
+    params: Tuple[Any, ...] = ()
+    deps: frozenset = frozenset()
+    free: Tuple[int, ...] = ()
+
+    def __str__(self) -> str:
+        deps = f"  [{', '.join(sorted(self.deps))}]" if self.deps else ''
+        free = f"  free {', '.join(f'r{r}' for r in self.free)}" if self.free else ''
+        operands = [f'r{r}' for r in self.args] + [repr(p) for p in self.params]
+        return f"r{self.out} = {self.op}({', '.join(operands)}){deps}{free}"
+
+
+@dataclass(eq=False)
+class AtomicPlan:
+    """
+    The plan of an atomic spec: the program that builds both sides into the
+    left and right registers, and how the two sides are compared ('eq' or
+    'subseteq'). Symbols are the locations named by the spec, see
+    FSTConstructor.execute.
+    """
+    relation: str
+    instructions: List[Instruction]
+    left: int
+    right: int
+    n_registers: int
+    spec: str = ''
+    symbols: frozenset = frozenset()
+
+    def dependent(self) -> List[int]:
+        """
+        Get the instructions whose results differ between FECs.
+        """
+        return [i for i, ins in enumerate(self.instructions) if ins.deps]
+
+    def __str__(self) -> str:
+        lines = [f'{self.spec}'] + [f'  {ins}' for ins in self.instructions]
+        lines.append(f'  {self.relation}(r{self.left}, r{self.right})')
+        return '\n'.join(lines)
+
+
+# a branch of a plan is either the index of an atomic plan, ('ite', guard,
+# then, else) to take a branch depending on whether the FEC matches a guard, or
+# ('not', p), ('and', p, q) or ('or', p, q) to combine the verdicts of branches
+Branch = Union[int, Tuple]
+
+# the verdict of a spec on a FEC, and for a failed spec, a path that
+# distinguishes the two sides of a failed atomic spec, if any
+Verdict = Tuple[bool, Optional[List[Any]]]
+
+@dataclass(eq=False)
+class VerificationPlan:
+    """
+    The plan of a spec: the structure of its SPrefixITE, SNot, SAnd and SOr
+    nodes, and the atomic plan of each SEqual or SSubsetEq leaf.
+    """
+    branches: Branch
+    leaves: List[AtomicPlan] = field(default_factory=list)
+
+    @staticmethod
+    def _take_then(guard: IPGuard, fec: FEC) -> bool:
+        return any(guard.contains(ip) for ip in fec.get_ip_traffic_keys())
+
+    def select(self, fec: FEC) -> AtomicPlan:
+        """
+        Select the atomic plan of a FEC by testing whether it overlaps with
+        the guards on its branch.
+        """
+        branch = self.branches
+        while not isinstance(branch, int):
+            if branch[0] != 'ite':
+                raise ValueError('the selected spec is not atomic')
+            _, guard, then_branch, else_branch = branch
+            branch = then_branch if VerificationPlan._take_then(guard, fec) else else_branch
+        return self.leaves[branch]
+
+    def evaluate(self, fec: FEC, check: Callable[[AtomicPlan], Verdict]) -> Verdict:
+        """
+        Evaluate the spec on a FEC, where check gives the verdict of an atomic
+        plan. SAnd stops at the first failing conjunct, and SOr at the first
+        passing disjunct, so only the atomic plans that decide the verdict
+        are checked. A failed spec keeps the witness of its first failed
+        atomic spec; SNot has no witness.
+        """
+        return self._evaluate(self.branches, fec, check)
+
+    def _evaluate(self, branch: Branch, fec: FEC, check: Callable[[AtomicPlan], Verdict]) -> Verdict:
+        if isinstance(branch, int):
+            return check(self.leaves[branch])
+        op = branch[0]
+        if op == 'ite':
+            _, guard, then_branch, else_branch = branch
+            return self._evaluate(then_branch if VerificationPlan._take_then(guard, fec) else else_branch, fec, check)
+        if op == 'not':
+            res, _ = self._evaluate(branch[1], fec, check)
+            return not res, None
+        p_res, p_witness = self._evaluate(branch[1], fec, check)
+        if op == 'and':
+            return (p_res, p_witness) if not p_res else self._evaluate(branch[2], fec, check)
+        if op == 'or':
+            if p_res:
+                return True, None
+            q_res, q_witness = self._evaluate(branch[2], fec, check)
+            return (True, None) if q_res else (False, p_witness if p_witness is not None else q_witness)
+        raise ValueError(f'invalid branch {op}')
+
+    def __str__(self) -> str:
+        return '\n'.join(str(leaf) for leaf in self.leaves)
+
+
+class _ProgramBuilder(MemoizingVisitor, PropVisitor, RelVisitor):
+    """
+    Visitor that emits the instructions of an atomic spec into virtual
+    registers, one per instruction. Nodes shared by several parents are
+    emitted once.
+
+    Wildcards and complements are built over all symbols, and bounded to the
+    strings over the alphabet where it matters: both sides of the spec, the
+    inputs of images and the strings passed between composed relations.
+    """
+    def __init__(self, scanner: DependencyScanner):
+        super().__init__()
+        self.scanner = scanner
+        self.instructions: List[Instruction] = []
+        self._universe = None
+        self._bounded: Dict[int, int] = {}
+
+    def emit(self, op: str, args: Tuple[int, ...] = (), params: Tuple[Any, ...] = (), expr: Any = None, deps: frozenset = frozenset()) -> int:
+        deps = deps.union(*[self.instructions[arg].deps for arg in args])
+        if expr is not None:
+            deps |= self.scanner.visit(expr)
+        self.instructions.append(Instruction(op, len(self.instructions), tuple(args), tuple(params), deps))
+        return len(self.instructions) - 1
+
+    def universe(self) -> int:
+        """
+        Emit the strings over the alphabet, once per atomic spec.
+        """
+        if self._universe is None:
+            self._universe = self.emit('universe', deps=frozenset([ALPHABET]))
+        return self._universe
+
+    def bound(self, t: int) -> int:
+        """
+        Bound an automaton with wildcards to the strings over the alphabet.
+        """
+        if WILDCARD not in self.instructions[t].deps:
+            return t
+        if t not in self._bounded:
+            self._bounded[t] = self.emit('intersect', (t, self.universe()))
+        return self._bounded[t]
+
+    def build(self, expr: Any, inverse: bool = False, lazy: bool = False) -> int:
+        """
+        Emit the instructions of an expression (inverted if inverse is set,
+        and as a lazy relation if lazy is set, see FSTConstructor.construct).
+        """
+        return self._memoize(expr, (inverse, lazy), lambda: self._build(expr, inverse, lazy))
+
+    def _build(self, expr: Any, inverse: bool, lazy: bool) -> int:
+        if lazy:
+            if isinstance(expr, RProduct):
+                p, q = self.build(expr.p), self.build(expr.q)
+                return self.emit('lazy_product', (q, p) if inverse else (p, q), expr=expr)
+            if isinstance(expr, RIdentity):
+                return self.build(expr.arg)
+            if isinstance(expr, RConcat):
+                return self.emit('lazy_concat', [self.build(arg, inverse, lazy=True) for arg in expr.args], expr=expr)
+            if isinstance(expr, RUnion):
+                return self.emit('lazy_union', [self.build(arg, inverse, lazy=True) for arg in expr.args], expr=expr)
+            return self.build(expr, inverse)
+        t = expr.accept(self)
+        return self.emit('invert', (t,), expr=expr) if inverse else t
+
+    def visit_p_symbol(self, expr: PSymbol) -> int:
+        return self.emit('symbol', params=(expr.symbol,), expr=expr)
+
+    def visit_p_predicate(self, expr: PPredicate) -> int:
+        if expr.field.lower() not in PREDICATE_FIELDS:
+            raise ValueError(f"Unknown predicate field: {expr.field}, should be one of {PREDICATE_FIELDS}")
+        return self.emit('predicate', params=(expr.field, expr.value), expr=expr)
+
+    def visit_p_neg_symbols(self, expr: PNegSymbols) -> int:
+        return self.emit('neg_symbols', params=expr.neg_symbols, expr=expr)
+
+    def visit_p_empty_set(self, expr: PEmptySet) -> int:
+        return self.emit('zero', expr=expr)
+
+    def visit_p_epsilon(self, expr: PEpsilon) -> int:
+        return self.emit('one', expr=expr)
+
+    def visit_p_network_state_before(self, expr: PNetworkStateBefore) -> int:
+        return self.emit('pre_state', expr=expr)
+
+    def visit_p_network_state_after(self, expr: PNetworkStateAfter) -> int:
+        return self.emit('post_state', expr=expr)
+
+    def visit_p_concat(self, expr: PConcat) -> int:
+        return self.emit('concat', [self.build(arg) for arg in expr.args], expr=expr)
+
+    def visit_p_union(self, expr: PUnion) -> int:
+        return self.emit('union', [self.build(arg) for arg in expr.args], expr=expr)
+
+    def visit_p_star(self, expr: PStar) -> int:
+        return self.emit('star', (self.build(expr.arg),), expr=expr)
+
+    def visit_p_intersect(self, expr: PIntersect) -> int:
+        return self.emit('intersect', [self.build(arg) for arg in expr.args], expr=expr)
+
+    def visit_p_complement(self, expr: PComplement) -> int:
+        t = self.build(expr.arg)
+        return self.emit('complement', (t, self.bound(t)), expr=expr)
+
+    def visit_p_image(self, expr: PImage) -> int:
+        return self.emit('image', (self.bound(self.build(expr.prop)), self.build(expr.rel, lazy=True)), expr=expr)
+
+    def visit_p_reverse_image(self, expr: PReverseImage) -> int:
+        return self.emit('image', (self.bound(self.build(expr.prop)), self.build(expr.rel, inverse=True, lazy=True)), expr=expr)
+
+    def visit_r_empty_set(self, expr: REmptySet) -> int:
+        return self.emit('zero', expr=expr)
+
+    def visit_r_epsilon(self, expr: REpsilon) -> int:
+        return self.emit('one', expr=expr)
+
+    def visit_r_identity(self, expr: RIdentity) -> int:
+        return self.build(expr.arg)
+
+    def visit_r_product(self, expr: RProduct) -> int:
+        return self.emit('product', (self.build(expr.p), self.build(expr.q)), expr=expr)
+
+    def visit_r_concat(self, expr: RConcat) -> int:
+        return self.emit('concat', [self.build(arg) for arg in expr.args], expr=expr)
+
+    def visit_r_union(self, expr: RUnion) -> int:
+        return self.emit('union', [self.build(arg) for arg in expr.args], expr=expr)
+
+    def visit_r_star(self, expr: RStar) -> int:
+        return self.emit('star', (self.build(expr.arg),), expr=expr)
+
+    def visit_r_compose(self, expr: RCompose) -> int:
+        args = [self.build(arg) for arg in expr.args]
+        if any(WILDCARD in self.instructions[arg].deps for arg in args):
+            # the strings passed from one relation to the next are bounded
+            # by composing with the identity on the alphabet in between
+            universe = self.universe()
+            args = [x for arg in args for x in (universe, arg)][1:]
+        return self.emit('compose', args, expr=expr)
+
+    def visit_r_priority_union(self, expr: RPriorityUnion) -> int:
+        return self.emit('priority_union', [self.build(arg) for arg in expr.args], expr=expr)
+
+
+def _allocate(instructions: List[Instruction], outputs: Tuple[int, ...]) -> Tuple[List[Instruction], Tuple[int, ...], int]:
+    """
+    Map the virtual registers of a program to as few registers as possible.
+    A register is freed after the last instruction that reads it, and reused
+    by the next instruction that needs one. The output registers are never
+    freed. Returns the program, the output registers and the number of
+    registers.
+    """
+    last_use: Dict[int, int] = {}
+    for i, ins in enumerate(instructions):
+        for arg in ins.args:
+            last_use[arg] = i
+    for out in outputs:
+        last_use[out] = len(instructions)
+
+    registers: Dict[int, int] = {}
+    available: List[int] = []
+    n_registers = 0
+    res = []
+    for i, ins in enumerate(instructions):
+        # the output is allocated before the arguments are freed, so that an
+        # instruction never overwrites its own arguments
+        if available:
+            registers[ins.out] = available.pop()
+        else:
+            registers[ins.out] = n_registers
+            n_registers += 1
+        dead = sorted({arg for arg in ins.args if last_use[arg] == i})
+        if ins.out not in last_use:
+            # the result is never read
+            dead.append(ins.out)
+        free = tuple(registers[r] for r in dead)
+        available.extend(reversed(free))
+        res.append(Instruction(ins.op, registers[ins.out], tuple(registers[arg] for arg in ins.args), ins.params, ins.deps, free))
+    return res, tuple(registers[out] for out in outputs), n_registers
+
+
+class SpecPlanner(SpecVisitor):
+    """
+    Visitor that lowers a spec into a VerificationPlan.
+    """
+    def __init__(self):
+        self.scanner = DependencyScanner()
+        self.leaves: List[AtomicPlan] = []
+
+    @staticmethod
+    def lower(spec: Spec) -> VerificationPlan:
+        """
+        Lower a spec into a verification plan.
+        """
+        planner = SpecPlanner()
+        branches = spec.accept(planner)
+        return VerificationPlan(branches, planner.leaves)
+
+    def _lower_atomic(self, expr: Spec, relation: str) -> int:
+        builder = _ProgramBuilder(self.scanner)
+        left, right = builder.bound(builder.build(expr.p)), builder.bound(builder.build(expr.q))
+        instructions, (left, right), n_registers = _allocate(builder.instructions, (left, right))
+        symbols = frozenset(expr.accept(AlphabetScanner()))
+        self.leaves.append(AtomicPlan(relation, instructions, left, right, n_registers, str(expr), symbols))
+        return len(self.leaves) - 1
+
+    def visit_s_equal(self, expr: SEqual) -> Branch:
+        return self._lower_atomic(expr, 'eq')
+
+    def visit_s_subset_eq(self, expr: SSubsetEq) -> Branch:
+        return self._lower_atomic(expr, 'subseteq')
+
+    def visit_s_ite(self, expr: SPrefixITE) -> Branch:
+        return ('ite', expr.guard, expr.p.accept(self), expr.q.accept(self))
+
+    def visit_s_not(self, expr: SNot) -> Branch:
+        return ('not', expr.p.accept(self))
+
+    def visit_s_and(self, expr: SAnd) -> Branch:
+        return ('and', expr.p.accept(self), expr.q.accept(self))
+
+    def visit_s_or(self, expr: SOr) -> Branch:
+        return ('or', expr.p.accept(self), expr.q.accept(self))
@@ -1,9 +1,11 @@
 from __future__ import annotations
-from typing import Set, List
+from typing import Set, List, Optional, Tuple
 import hfst
 
 from ..networkmodel.forwardinggraph import ForwardingGraph
 from ..networkmodel.networkpath import NetworkPath
+from ..networkmodel.symboltable import Location
+from . import native
 
 """
 @author: Xieyang Xu
@@ -32,34 +34,31 @@ def fst_one() -> hfst.HfstTransducer:
     t.set_final_weight(0, 0)
     return hfst.HfstTransducer(t)
 
-_meta_char_set = set(['%', '_', '@', '#', '~', '\\', '&', '-', '$', '^', '*', '+', '?', '(', ')', '[', ']', '{', '}', '|', '<', '>', '.', '!', '=', ':', ';', '/', '`'])
-def _escape(symbol: str) -> str:
+def _label(symbol: Location) -> str:
     """
-    Escape a symbol for use in Xerox transuder regular expressions.
-    Using % as escape character.
-    E.g., escape 'GROUP_ROUTER_城市|VRF' to 'GROUP%_ROUTER%_城市%|VRF'.
+    Get the HFST label of a symbol. Symbols interned as integer IDs are
+    labeled by their decimal string form.
     """
-    chars = ['%' + c if c in _meta_char_set else c for c in symbol]
-    return ''.join(chars)
+    return symbol if isinstance(symbol, str) else str(symbol)
 
-def fst_from_symbol(symbol: str) -> hfst.HfstTransducer:
+def fst_from_symbol(symbol: Location) -> hfst.HfstTransducer:
     """
     Construct the FST/FSA that recognizes a single-symbol string.
     Contains two states and one transition:
     0 --symbol/symbol--> (1)
     """
-    if not isinstance(symbol, str):
-        raise Exception('symbol must be a string')
-    
-    t = hfst.regex(f'[{_escape(symbol)}]')
-
-    # sanity check
-    if t is None or t.number_of_states() != 2 or t.number_of_arcs() != 1:
+    if not isinstance(symbol, (str, int)):
+        raise Exception('symbol must be a string or an interned symbol')
+    if symbol == '':
         raise Exception(f'invalid symbol: {symbol}')
     
-    return t
+    t = hfst.HfstBasicTransducer()
+    t.add_state()
+    t.set_final_weight(1, 0)
+    t.add_transition(0, 1, _label(symbol), _label(symbol))
+    return hfst.HfstTransducer(t)
 
-def fst_from_symbols(symbols: Set[str]) -> hfst.HfstTransducer:
+def fst_from_symbols(symbols: Set[Location]) -> hfst.HfstTransducer:
     """
     Construct the FST/FSA that recognizes a set of symbols.
     Equivalent to the union of single-symbol FSTs for all symbols in the given
@@ -71,31 +70,38 @@ def fst_from_symbols(symbols: Set[str]) -> hfst.HfstTransducer:
     t.add_state()
     t.set_final_weight(1, 0)
     for symbol in symbols:
-        t.add_transition(0, 1, symbol, symbol)
+        t.add_transition(0, 1, _label(symbol), _label(symbol))
     return hfst.HfstTransducer(t)
 
-def fst_from_neg_symbols(symbols: Set[str], alphabet: Set[str]) -> hfst.HfstTransducer:
+def fst_from_wildcard(symbols: Set[Location]) -> hfst.HfstTransducer:
     """
-    Construct the FST/FSA that recognizes negtive symbol groups such as [^ab].
-    Equavalent to the union of single-symbol FSTs for all symbols not in the
-    given symbol set.
+    Construct the FST/FSA that recognizes any single symbol except the given
+    ones, whatever the alphabet. Contains two states and one identity
+    transition, which HFST matches against any symbol outside the alphabet of
+    the FST, i.e., the given symbols:
+    0 --?/?--> (1)
     """
     if not isinstance(symbols, set):
         raise Exception('symbols must be a set')
-    if not isinstance(alphabet, set):
-        raise Exception('alphabet must be a set')
-    pos_symbols = alphabet - symbols
-    
-    # res = fst_union(*[fst_from_symbol(symbol) for symbol in pos_symbols])
-    # return res
-
     t = hfst.HfstBasicTransducer()
     t.add_state()
     t.set_final_weight(1, 0)
-    for symbol in pos_symbols:
-        t.add_transition(0, 1, symbol, symbol)
+    t.add_symbols_to_alphabet([_label(symbol) for symbol in symbols])
+    t.add_transition(0, 1, hfst.IDENTITY, hfst.IDENTITY)
     return hfst.HfstTransducer(t)
 
+def fst_from_neg_symbols(symbols: Set[Location], alphabet: Set[Location]) -> hfst.HfstTransducer:
+    """
+    Construct the FST/FSA that recognizes negtive symbol groups such as [^ab].
+    Equavalent to the wildcard of fst_from_wildcard split over the symbols of
+    the alphabet that are not in the given symbol set.
+    """
+    if not isinstance(symbols, set):
+        raise Exception('symbols must be a set')
+    if not isinstance(alphabet, set):
+        raise Exception('alphabet must be a set')
+    return fst_from_symbols(alphabet - symbols)
+
 def fst_concat(*args: hfst.HfstTransducer) -> hfst.HfstTransducer:
     """
     Implements the FST/FSA concatenation operation.
@@ -166,7 +172,7 @@ def fst_star(t: hfst.HfstTransducer) -> hfst.HfstTransducer:
     return t
 
 
-def _complete_fst(t: hfst.HfstBasicTransducer, alphabet: Set[str]) -> hfst.HfstBasicTransducer:
+def _complete_fst(t: hfst.HfstBasicTransducer, alphabet: Set[Location]) -> hfst.HfstBasicTransducer:
     """
     Complete the FST/FSA by adding all missing transitions to a sink state.
     Assume that the FST/FSA is already deterministic.
@@ -175,14 +181,15 @@ def _complete_fst(t: hfst.HfstBasicTransducer, alphabet: Set[str]) -> hfst.HfstB
     if not isinstance(alphabet, set):
         raise Exception('alphabet must be a set')
     sink = t.add_state()
+    labels = [_label(symbol) for symbol in alphabet]
     for s, arcs in enumerate(t):
         exist_symbols = set([arc.get_input_symbol() for arc in arcs])
-        for symbol in alphabet:
-            if symbol not in exist_symbols:
-                t.add_transition(s, sink, symbol, symbol)
+        for label in labels:
+            if label not in exist_symbols:
+                t.add_transition(s, sink, label, label)
     return t
 
-def fst_complement(t: hfst.HfstTransducer, alphabet: Set[str]) -> hfst.HfstTransducer:
+def fst_complement(t: hfst.HfstTransducer, alphabet: Set[Location]) -> hfst.HfstTransducer:
     """
     Implements the FST/FSA complement operation.
     """
@@ -190,6 +197,7 @@ def fst_complement(t: hfst.HfstTransducer, alphabet: Set[str]) -> hfst.HfstTrans
         raise Exception('alphabet must be a set')
 
     # determination is necessary for complement algorithm
+    t = hfst.HfstTransducer(t)
     t.determinize()
     t.minimize()
     t = hfst.HfstBasicTransducer(t)
@@ -205,35 +213,70 @@ def fst_complement(t: hfst.HfstTransducer, alphabet: Set[str]) -> hfst.HfstTrans
             t.set_final_weight(s, 0)
     return hfst.HfstTransducer(t)
 
+def fst_prefixes(t: hfst.HfstTransducer) -> hfst.HfstTransducer:
+    """
+    Construct the FSA of the prefixes of the words of the given FSA, and of
+    the empty word. Every state that reaches a final state becomes final.
+    """
+    b = hfst.HfstBasicTransducer(t)
+    reverse = [[] for _ in b.states()]
+    for s, arcs in enumerate(b):
+        for arc in arcs:
+            reverse[arc.get_target_state()].append(s)
+    stack = [s for s in b.states() if b.is_final_state(s)]
+    useful = set(stack)
+    while stack:
+        for src in reverse[stack.pop()]:
+            if src not in useful:
+                useful.add(src)
+                stack.append(src)
+    for s in useful | {0}:
+        b.set_final_weight(s, 0)
+    return hfst.HfstTransducer(b)
+
 def fst_from_path_set(paths: List[NetworkPath]) -> hfst.HfstTransducer:
     """
     Construct the FST/FSA from the network state.
     Equivalent to the union of all paths that start with the given prefix.
+
+    The paths are streamed into a prefix tree whose edges are hops (a set of
+    alternative nodes), so the construction is linear in the total length of
+    the paths.
     """
     if paths is None or len(paths) == 0:
         return fst_zero()
 
-    path_reprs = []
+    t = hfst.HfstBasicTransducer()
+    children = {}
     for path in paths:
-        hop_reprs = []
+        s = 0
         for hop in path:
-            if isinstance(hop, str):
-                hop_reprs.append(f'[{_escape(hop)}]')
+            if isinstance(hop, (str, int)):
+                hop = (_label(hop),)
             elif isinstance(hop, list):
-                hop_reprs.append(f'[{"|".join([f"[{_escape(node)}]" for node in hop])}]')
+                hop = tuple(sorted(set(_label(node) for node in hop)))
             else:
-                raise Exception('invalid hop: {hop}')
-        path_reprs.append(''.join(hop_reprs))
-    network_state_repr = '|'.join(path_reprs)
-
-    t = hfst.regex(network_state_repr)
+                raise Exception(f'invalid hop: {hop}')
+            child = children.get((s, hop))
+            if child is None:
+                child = t.add_state()
+                children[(s, hop)] = child
+                for label in hop:
+                    t.add_transition(s, child, label, label)
+            s = child
+        t.set_final_weight(s, 0)
 
-    return t
+    return hfst.HfstTransducer(t)
 
 def fst_from_forwarding_graph(graph: ForwardingGraph) -> hfst.HfstTransducer:
     """
-    Construct the FST/FSA from the forwarding graph.
+    Construct the FST/FSA from the forwarding graph. Acyclic graphs are built
+    as minimal DFAs, see native.fst_from_acyclic_forwarding_graph.
     """
+    dfa = native.fst_from_acyclic_forwarding_graph(graph)
+    if dfa is not None:
+        return _from_native(dfa)
+
     t = hfst.HfstBasicTransducer()
     states = {}
 
@@ -246,69 +289,92 @@ def fst_from_forwarding_graph(graph: ForwardingGraph) -> hfst.HfstTransducer:
 
     # add transitions
     for node in graph.get_nodes():
-        for next_node, edges in graph.get_out_edges(node).items():
-            for edge in edges:
-                t.add_transition(states[node], states[next_node], edge, edge)
+        for next_node, edge in graph.get_edges(node):
+            t.add_transition(states[node], states[next_node], _label(edge), _label(edge))
 
         # point the initial state to the source nodes
         if graph.is_source(node):
-            t.add_transition(0, states[node], node, node)
+            t.add_transition(0, states[node], _label(node), _label(node))
 
     return hfst.HfstTransducer(t)
 
+def _useful_arcs(b: hfst.HfstBasicTransducer) -> Tuple[List[List[Tuple[str, int]]], Set[int]]:
+    """
+    Read the arcs of an epsilon-free FSA into per-state lists of (symbol,
+    target), keeping only arcs into states that can reach a final state.
+    Returns the arc lists and the set of final states.
+    """
+    arcs = [[(arc.get_input_symbol(), arc.get_target_state()) for arc in state_arcs] for state_arcs in b]
+    finals = {s for s in range(len(arcs)) if b.is_final_state(s)}
+
+    reverse = [[] for _ in arcs]
+    for s, state_arcs in enumerate(arcs):
+        for _, dst in state_arcs:
+            reverse[dst].append(s)
+    useful = set(finals)
+    stack = list(finals)
+    while stack:
+        s = stack.pop()
+        for src in reverse[s]:
+            if src not in useful:
+                useful.add(src)
+                stack.append(src)
+    return [[(symbol, dst) for symbol, dst in state_arcs if dst in useful] for state_arcs in arcs], finals
+
 def fst_from_fsa_product(l: hfst.HfstTransducer, r: hfst.HfstTransducer) -> hfst.HfstTransducer:
     """
     Construct the FST that accepts all string pairs (x, y) where x is accepted
     by the left FSA and y is accepted by the right FSA.
+    Only state pairs reachable from (0, 0) that can reach a final pair are
+    constructed, by a worklist over arc lists read once from both FSAs.
+    The FSAs are harmonized first, so that an identity symbol on one side
+    excludes the symbols of both. It becomes the unknown symbol in the
+    product, which is free on its side.
     """
-    t = hfst.HfstBasicTransducer()
     l = hfst.HfstTransducer(l)
     r = hfst.HfstTransducer(r)
     l.remove_epsilons()
     r.remove_epsilons()
     l = hfst.HfstBasicTransducer(l)
     r = hfst.HfstBasicTransducer(r)
+    l.harmonize(r)
+    arcs_l, finals_l = _useful_arcs(l)
+    arcs_r, finals_r = _useful_arcs(r)
+    unknown = lambda symbol: hfst.UNKNOWN if symbol == hfst.IDENTITY else symbol
 
     states = {(0, 0): 0} # mapping from (s_l, s_r) to state id in composed automata
-    for s1 in l.states():
-        for s2 in r.states():
-            if s1 == 0 and s2 == 0: 
-                s = states[(0, 0)]
-            else:
-                s = t.add_state() # skip initial state
-                states[(s1, s2)] = s
-            if l.is_final_state(s1) and r.is_final_state(s2):
-                t.set_final_weight(s, 0)
-
-    for s1, arcs1 in enumerate(l):
-        for s2, arcs2 in enumerate(r):
-            # 0. only DFA1 moves forward
-            for arc1 in arcs1:
-                t.add_transition(
-                    states[(s1, s2)],
-                    states[(arc1.get_target_state(), s2)],
-                    arc1.get_input_symbol(),
-                    hfst.EPSILON,
-                    0)
-
-            # 1. only DFA2 moves forward
-            for arc2 in arcs2:
-                t.add_transition(
-                    states[(s1, s2)],
-                    states[(s1, arc2.get_target_state())],
-                    hfst.EPSILON,
-                    arc2.get_input_symbol(),
-                    0)
-
-            # 2. both DFAs move forward
-            for arc1 in arcs1:
-                for arc2 in arcs2:
-                    t.add_transition(
-                        states[(s1, s2)],
-                        states[(arc1.get_target_state(), arc2.get_target_state())], 
-                        arc1.get_input_symbol(), 
-                        arc2.get_input_symbol(), 
-                        0)
+    queue = [(0, 0)]
+    arcs = [] # (source, target, input, output) of the composed automata
+    finals = []
+
+    def target(d1, d2):
+        if (d1, d2) not in states:
+            states[(d1, d2)] = len(states)
+            queue.append((d1, d2))
+        return states[(d1, d2)]
+
+    while queue:
+        s1, s2 = queue.pop()
+        s = states[(s1, s2)]
+        if s1 in finals_l and s2 in finals_r:
+            finals.append(s)
+        # 0. only FSA1 moves forward
+        arcs.extend((s, target(d1, s2), unknown(a), hfst.EPSILON) for a, d1 in arcs_l[s1])
+        # 1. only FSA2 moves forward
+        arcs.extend((s, target(s1, d2), hfst.EPSILON, unknown(b)) for b, d2 in arcs_r[s2])
+        # 2. both FSAs move forward; two identity symbols are left to the
+        # moves above, as they would stand for the identity relation
+        arcs.extend((s, target(d1, d2), unknown(a), unknown(b)) for a, d1 in arcs_l[s1] for b, d2 in arcs_r[s2]
+                    if a != hfst.IDENTITY or b != hfst.IDENTITY)
+
+    t = hfst.HfstBasicTransducer()
+    t.add_symbols_to_alphabet(l.get_alphabet())
+    for _ in range(len(states) - 1):
+        t.add_state()
+    for s in finals:
+        t.set_final_weight(s, 0)
+    for src, dst, a, b in arcs:
+        t.add_transition(src, dst, a, b, 0)
     return hfst.HfstTransducer(t)
 
 def fst_image(p: hfst.HfstTransducer, r: hfst.HfstTransducer) -> hfst.HfstTransducer:
@@ -338,20 +404,102 @@ def fst_minus(p: hfst.HfstTransducer, q: hfst.HfstTransducer) -> hfst.HfstTransd
     t.minus(q)
     return t
 
+_SPECIAL_SYMBOLS = (hfst.EPSILON, hfst.IDENTITY, hfst.UNKNOWN)
+
+def _to_native(t: hfst.HfstTransducer) -> native.NativeFST:
+    """
+    Copy the states and arcs of an HFST transducer into a native FST, so that
+    the on-the-fly algorithms in native.py can walk it. The identity and
+    unknown symbols become wildcards that exclude the alphabet of the
+    transducer.
+    """
+    b = hfst.HfstBasicTransducer(t)
+    wildcard = native.Wildcard(frozenset(symbol for symbol in b.get_alphabet() if symbol not in _SPECIAL_SYMBOLS))
+    labels = {hfst.EPSILON: native.EPSILON, hfst.IDENTITY: wildcard, hfst.UNKNOWN: wildcard}
+    res = native.NativeFST(b.get_max_state() + 1)
+    for s, arcs in enumerate(b):
+        for arc in arcs:
+            i, o = arc.get_input_symbol(), arc.get_output_symbol()
+            if i == o == hfst.UNKNOWN:
+                # a native arc with wildcards on both sides is an identity,
+                # so independent unknown symbols are split into two arcs
+                mid = res.add_state()
+                res.add_transition(s, mid, wildcard, native.EPSILON)
+                res.add_transition(mid, arc.get_target_state(), native.EPSILON, wildcard)
+            else:
+                res.add_transition(s, arc.get_target_state(), labels.get(i, i), labels.get(o, o))
+        if b.is_final_state(s):
+            res.set_final(s)
+    return res
+
+def _from_native(t: native.NativeFST) -> hfst.HfstTransducer:
+    """
+    Copy the states and arcs of a native FST into an HFST transducer. The
+    alphabet of the transducer holds the symbols excluded by any wildcard,
+    so a wildcard that excludes fewer symbols also gets concrete arcs for the
+    others.
+    """
+    alphabet = set()
+    for arcs in t.arcs:
+        for i, o, _ in arcs:
+            for symbol in (i, o):
+                if isinstance(symbol, native.Wildcard):
+                    alphabet.update(symbol.excluded)
+    b = hfst.HfstBasicTransducer()
+    b.add_symbols_to_alphabet([_label(symbol) for symbol in alphabet])
+    for _ in range(t.number_of_states() - 1):
+        b.add_state()
+
+    def labels(symbol, wildcard):
+        if symbol is native.EPSILON:
+            return [hfst.EPSILON]
+        if isinstance(symbol, native.Wildcard):
+            return [wildcard] + [_label(x) for x in alphabet - symbol.excluded]
+        return [_label(symbol)]
+
+    for s, arcs in enumerate(t.arcs):
+        for i, o, dst in arcs:
+            if isinstance(i, native.Wildcard) and isinstance(o, native.Wildcard):
+                for label in labels(i, hfst.IDENTITY):
+                    b.add_transition(s, dst, label, label, 0)
+                continue
+            for a in labels(i, hfst.UNKNOWN):
+                for c in labels(o, hfst.UNKNOWN):
+                    b.add_transition(s, dst, a, c, 0)
+    for s in t.finals:
+        b.set_final_weight(s, 0)
+    return hfst.HfstTransducer(b)
+
+def fst_eq_witness(p: hfst.HfstTransducer, q: hfst.HfstTransducer) -> Optional[List[str]]:
+    """
+    Check whether two FSTs are equivalent without determinizing them upfront.
+    Returns None if the FSTs are equivalent, otherwise a shortest string
+    accepted by exactly one of them. See native.fst_eq_witness.
+    """
+    return native.fst_eq_witness(_to_native(p), _to_native(q))
+
 def fst_eq(p: hfst.HfstTransducer, q: hfst.HfstTransducer) -> bool:
     """
     Check whether two FSTs are equivalent.
     """
-    return p.compare(q)
+    return fst_eq_witness(p, q) is None
+
+def fst_subseteq_witness(p: hfst.HfstTransducer, q: hfst.HfstTransducer) -> Optional[List[str]]:
+    """
+    Check whether the language of the first FST is a subset of the language of
+    the second FST without building the intersection or the complement. The
+    inputs are not modified.
+    Returns None if the inclusion holds, otherwise a string accepted by the
+    first FST but not by the second. See native.fst_subseteq_witness.
+    """
+    return native.fst_subseteq_witness(_to_native(p), _to_native(q))
 
 def fst_subseteq(p: hfst.HfstTransducer, q: hfst.HfstTransducer) -> bool:
     """
     Check whether the language of the first FST is a subset of the language of
     the second FST.
     """
-    p0 = p.copy()
-    p.intersect(q)
-    return p0.compare(p)
+    return fst_subseteq_witness(p, q) is None
 
 def fst_lookup_optimize(t: hfst.HfstTransducer) -> hfst.HfstTransducer:
     """
@@ -393,10 +541,11 @@ def fst_invert(t: hfst.HfstTransducer) -> hfst.HfstTransducer:
 
 def fst_extract_paths(t: hfst.HfstTransducer) -> List[List[str]]:
     """
-    Extract all paths from the given FST.
+    Extract all paths from the given FST. Interned symbols are returned in
+    their decimal string form, and the identity and unknown symbols as '?'.
     """
     raw = t.extract_paths(output='raw', max_cycles=0)
-    return [[hop[0] for hop in path[1]] for path in raw]
+    return [['?' if hop[0] in (hfst.IDENTITY, hfst.UNKNOWN) else hop[0] for hop in path[1]] for path in raw]
 
     
 
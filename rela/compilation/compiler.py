@@ -5,6 +5,7 @@ from ..language.regularir import I, PComplement, PIntersect, P, RCompose, PSymbo
 from ..language.frontend.fevisitor import RegexVisitor, FESpecVisitor
 from ..language.frontend.frontend import AtomicSpec, ConcatSpec, ElseSpec, FESpec
 from ..language.frontend.frontend import Preserve, Add, Remove, Replace, Drop, Any
+from ..language.hashcons import NodeTable, MemoizingVisitor
 
 
 """
@@ -14,12 +15,15 @@ from ..language.frontend.frontend import Preserve, Add, Remove, Replace, Drop, A
 expressions intoRIR expressions.
 """
 
-class RelaCompiler(RegexVisitor, FESpecVisitor):
+class RelaCompiler(MemoizingVisitor, RegexVisitor, FESpecVisitor):
     """
     This class implements the visitor pattern for compiling FE expressions into
-    RIR expressions.
+    RIR expressions. The spec is interned first, so each distinct regex is
+    compiled once. Specs are compiled per occurrence, as every any() needs
+    its own marker symbol.
     """
     def __init__(self) -> None:
+        super().__init__()
         self.hash_cnt = 0
 
     @staticmethod
@@ -30,33 +34,33 @@ class RelaCompiler(RegexVisitor, FESpecVisitor):
         if not isinstance(fe_spec, FESpec):
             raise ValueError("Input to RelaCompiler must be a FESpec")
         compiler = RelaCompiler()
-        pre, post, _ = fe_spec.accept(compiler)
+        pre, post, _ = NodeTable().intern(fe_spec).accept(compiler)
         return (preState >> pre) == (postState >> post)
     
     def visit_atomic_spec(self, expr: AtomicSpec) -> Tuple[Rel, Rel, Prop]:
         if isinstance(expr.m, Preserve):
-            d : Prop = expr.r.accept(self)
+            d : Prop = self.visit(expr.r)
             return I(d), I(d), d
         elif isinstance(expr.m, Add):
-            d : Prop = expr.r.accept(self)
-            p : Prop = expr.m.p.accept(self)
+            d : Prop = self.visit(expr.r)
+            p : Prop = self.visit(expr.m.p)
             return I(d|p) | (d * p), I(d|p), d|p
         elif isinstance(expr.m, Remove):
-            d : Prop = expr.r.accept(self)
-            p : Prop = expr.m.p.accept(self)
+            d : Prop = self.visit(expr.r)
+            p : Prop = self.visit(expr.m.p)
             return I(PIntersect(d, ~p)), I(d), d
         elif isinstance(expr.m, Replace):
-            d : Prop = expr.r.accept(self)
-            p1 : Prop = expr.m.p1.accept(self)
-            p2 : Prop = expr.m.p2.accept(self)
+            d : Prop = self.visit(expr.r)
+            p1 : Prop = self.visit(expr.m.p1)
+            p2 : Prop = self.visit(expr.m.p2)
             return I(PIntersect(d|p2, ~p1)) | (PIntersect(d, p1) * p2), I(d|p2), d|p2
         elif isinstance(expr.m, Drop):
-            d : Prop = expr.r.accept(self)
+            d : Prop = self.visit(expr.r)
             drop = P('drop')
             return (d | drop) * drop, I(d|drop), d|drop
         elif isinstance(expr.m, Any):
-            d : Prop = expr.r.accept(self)
-            p : Prop = expr.m.p.accept(self)
+            d : Prop = self.visit(expr.r)
+            p : Prop = self.visit(expr.m.p)
             self.hash_cnt += 1
             sharp = P(f'#{self.hash_cnt}')
             return (d | p) * sharp, (p * sharp) | I(PIntersect(d, ~p)), d|p
@@ -89,16 +93,16 @@ class RelaCompiler(RegexVisitor, FESpecVisitor):
         return pEpsilon
     
     def visit_p_union(self, expr) -> Prop:
-        return PUnion(*[arg.accept(self) for arg in expr.args])
+        return PUnion(*[self.visit(arg) for arg in expr.args])
     
     def visit_p_concat(self, expr) -> Prop:
-        return PConcat(*[arg.accept(self) for arg in expr.args])
+        return PConcat(*[self.visit(arg) for arg in expr.args])
     
     def visit_p_star(self, expr) -> Prop:
-        return PStar(expr.arg.accept(self))
+        return PStar(self.visit(expr.arg))
     
     def visit_p_intersect(self, expr) -> Prop:
-        return PIntersect(*[arg.accept(self) for arg in expr.args])
+        return PIntersect(*[self.visit(arg) for arg in expr.args])
     
     def visit_p_complement(self, expr) -> Prop:
-        return PComplement(expr.arg.accept(self))
\ No newline at end of file
+        return PComplement(self.visit(expr.arg))
\ No newline at end of file
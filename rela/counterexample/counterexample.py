@@ -1,5 +1,5 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, List, Dict, Set, Tuple
 import multiprocessing
 import logging
@@ -7,8 +7,8 @@ import logging
 from ..language.regularir.rirvisitor import SpecVisitor
 from ..language.regularir.alphabet_scanner import AlphabetScanner
 from ..language.regularir import SEqual, SSubsetEq, Spec, SNot, SAnd, SOr, preState, postState, P, PStar, pDot, PIntersect
-from ..automata import FSTConstructor, FSA
-from ..automata.utils import fst_minus, fst_intersect, fst_extract_paths
+from ..automata import FSTConstructor, FSA, AutomataBackend, SubexpressionCache, get_backend
+from ..automata.plan import SpecPlanner, VerificationPlan
 from ..networkmodel.fec import FEC
 
 
@@ -27,6 +27,8 @@ class CounterExample:
     after_paths: Tuple[Tuple[str, ...], ...]
     left_paths: Tuple[Tuple[str, ...], ...]
     right_paths: Tuple[Tuple[str, ...], ...]
+    # a shortest path that distinguishes the left and right side, if known
+    witness: Tuple[str, ...] = None
 
     def __repr__(self) -> str:
         res = []
@@ -50,6 +52,8 @@ class CounterExampleGenerationResult:
     n_cases: int
     error_cases: List[Any]
     counter_examples: List[CounterExample]
+    # the time spent loading network changes, in seconds
+    load_time: float = 0.0
 
     def __add__(self, other: CounterExampleGenerationResult):
         """
@@ -62,7 +66,8 @@ class CounterExampleGenerationResult:
         return CounterExampleGenerationResult(
             n_cases=self.n_cases,
             error_cases=list(set(self.error_cases + other.error_cases)), # remove duplicates
-            counter_examples=self.counter_examples + other.counter_examples
+            counter_examples=self.counter_examples + other.counter_examples,
+            load_time=self.load_time + other.load_time
         )
     
     def __repr__(self) -> str:
@@ -81,7 +86,13 @@ class CounterExampleGenerationResult:
 @dataclass
 class CounterExampleGenerator(SpecVisitor):
     failed_cases: Dict[Any, FEC]
-
+    backend: str = 'hfst'
+    # the automata of state-independent subexpressions, which can be shared
+    # by generators, or None to use a new cache per spec
+    memo: SubexpressionCache = None
+    # the plans of specs, keyed by spec node, which can be shared by
+    # generators of the same specs
+    plans: Dict[int, Tuple[Spec, VerificationPlan]] = field(default_factory=dict)
 
     def _generate_counter_examples(self, expr: Spec) -> CounterExampleGenerationResult:
         res = CounterExampleGenerationResult(
@@ -89,9 +100,17 @@ class CounterExampleGenerator(SpecVisitor):
             error_cases=[],
             counter_examples=[]
         )
+        backend = get_backend(self.backend)
+        memo = self.memo if self.memo is not None else SubexpressionCache()
         for fec_id, fec in self.failed_cases.items():
             try:
-                counter_examples = self._generate_counter_example_single_fec(expr, fec, fec_id)
+                # the spec is lowered once, and its plan is executed for each FEC
+                # (specs are unhashable, so they are keyed by id, keeping a
+                # reference so that the id is not reused)
+                if id(expr) not in self.plans:
+                    self.plans[id(expr)] = (expr, SpecPlanner.lower(expr))
+                plan = self.plans[id(expr)][1]
+                counter_examples = self._generate_counter_example_single_fec(expr, plan, fec, fec_id, backend, memo)
             except Exception as e:
                 if multiprocessing.current_process()._identity: # if not main process
                     res.error_cases.append(fec_id)
@@ -139,23 +158,39 @@ class CounterExampleGenerator(SpecVisitor):
         return tuple(tuple(path) for path in paths)
     
     @staticmethod
-    def _generate_counter_example_single_fec(expr: Spec, fec: FEC, fec_id: Any) -> List[CounterExample]:
+    def _generate_counter_example_single_fec(expr: Spec, plan: VerificationPlan, fec: FEC, fec_id: Any, backend: AutomataBackend, memo: SubexpressionCache = None) -> List[CounterExample]:
         """
         Generate counter examples for a single FEC.
         """
         # 1. compute flows (start locations) that violates the spec
-        alphabet = fec.compute_alphabet()
-        alphabet.update(expr.accept(AlphabetScanner()))
-        constructor = FSTConstructor(alphabet, fec)
-        left_fsa = expr.p.accept(constructor)
-        right_fsa = expr.q.accept(constructor)
+        symbols = fec.get_symbol_table()
+        alphabet = set(fec.compute_alphabet())
+        spec_alphabet = expr.accept(AlphabetScanner())
+        alphabet.update(spec_alphabet if symbols is None else map(symbols.intern, spec_alphabet))
+        constructor = FSTConstructor(alphabet, fec, backend, symbols, memo=memo)
+        atomic_plan = plan.select(fec)
+        left_fsa, right_fsa = constructor.execute(atomic_plan)
+
+        # interned symbols are mapped back to location names for reporting
+        def extract_paths(fsa: FSA) -> List[List[str]]:
+            paths = backend.fst_extract_paths(fsa)
+            return paths if symbols is None else [symbols.names(path) for path in paths]
+
+        # the on-the-fly checks exit early when the spec holds
+        if atomic_plan.relation == 'eq':
+            witness = backend.fst_eq_witness(left_fsa, right_fsa)
+        else:
+            witness = backend.fst_subseteq_witness(left_fsa, right_fsa)
+        if witness is None:
+            return []
+        witness = tuple(witness if symbols is None else symbols.names(witness))
         
-        extra_fsa = fst_minus(left_fsa, right_fsa)
-        extra_paths = fst_extract_paths(extra_fsa)
+        extra_fsa = backend.fst_minus(left_fsa, right_fsa)
+        extra_paths = extract_paths(extra_fsa)
 
-        if isinstance(expr, SEqual):
-            missing_fsa = fst_minus(right_fsa, left_fsa)
-            missing_paths = fst_extract_paths(missing_fsa)
+        if atomic_plan.relation == 'eq':
+            missing_fsa = backend.fst_minus(right_fsa, left_fsa)
+            missing_paths = extract_paths(missing_fsa)
         else:
             missing_paths = []
 
@@ -172,17 +207,18 @@ class CounterExampleGenerator(SpecVisitor):
             # extract paths with this start location in 4 automata: X, Y, left, right
             flow_filter = P(symbol) + PStar(pDot)
             filter_fsa = flow_filter.accept(constructor)
-            before_paths = fst_extract_paths(fst_intersect(before_fsa, filter_fsa))
-            after_paths = fst_extract_paths(fst_intersect(after_fsa, filter_fsa))
-            left_paths = fst_extract_paths(fst_intersect(left_fsa, filter_fsa))
-            right_paths = fst_extract_paths(fst_intersect(right_fsa, filter_fsa))
+            before_paths = extract_paths(backend.fst_intersect(before_fsa, filter_fsa))
+            after_paths = extract_paths(backend.fst_intersect(after_fsa, filter_fsa))
+            left_paths = extract_paths(backend.fst_intersect(left_fsa, filter_fsa))
+            right_paths = extract_paths(backend.fst_intersect(right_fsa, filter_fsa))
             res.append(CounterExample(
                 fec_id=fec_id,
                 spec=str(expr),
                 before_paths=CounterExampleGenerator._to_hashable(before_paths),
                 after_paths=CounterExampleGenerator._to_hashable(after_paths),
                 left_paths=CounterExampleGenerator._to_hashable(left_paths),
-                right_paths=CounterExampleGenerator._to_hashable(right_paths)
+                right_paths=CounterExampleGenerator._to_hashable(right_paths),
+                witness=witness if witness and witness[0] == symbol else None
             ))
 
         return res
@@ -140,7 +140,7 @@ class PPredicate(Regex):
     """
     PPredicate is a Regex expression that represents a predicate over all locations
     in the network. It is used to represent a set of network locations that satisfy
-    a certain predicate.
+    a certain predicate, see the PPredicate of RIR.
     """
     field: str
     value: str
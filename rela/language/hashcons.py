@@ -0,0 +1,128 @@
+from typing import Any, Callable, Dict, Hashable, Tuple
+from dataclasses import fields, is_dataclass
+import copy
+import hashlib
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements hash-consing for the expression trees of the
+RIR and FE languages, and a base class for visitors that visit each shared
+node once. Expressions overload == to build specs, so they cannot be compared
+or hashed structurally; nodes are identified by their structural hash instead.
+"""
+
+def _is_node(value: Any) -> bool:
+    return (is_dataclass(value) and not isinstance(value, type)) or hasattr(value, 'accept')
+
+def _children(expr: Any) -> Tuple[str, ...]:
+    return tuple(f.name for f in fields(expr)) if is_dataclass(expr) else ()
+
+def _same(a: Any, b: Any) -> bool:
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+    return a is b
+
+
+class NodeTable:
+    """
+    A hash-consing table. Interning an expression returns an equivalent
+    expression in which structurally equal nodes are the same object, so that
+    visitors and caches keyed by node identity evaluate them once. The
+    structural hash of a node only depends on its type and fields, and is
+    stable across processes. Singleton nodes (e.g., preState) are hashed by
+    their type.
+    """
+    def __init__(self):
+        # structural hash -> canonical node
+        self._nodes: Dict[str, Any] = {}
+        # id(node) -> (node, structural hash), keeping a reference so that
+        # the id is not reused
+        self._hashes: Dict[int, Tuple[Any, str]] = {}
+
+    def hash(self, expr: Any) -> str:
+        """
+        Get the structural hash of an expression.
+        """
+        entry = self._hashes.get(id(expr))
+        if entry is None:
+            cls = type(expr)
+            canonical = (f'{cls.__module__}.{cls.__qualname__}',) + tuple(self._key(getattr(expr, name)) for name in _children(expr))
+            entry = (expr, hashlib.blake2b(repr(canonical).encode('utf8'), digest_size=16).hexdigest())
+            self._hashes[id(expr)] = entry
+        return entry[1]
+
+    def _key(self, value: Any) -> Any:
+        if isinstance(value, tuple):
+            return tuple(self._key(v) for v in value)
+        if _is_node(value):
+            return ('node', self.hash(value))
+        return value
+
+    def intern(self, expr: Any) -> Any:
+        """
+        Get the canonical node that is structurally equal to an expression.
+        """
+        h = self.hash(expr)
+        node = self._nodes.get(h)
+        if node is None:
+            node = self._rebuild(expr)
+            self._nodes[h] = node
+            self._hashes.setdefault(id(node), (node, h))
+        return node
+
+    def _canonical(self, value: Any) -> Any:
+        if isinstance(value, tuple):
+            return tuple(self._canonical(v) for v in value)
+        if _is_node(value):
+            return self.intern(value)
+        return value
+
+    def _rebuild(self, expr: Any) -> Any:
+        """
+        Get a node equal to the expression whose children are canonical,
+        reusing the expression if its children already are.
+        """
+        changes = {}
+        for name in _children(expr):
+            value = getattr(expr, name)
+            canonical = self._canonical(value)
+            if not _same(canonical, value):
+                changes[name] = canonical
+        if not changes:
+            return expr
+        # nodes are frozen, and their constructors validate arguments that
+        # are already valid, so the fields of a copy are replaced in place
+        node = copy.copy(expr)
+        for name, value in changes.items():
+            object.__setattr__(node, name, value)
+        return node
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+
+class MemoizingVisitor:
+    """
+    Base class for visitors whose result for a node only depends on the node.
+    Sub-expressions are visited with visit() instead of accept(), so a node
+    shared by several parents, e.g., after interning, is visited once.
+    """
+    def __init__(self):
+        self._results: Dict[Tuple, Tuple[Any, Any]] = {}
+
+    def visit(self, expr: Any) -> Any:
+        """
+        Visit an expression, or reuse the result of a previous visit.
+        """
+        return self._memoize(expr, (), lambda: expr.accept(self))
+
+    def _memoize(self, expr: Any, key: Tuple[Hashable, ...], compute: Callable[[], Any]) -> Any:
+        # expressions are unhashable, so they are memoized by id, keeping a
+        # reference so that the id is not reused
+        entry = self._results.get((id(expr),) + key)
+        if entry is None:
+            entry = (expr, compute())
+            self._results[(id(expr),) + key] = entry
+        return entry[1]
@@ -1,28 +1,29 @@
 from .rirvisitor import PropVisitor, RelVisitor, SpecVisitor
+from ..hashcons import MemoizingVisitor
 
 
-class AlphabetScanner(PropVisitor, RelVisitor, SpecVisitor):
+class AlphabetScanner(MemoizingVisitor, PropVisitor, RelVisitor, SpecVisitor):
     """
     Visitor that finds all symbols introduced by a expression.
     """
 
     def visit_s_equal(self, expr):
-        return expr.p.accept(self) | expr.q.accept(self)
+        return self.visit(expr.p) | self.visit(expr.q)
     
     def visit_s_subset_eq(self, expr):
-        return expr.p.accept(self) | expr.q.accept(self)
+        return self.visit(expr.p) | self.visit(expr.q)
     
     def visit_s_or(self, expr):
-        return expr.p.accept(self) | expr.q.accept(self)
+        return self.visit(expr.p) | self.visit(expr.q)
     
     def visit_s_and(self, expr):
-        return expr.p.accept(self) | expr.q.accept(self)
+        return self.visit(expr.p) | self.visit(expr.q)
     
     def visit_s_not(self, expr):
-        return expr.p.accept(self)
+        return self.visit(expr.p)
     
     def visit_s_ite(self, expr):
-        return expr.p.accept(self) | expr.q.accept(self)
+        return self.visit(expr.p) | self.visit(expr.q)
     
     def visit_p_symbol(self, expr):
         return set([expr.symbol])
@@ -46,43 +47,43 @@ class AlphabetScanner(PropVisitor, RelVisitor, SpecVisitor):
         return set()
     
     def visit_p_union(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_p_concat(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_p_star(self, expr):
-        return expr.arg.accept(self)
+        return self.visit(expr.arg)
     
     def visit_p_intersect(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_p_complement(self, expr):
-        return expr.arg.accept(self)
+        return self.visit(expr.arg)
     
     def visit_p_image(self, expr):
-        return expr.rel.accept(self) | expr.prop.accept(self)
+        return self.visit(expr.rel) | self.visit(expr.prop)
     
     def visit_p_reverse_image(self, expr):
-        return expr.rel.accept(self) | expr.prop.accept(self)
+        return self.visit(expr.rel) | self.visit(expr.prop)
     
     def visit_r_product(self, expr):
-        return expr.p.accept(self) | expr.q.accept(self)
+        return self.visit(expr.p) | self.visit(expr.q)
     
     def visit_r_identity(self, expr):
-        return expr.arg.accept(self)
+        return self.visit(expr.arg)
     
     def visit_r_union(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_r_concat(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_r_star(self, expr):
-        return expr.arg.accept(self)
+        return self.visit(expr.arg)
     
     def visit_r_union(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_r_empty_set(self, expr):
         return set()
@@ -91,7 +92,7 @@ class AlphabetScanner(PropVisitor, RelVisitor, SpecVisitor):
         return set()
     
     def visit_r_compose(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
+        return set.union(*[self.visit(arg) for arg in expr.args])
     
     def visit_r_priority_union(self, expr):
-        return set.union(*[arg.accept(self) for arg in expr.args])
\ No newline at end of file
+        return set.union(*[self.visit(arg) for arg in expr.args])
\ No newline at end of file
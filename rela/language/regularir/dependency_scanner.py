@@ -0,0 +1,96 @@
+from .rirvisitor import PropVisitor, RelVisitor
+from ..hashcons import MemoizingVisitor
+
+# the expression references preState or postState
+STATE = 'state'
+# the expression needs the alphabet, e.g., for predicates
+ALPHABET = 'alphabet'
+# the expression has wildcards or complements, which range over the alphabet
+# (see FSTConstructor for how they are built)
+WILDCARD = 'wildcard'
+
+_none = frozenset()
+
+
+class DependencyScanner(MemoizingVisitor, PropVisitor, RelVisitor):
+    """
+    Visitor that finds what the automaton of an expression depends on besides
+    the expression itself: the network state (STATE), the alphabet (ALPHABET)
+    and/or the range of wildcards (WILDCARD). Expressions without dependencies
+    build the same automaton for every FEC. Results are memoized per expression node, so a scanner can be
+    shared by all FECs verified against a spec.
+    """
+    def _union(self, *args):
+        res = _none
+        for arg in args:
+            res = res | self.visit(arg)
+        return res
+
+    def visit_p_symbol(self, expr):
+        return _none
+
+    def visit_p_predicate(self, expr):
+        return frozenset([ALPHABET])
+
+    def visit_p_neg_symbols(self, expr):
+        return frozenset([WILDCARD])
+
+    def visit_p_empty_set(self, expr):
+        return _none
+
+    def visit_p_epsilon(self, expr):
+        return _none
+
+    def visit_p_network_state_after(self, expr):
+        return frozenset([STATE])
+
+    def visit_p_network_state_before(self, expr):
+        return frozenset([STATE])
+
+    def visit_p_union(self, expr):
+        return self._union(*expr.args)
+
+    def visit_p_concat(self, expr):
+        return self._union(*expr.args)
+
+    def visit_p_star(self, expr):
+        return self._union(expr.arg)
+
+    def visit_p_intersect(self, expr):
+        return self._union(*expr.args)
+
+    def visit_p_complement(self, expr):
+        return self._union(expr.arg) | {WILDCARD}
+
+    def visit_p_image(self, expr):
+        return self._union(expr.prop, expr.rel)
+
+    def visit_p_reverse_image(self, expr):
+        return self._union(expr.prop, expr.rel)
+
+    def visit_r_product(self, expr):
+        return self._union(expr.p, expr.q)
+
+    def visit_r_identity(self, expr):
+        return self._union(expr.arg)
+
+    def visit_r_union(self, expr):
+        return self._union(*expr.args)
+
+    def visit_r_concat(self, expr):
+        return self._union(*expr.args)
+
+    def visit_r_star(self, expr):
+        return self._union(expr.arg)
+
+    def visit_r_empty_set(self, expr):
+        return _none
+
+    def visit_r_epsilon(self, expr):
+        return _none
+
+    def visit_r_compose(self, expr):
+        return self._union(*expr.args)
+
+    def visit_r_priority_union(self, expr):
+        return self._union(*expr.args)
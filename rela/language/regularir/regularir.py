@@ -259,7 +259,9 @@ class PPredicate(Prop):
     """
     PPredicate is a Prop expression that represents a predicate over all locations
     in the network. It is used to represent a set of network locations that satisfy
-    a certain predicate.
+    a certain predicate: the locations whose field (device, vrf, interface, or
+    group with a device-group mapping) of their Device|VRF|Interface name equals
+    the value. The value is matched exactly, not as a substring of the name.
     """
     field: str
     value: str
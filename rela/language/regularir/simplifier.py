@@ -0,0 +1,329 @@
+from dataclasses import fields, is_dataclass
+
+from .rirvisitor import PropVisitor, RelVisitor, SpecVisitor
+from .regularir import Prop, Rel, Spec, PSymbol, PNegSymbols, PConcat, PUnion, PStar, PIntersect, PComplement, PImage, PReverseImage, PEmptySet, PEpsilon, pEmptySet, pEpsilon
+from .regularir import RProduct, RIdentity, RConcat, RUnion, RCompose, RPriorityUnion, RStar, REmptySet, REpsilon, rEmptySet, rEpsilon
+from .regularir import SEqual, SSubsetEq, SOr, SAnd, SNot, SPrefixITE
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements an algebraic simplifier for RIR
+expressions. Specs are rewritten into equivalent but smaller expressions
+before automata construction, so each FEC needs fewer automata operations.
+"""
+
+def count_nodes(expr) -> int:
+    """
+    Count the nodes of an expression tree.
+    """
+    res = 1
+    if is_dataclass(expr):
+        for f in fields(expr):
+            value = getattr(expr, f.name)
+            for child in (value if isinstance(value, tuple) else (value,)):
+                if isinstance(child, (Prop, Rel, Spec)):
+                    res += count_nodes(child)
+    return res
+
+def _is_universe(expr: Prop) -> bool:
+    """
+    Check whether a Prop expression is .*, i.e., all paths.
+    """
+    return isinstance(expr, PStar) and isinstance(expr.arg, PNegSymbols) and len(expr.arg.neg_symbols) == 0
+
+def _in_alphabet(expr) -> bool:
+    """
+    Check whether the strings of an expression only use symbols of the
+    alphabet, i.e., it names no location. Wildcards and complements range
+    over the alphabet, so .* only absorbs such expressions, and only their
+    double complements are themselves.
+    """
+    if isinstance(expr, PSymbol):
+        return False
+    if is_dataclass(expr):
+        for f in fields(expr):
+            value = getattr(expr, f.name)
+            for child in (value if isinstance(value, tuple) else (value,)):
+                if isinstance(child, (Prop, Rel)) and not _in_alphabet(child):
+                    return False
+    return True
+
+def _unique(args: list) -> list:
+    """
+    Remove repeated references to the same sub-expression.
+    """
+    seen = set()
+    res = []
+    for arg in args:
+        if id(arg) not in seen:
+            seen.add(id(arg))
+            res.append(arg)
+    return res
+
+
+class RIRSimplifier(PropVisitor, RelVisitor, SpecVisitor):
+    """
+    Visitor that rewrites an expression into an equivalent, simplified one:
+        - n-ary nodes are flattened, e.g., (a + b) + c -> a + b + c
+        - empty sets and epsilons are folded, e.g., a | 0 -> a, a 0 -> 0
+        - identities are fused, e.g., I(a) o I(b) -> I(a ∩ b),
+          I(a) | I(b) -> I(a | b), I(a) I(b) -> I(a b)
+        - images under identities become intersections, e.g.,
+          X ▶ I(d) -> X ∩ d, X ▶ (I(a) o R) -> (X ∩ a) ▶ R
+        - double complements and negations are dropped, and .* is dropped
+          from intersections and absorbs unions, where the other arguments
+          name no location (see _in_alphabet)
+    Unchanged sub-expressions are returned as is, and results are memoized
+    per expression node, so subexpressions shared within or across specs are
+    simplified once, and simplifying the same spec twice returns the same
+    expression. The numbers of nodes before and after simplification are
+    accumulated in nodes_before and nodes_after, once per simplified spec.
+    """
+    def __init__(self):
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self._memo = {}
+        self._counted = set()
+
+    def simplify(self, expr):
+        """
+        Simplify an expression.
+        """
+        res = self._simplify(expr)
+        if id(expr) not in self._counted:
+            self.nodes_before += count_nodes(expr)
+            self.nodes_after += count_nodes(res)
+            self._counted.add(id(expr))
+        return res
+
+    def _simplify(self, expr):
+        entry = self._memo.get(id(expr))
+        if entry is None:
+            # expressions are unhashable, so they are memoized by id, keeping
+            # a reference so that the id is not reused
+            entry = (expr, expr.accept(self))
+            self._memo[id(expr)] = entry
+        return entry[1]
+
+    def _args(self, expr, cls) -> list:
+        """
+        Simplify the arguments of an n-ary node, flattening nested nodes of
+        the same class.
+        """
+        res = []
+        for arg in expr.args:
+            arg = self._simplify(arg)
+            if isinstance(arg, cls):
+                res.extend(arg.args)
+            else:
+                res.append(arg)
+        return res
+
+    @staticmethod
+    def _rebuild(expr, cls, args: list):
+        """
+        Build an n-ary node, reusing the original node if nothing changed.
+        """
+        if len(args) == len(expr.args) and all(a is b for a, b in zip(args, expr.args)):
+            return expr
+        return args[0] if len(args) == 1 else cls(*args)
+
+    def visit_s_equal(self, expr):
+        p, q = self._simplify(expr.p), self._simplify(expr.q)
+        return expr if p is expr.p and q is expr.q else SEqual(p, q)
+
+    def visit_s_subset_eq(self, expr):
+        p, q = self._simplify(expr.p), self._simplify(expr.q)
+        return expr if p is expr.p and q is expr.q else SSubsetEq(p, q)
+
+    def visit_s_or(self, expr):
+        p, q = self._simplify(expr.p), self._simplify(expr.q)
+        return expr if p is expr.p and q is expr.q else SOr(p, q)
+
+    def visit_s_and(self, expr):
+        p, q = self._simplify(expr.p), self._simplify(expr.q)
+        return expr if p is expr.p and q is expr.q else SAnd(p, q)
+
+    def visit_s_not(self, expr):
+        p = self._simplify(expr.p)
+        if isinstance(p, SNot):
+            return p.p
+        return expr if p is expr.p else SNot(p)
+
+    def visit_s_ite(self, expr):
+        p, q = self._simplify(expr.p), self._simplify(expr.q)
+        return expr if p is expr.p and q is expr.q else SPrefixITE(p, q, expr.guard)
+
+    def visit_p_symbol(self, expr):
+        return expr
+
+    def visit_p_predicate(self, expr):
+        return expr
+
+    def visit_p_neg_symbols(self, expr):
+        return expr
+
+    def visit_p_empty_set(self, expr):
+        return expr
+
+    def visit_p_epsilon(self, expr):
+        return expr
+
+    def visit_p_network_state_after(self, expr):
+        return expr
+
+    def visit_p_network_state_before(self, expr):
+        return expr
+
+    def visit_p_union(self, expr):
+        args = _unique([arg for arg in self._args(expr, PUnion) if not isinstance(arg, PEmptySet)])
+        if len(args) == 0:
+            return pEmptySet
+        for arg in args:
+            if _is_universe(arg) and all(_in_alphabet(other) for other in args):
+                return arg
+        return self._rebuild(expr, PUnion, args)
+
+    def visit_p_concat(self, expr):
+        args = [arg for arg in self._args(expr, PConcat) if not isinstance(arg, PEpsilon)]
+        if any(isinstance(arg, PEmptySet) for arg in args):
+            return pEmptySet
+        if len(args) == 0:
+            return pEpsilon
+        return self._rebuild(expr, PConcat, args)
+
+    def visit_p_star(self, expr):
+        arg = self._simplify(expr.arg)
+        if isinstance(arg, (PEmptySet, PEpsilon)):
+            return pEpsilon
+        if isinstance(arg, PStar):
+            return arg
+        return expr if arg is expr.arg else PStar(arg)
+
+    def visit_p_intersect(self, expr):
+        args = _unique(self._args(expr, PIntersect))
+        if any(_in_alphabet(arg) and not _is_universe(arg) for arg in args):
+            args = [arg for arg in args if not _is_universe(arg)]
+        if any(isinstance(arg, PEmptySet) for arg in args):
+            return pEmptySet
+        if all(_is_universe(arg) for arg in args):
+            return args[0] if args else PStar(PNegSymbols())
+        return self._rebuild(expr, PIntersect, args)
+
+    def visit_p_complement(self, expr):
+        arg = self._simplify(expr.arg)
+        if isinstance(arg, PComplement) and _in_alphabet(arg.arg):
+            return arg.arg
+        return expr if arg is expr.arg else PComplement(arg)
+
+    def _intersect(self, *args) -> Prop:
+        return PIntersect(*args).accept(self)
+
+    def visit_p_image(self, expr):
+        prop, rel = self._simplify(expr.prop), self._simplify(expr.rel)
+        if isinstance(prop, PEmptySet) or isinstance(rel, REmptySet):
+            return pEmptySet
+        if isinstance(rel, RIdentity):
+            return self._intersect(prop, rel.arg)
+        if isinstance(rel, RCompose) and isinstance(rel.args[0], RIdentity):
+            # X ▶ (I(a) o R) = (X ∩ a) ▶ R
+            rest = rel.args[1:]
+            return PImage(self._intersect(prop, rel.args[0].arg), rest[0] if len(rest) == 1 else RCompose(*rest)).accept(self)
+        if isinstance(rel, RCompose) and isinstance(rel.args[-1], RIdentity):
+            # X ▶ (R o I(b)) = (X ▶ R) ∩ b
+            rest = rel.args[:-1]
+            return self._intersect(PImage(prop, rest[0] if len(rest) == 1 else RCompose(*rest)).accept(self), rel.args[-1].arg)
+        return expr if prop is expr.prop and rel is expr.rel else PImage(prop, rel)
+
+    def visit_p_reverse_image(self, expr):
+        prop, rel = self._simplify(expr.prop), self._simplify(expr.rel)
+        if isinstance(prop, PEmptySet) or isinstance(rel, REmptySet):
+            return pEmptySet
+        if isinstance(rel, RIdentity):
+            return self._intersect(prop, rel.arg)
+        if isinstance(rel, RCompose) and isinstance(rel.args[-1], RIdentity):
+            # (R o I(b)) ◀ X = R ◀ (X ∩ b)
+            rest = rel.args[:-1]
+            return PReverseImage(self._intersect(prop, rel.args[-1].arg), rest[0] if len(rest) == 1 else RCompose(*rest)).accept(self)
+        if isinstance(rel, RCompose) and isinstance(rel.args[0], RIdentity):
+            # (I(a) o R) ◀ X = (R ◀ X) ∩ a
+            rest = rel.args[1:]
+            return self._intersect(PReverseImage(prop, rest[0] if len(rest) == 1 else RCompose(*rest)).accept(self), rel.args[0].arg)
+        return expr if prop is expr.prop and rel is expr.rel else PReverseImage(prop, rel)
+
+    def visit_r_product(self, expr):
+        p, q = self._simplify(expr.p), self._simplify(expr.q)
+        if isinstance(p, PEmptySet) or isinstance(q, PEmptySet):
+            return rEmptySet
+        if isinstance(p, PEpsilon) and isinstance(q, PEpsilon):
+            return rEpsilon
+        return expr if p is expr.p and q is expr.q else RProduct(p, q)
+
+    def visit_r_identity(self, expr):
+        arg = self._simplify(expr.arg)
+        if isinstance(arg, PEmptySet):
+            return rEmptySet
+        if isinstance(arg, PEpsilon):
+            return rEpsilon
+        return expr if arg is expr.arg else RIdentity(arg)
+
+    def visit_r_union(self, expr):
+        args = _unique([arg for arg in self._args(expr, RUnion) if not isinstance(arg, REmptySet)])
+        # I(a) | I(b) = I(a | b)
+        identities = [arg for arg in args if isinstance(arg, RIdentity)]
+        if len(identities) > 1:
+            fused = RIdentity(PUnion(*[arg.arg for arg in identities]).accept(self))
+            args = [fused if arg is identities[0] else arg for arg in args if arg is identities[0] or not isinstance(arg, RIdentity)]
+        if len(args) == 0:
+            return rEmptySet
+        return self._rebuild(expr, RUnion, args)
+
+    def visit_r_concat(self, expr):
+        args = []
+        for arg in self._args(expr, RConcat):
+            if isinstance(arg, REpsilon):
+                continue
+            if isinstance(arg, RIdentity) and len(args) > 0 and isinstance(args[-1], RIdentity):
+                # I(a) I(b) = I(a b)
+                args[-1] = RIdentity(PConcat(args[-1].arg, arg.arg).accept(self))
+            else:
+                args.append(arg)
+        if any(isinstance(arg, REmptySet) for arg in args):
+            return rEmptySet
+        if len(args) == 0:
+            return rEpsilon
+        return self._rebuild(expr, RConcat, args)
+
+    def visit_r_star(self, expr):
+        arg = self._simplify(expr.arg)
+        if isinstance(arg, (REmptySet, REpsilon)):
+            return rEpsilon
+        if isinstance(arg, RStar):
+            return arg
+        return expr if arg is expr.arg else RStar(arg)
+
+    def visit_r_empty_set(self, expr):
+        return expr
+
+    def visit_r_epsilon(self, expr):
+        return expr
+
+    def visit_r_compose(self, expr):
+        args = []
+        for arg in self._args(expr, RCompose):
+            if isinstance(arg, RIdentity) and len(args) > 0 and isinstance(args[-1], RIdentity):
+                # I(a) o I(b) = I(a ∩ b)
+                args[-1] = RIdentity(self._intersect(args[-1].arg, arg.arg))
+            else:
+                args.append(arg)
+        if any(isinstance(arg, REmptySet) for arg in args):
+            return rEmptySet
+        return self._rebuild(expr, RCompose, args)
+
+    def visit_r_priority_union(self, expr):
+        args = [arg for arg in self._args(expr, RPriorityUnion) if not isinstance(arg, REmptySet)]
+        if len(args) == 0:
+            return rEmptySet
+        return self._rebuild(expr, RPriorityUnion, args)
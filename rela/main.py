@@ -1,37 +1,198 @@
-from typing import List
+from typing import Callable, Collection, Dict, List, Tuple
 import json
+import time
 import dataclasses
+from dataclasses import dataclass, field
+from functools import partial
+from tqdm import tqdm
 
-from .networkmodel.relagraphformat.graphnc import RelaGraphNC
+from .networkmodel.relagraphformat.graphnc import RelaGraphNC, LazyRelaGraphNC
+from .networkmodel.relagraphformat.binary import BinaryRelaGraphNC
+from .networkmodel.relagraphformat.csrgraph import PRECISIONS
+from .networkmodel.networkchange import NetworkChange
+from .networkmodel.symboltable import SymbolTable
+from .networkmodel.attributeindex import AttributeIndex
+from .automata import AutomataCache, SubexpressionCache
 from .verification.specverifier import SpecVerifier
-from .verification.verificationresult import VerificationResult
+from .verification.verificationresult import VerificationResult, TierReport
+from .verification.dedup import fec_fingerprint
 from .counterexample.counterexample import CounterExampleGenerationResult, CounterExampleGenerator
 from .language.regularir import Spec
+from .language.regularir.simplifier import RIRSimplifier
+from .language.hashcons import NodeTable
+from .scheduler import estimate_cost
 
-def verify_network_change(spec: Spec, file: str, format: str = 'graph', precision: str = 'device', alg: str = 'default', mapping_file: str = None, selected_indices: list=None) -> VerificationResult:
+def load_network_change(file: str, format: str = 'graph', precision: str = 'device', mapping_file: str = None, stream: bool = False, **kwargs) -> NetworkChange:
+    """
+    Load a network change in the 'graph' (JSON) or 'binary' format, see
+    convert_json. A streamed network change in JSON is read FEC by FEC while
+    it is iterated. Other arguments, e.g., a shared symbol table, are passed
+    to the loader.
+    """
     if format == 'graph':
-        state = RelaGraphNC.from_json(file, precision, mapping_file)
-    else:
-        raise ValueError(f"Input format {format} not implemented")
+        loader = LazyRelaGraphNC if stream else RelaGraphNC
+        return loader.from_json(file, precision, mapping_file, **kwargs)
+    elif format == 'binary':
+        return BinaryRelaGraphNC.from_file(file, precision, mapping_file, **kwargs)
+    raise ValueError(f"Input format {format} not implemented")
 
-    if alg == 'default':
-        verifier = SpecVerifier(state, selected_indices)
-    else:
+
+def verify_network_change(spec: Spec, file: str, format: str = 'graph', precision: str = 'device', alg: str = 'default', mapping_file: str = None, selected_indices: list=None, backend: str = 'hfst', dedup: bool = True, n_workers: int = 1, stream: bool = False, tiers: List[str] = None, sound_precisions: Collection[str] = ()) -> VerificationResult:
+    """
+    Verify a spec on a single file. If coarser precisions are given as
+    tiers, the FECs are verified at the coarsest one first, and only the
+    FECs that are not passed are verified again at the next finer one, up
+    to the given precision, see verify_tiers. The tiers must be among the
+    sound precisions of the spec, and the network change is loaded once, at
+    the given precision.
+    """
+    if alg != 'default':
         raise ValueError(f"Verification alg {alg} not implemented")
+    if tiers and stream:
+        raise ValueError("Tiered verification cannot stream a network change, as it is viewed at each tier")
+    check_tiers(tiers or (), sound_precisions)
+
+    state = load_network_change(file, format, precision, mapping_file, stream)
+
+    if not tiers:
+        verifier = SpecVerifier(state, selected_indices, backend, dedup=dedup, n_workers=n_workers)
+        return spec.accept(verifier)
+
+    # the tiers share the caches, and the spec is lowered once
+    cache, memo, simplifier, nodes, plans = AutomataCache(), SubexpressionCache(), RIRSimplifier(), NodeTable(), {}
+    def verifier(view: NetworkChange, selected: set) -> SpecVerifier:
+        return SpecVerifier(view, selected, backend, cache, memo, dedup=dedup, simplifier=simplifier, nodes=nodes, n_workers=n_workers, plans=plans)
+    return verify_tiers(spec, state, tiers, verifier, selected_indices, sound_precisions=sound_precisions)
+
+
+def check_tiers(tiers: Collection[str], sound_precisions: Collection[str]):
+    """
+    Check that the spec is sound at each tier, i.e., that the tiers are
+    among the sound precisions declared for the spec, see specs/dict.py.
+    """
+    unsound = [tier for tier in tiers if tier not in sound_precisions]
+    if unsound:
+        raise ValueError(f"The spec is not sound at precisions {unsound}, only at {list(sound_precisions)}")
+
+
+def verify_tiers(spec: Spec, state: NetworkChange, tiers: List[str], verifier: Callable[[NetworkChange, set], SpecVerifier], selected_indices: list = None, indices: Dict[str, AttributeIndex] = None, sound_precisions: Collection[str] = ()) -> VerificationResult:
+    """
+    Verify a spec on views of a network change (see RelaGraphNC.view) at
+    each of the coarser precisions of the tiers, from the coarsest, and then
+    on the network change itself. Each tier only verifies the selected FECs
+    that no coarser tier has passed, so the automata of the finer
+    precisions are only built for FECs that fail or are skipped at the
+    coarser ones. This is sound if a FEC that passes the spec at a tier also
+    passes it at the finer precisions, so the tiers must be among the sound
+    precisions declared for the spec. The verifier of a tier is made by verifier(view, selected
+    indices), and the views of the tiers use the given attribute indices,
+    if any. Returns the result in the same format as verify_network_change,
+    with a TierReport of each tier.
+    """
+    check_tiers(tiers, sound_precisions)
+    if any(tier not in PRECISIONS or PRECISIONS.index(tier) <= PRECISIONS.index(state.precision) for tier in tiers):
+        raise ValueError(f"Tiers {tiers} should be coarser than the precision of the network change: {state.precision}")
+    if state.count_fec() == 0:
+        return spec.accept(verifier(state, selected_indices))
+    indices = indices or {}
+
+    selected = set(range(state.count_fec()))
+    if selected_indices is not None:
+        selected.intersection_update(selected_indices)
+    precisions = sorted(set(tiers), key=PRECISIONS.index, reverse=True) + [state.precision]
+    passed = []
+    reports = []
+    hits, misses = 0, 0
+    for k, precision in enumerate(precisions):
+        report = TierReport(precision, len(selected))
+        reports.append(report)
+        # the last tier records the verdicts of all FECs
+        if not selected and k < len(precisions) - 1:
+            continue
+        start = time.perf_counter()
+        res = spec.accept(verifier(state.view(precision, indices.get(precision)), selected))
+        report.time = time.perf_counter() - start
+        report.n_passed = len(res.passed_cases)
+        report.n_failed = len(res.failed_cases)
+        report.n_skipped = report.n_verified - report.n_passed - report.n_failed
+        hits, misses = hits + res.cache_hits, misses + res.cache_misses
+        passed += res.passed_cases
+        selected = selected.difference(res.passed_cases)
+
+    # FECs passed at coarser tiers are skipped by the last one
+    passed_cases = set(passed)
+    res.passed_cases = sorted(passed_cases)
+    res.skipped_cases = [i for i in res.skipped_cases if i not in passed_cases]
+    res.n_passed, res.n_skipped = len(res.passed_cases), len(res.skipped_cases)
+    res.cache_hits, res.cache_misses = hits, misses
+    res.tiers = reports
+    return res
+
+
+def fingerprint_network_change(spec: Spec, file: str, format: str = 'graph', precision: str = 'device', mapping_file: str = None, selected_indices: list = None) -> Tuple[str, int, Dict[int, str], Dict[int, int]]:
+    """
+    Compute the fingerprints of the (selected) FECs in a single file, for
+    deduplicating verification across files. Returns the name of the network
+    change, its number of FECs, and the fingerprint and the estimated
+    verification cost of each FEC by index. FECs that cannot be fingerprinted
+    are left out.
+    """
+    state = load_network_change(file, format, precision, mapping_file)
+
+    return _fingerprint(spec, state, selected_indices)
+
+
+def _fingerprint(spec: Spec, state: NetworkChange, selected_indices: list = None) -> Tuple[str, int, Dict[int, str], Dict[int, int]]:
+    fingerprints = {}
+    costs = {}
+    for i, fec in enumerate(state.iterate()):
+        if selected_indices is not None and i not in selected_indices:
+            continue
+        try:
+            fingerprints[i] = fec_fingerprint(spec, fec)
+            costs[i] = estimate_cost(spec, fec)
+        except Exception:
+            fingerprints.pop(i, None)
+            continue
+    return state.get_name(), state.count_fec(), fingerprints, costs
+
+
+def estimate_network_change(spec: Spec, file: str, format: str = 'graph', precision: str = 'device', mapping_file: str = None, selected_indices: list = None) -> Tuple[str, int, Dict[int, int]]:
+    """
+    Estimate the cost of verifying the (selected) FECs in a single file, for
+    scheduling verification across files. Returns the name of the network
+    change, its number of FECs, and the estimated cost of each FEC by index.
+    """
+    state = load_network_change(file, format, precision, mapping_file)
+
+    return _estimate(spec, state, selected_indices)
+
 
-    return spec.accept(verifier)
+def _estimate(spec: Spec, state: NetworkChange, selected_indices: list = None) -> Tuple[str, int, Dict[int, int]]:
+    costs = {}
+    for i, fec in enumerate(state.iterate()):
+        if selected_indices is not None and i not in selected_indices:
+            continue
+        try:
+            costs[i] = estimate_cost(spec, fec)
+        except Exception:
+            costs[i] = 0 # the FEC will be skipped
 
+    return state.get_name(), state.count_fec(), costs
 
-def generate_counterexamples(spec: Spec, file: str, format: str = 'graph', precision: str = 'device', indices: List[int] = [], out_file: str = None, mapping_file: str = None) -> CounterExampleGenerationResult:
+
+def generate_counterexamples(spec: Spec, file: str, format: str = 'graph', precision: str = 'device', indices: List[int] = [], out_file: str = None, mapping_file: str = None, backend: str = 'hfst') -> CounterExampleGenerationResult:
     """
     Generate counter examples for failed cases in a single file.
     """
-    if format == 'graph':
-        state = RelaGraphNC.from_json(file, precision, mapping_file)
+    state = load_network_change(file, format, precision, mapping_file)
 
     failed_cases = {(file, i) : state.slices[i] for i in indices}
-    generator = CounterExampleGenerator(failed_cases)
+    generator = CounterExampleGenerator(failed_cases, backend)
+    return _generate(spec, generator, out_file)
+
 
+def _generate(spec: Spec, generator: CounterExampleGenerator, out_file: str = None) -> CounterExampleGenerationResult:
     result = spec.accept(generator)
 
     if out_file is not None:
@@ -39,3 +200,130 @@ def generate_counterexamples(spec: Spec, file: str, format: str = 'graph', preci
             json.dump([dataclasses.asdict(c) for c in result.counter_examples], f, indent=2)
 
     return result
+
+
+@dataclass
+class WorkerContext:
+    """
+    The state of a worker process, loaded once by init_worker and shared by
+    all tasks of the worker, so that tasks only carry file names and FEC
+    indices: the spec and the options of the tasks, the device-group
+    mapping, and the symbol table, attribute indices, automata caches and
+    spec plans shared by all files loaded by the worker. Files are loaded at
+    the precision of the context, and viewed at the coarser tiers, if any.
+    The most recently loaded network change is kept, so that the batches of
+    a file that run on the same worker load it once.
+    """
+    spec: Spec
+    format: str = 'graph'
+    precision: str = 'device'
+    mapping_file: str = None
+    backend: str = 'hfst'
+    alg: str = 'default'
+    tiers: tuple = ()
+    sound_precisions: tuple = ()
+    mapping: dict = None
+    symbols: SymbolTable = field(default_factory=SymbolTable)
+    index: AttributeIndex = None
+    cache: AutomataCache = field(default_factory=AutomataCache)
+    memo: SubexpressionCache = field(default_factory=SubexpressionCache)
+    simplifier: RIRSimplifier = field(default_factory=RIRSimplifier)
+    nodes: NodeTable = field(default_factory=NodeTable)
+    plans: dict = field(default_factory=dict)
+    # the attribute indices of the views at the tiers, by precision
+    indices: dict = field(default_factory=dict)
+    # the most recently loaded file and its network change, and the time
+    # spent by the last call of load, which is 0 if it was kept
+    loaded: Tuple[str, NetworkChange] = field(default=None, repr=False)
+    load_time: float = 0.0
+
+    def __post_init__(self):
+        check_tiers(self.tiers, self.sound_precisions)
+        if self.mapping is None and self.mapping_file is not None:
+            with open(self.mapping_file) as f:
+                self.mapping = json.load(f)
+        if self.index is None:
+            self.index = AttributeIndex(self.symbols, self.mapping, grouped=self.precision == 'devicegroup')
+        if 'devicegroup' in self.tiers and 'devicegroup' not in self.indices:
+            self.indices['devicegroup'] = AttributeIndex(self.symbols, self.mapping, grouped=True)
+
+    def load(self, file: str) -> NetworkChange:
+        """
+        Load a network change, sharing the symbol table and attribute index
+        of the worker, or get it if it was the last one loaded.
+        """
+        if self.loaded is not None and self.loaded[0] == file:
+            self.load_time = 0.0
+            return self.loaded[1]
+        # release the previous network change before loading the next one
+        self.loaded = None
+        start = time.perf_counter()
+        state = load_network_change(file, self.format, self.precision, mapping=self.mapping, symbols=self.symbols, index=self.index)
+        self.load_time = time.perf_counter() - start
+        self.loaded = (file, state)
+        return state
+
+    def verifier(self, state: NetworkChange, selected_indices: list = None, dedup: bool = True) -> SpecVerifier:
+        """
+        Get a verifier of a network change that shares the caches of the
+        worker.
+        """
+        return SpecVerifier(state, selected_indices, self.backend, self.cache, self.memo, dedup=dedup, simplifier=self.simplifier, nodes=self.nodes, plans=self.plans)
+
+
+# the context of this worker process, set by init_worker
+_worker: WorkerContext = None
+
+def init_worker(spec: Spec, format: str = 'graph', precision: str = 'device', mapping_file: str = None, backend: str = 'hfst', alg: str = 'default', lock = None, tiers: tuple = (), sound_precisions: tuple = ()):
+    """
+    Initialize a worker process of a ProcessPoolExecutor for the *_in_worker
+    tasks. The lock is the tqdm lock of the parent process, if any, and the
+    tiers are the coarser precisions of tiered verification, if any, which
+    must be among the sound precisions of the spec.
+    """
+    global _worker
+    if lock is not None:
+        tqdm.set_lock(lock)
+    _worker = WorkerContext(spec, format, precision, mapping_file, backend, alg, tuple(tiers), tuple(sound_precisions))
+
+
+def verify_in_worker(file: str, selected_indices: list = None, dedup: bool = True) -> VerificationResult:
+    """
+    verify_network_change in a worker process initialized by init_worker.
+    """
+    state = _worker.load(file)
+    if _worker.alg != 'default':
+        raise ValueError(f"Verification alg {_worker.alg} not implemented")
+    load_time = _worker.load_time
+    if _worker.tiers:
+        res = verify_tiers(_worker.spec, state, _worker.tiers, partial(_worker.verifier, dedup=dedup), selected_indices, _worker.indices, _worker.sound_precisions)
+    else:
+        res = _worker.spec.accept(_worker.verifier(state, selected_indices, dedup))
+    res.load_time = load_time
+    return res
+
+
+def fingerprint_in_worker(file: str, selected_indices: list = None) -> Tuple[str, int, Dict[int, str], Dict[int, int]]:
+    """
+    fingerprint_network_change in a worker process initialized by init_worker.
+    """
+    return _fingerprint(_worker.spec, _worker.load(file), selected_indices)
+
+
+def estimate_in_worker(file: str, selected_indices: list = None) -> Tuple[str, int, Dict[int, int]]:
+    """
+    estimate_network_change in a worker process initialized by init_worker.
+    """
+    return _estimate(_worker.spec, _worker.load(file), selected_indices)
+
+
+def generate_counterexamples_in_worker(file: str, indices: List[int], out_file: str = None) -> CounterExampleGenerationResult:
+    """
+    generate_counterexamples in a worker process initialized by init_worker.
+    """
+    state = _worker.load(file)
+    failed_cases = {(file, i) : state.slices[i] for i in indices}
+    generator = CounterExampleGenerator(failed_cases, _worker.backend, _worker.memo, _worker.plans)
+    res = _generate(_worker.spec, generator, out_file)
+    res.load_time = _worker.load_time
+    return res
@@ -1 +1,3 @@
-from .simpleimpl.simpleimplementation import SimpleNC
\ No newline at end of file
+from .simpleimpl.simpleimplementation import SimpleNC
+from .symboltable import SymbolTable
+from .attributeindex import AttributeIndex
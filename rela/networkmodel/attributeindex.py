@@ -0,0 +1,91 @@
+from typing import Dict, Set, Union
+
+from .symboltable import SymbolTable
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements the inverted index of location attributes
+used to resolve predicates without scanning the alphabet.
+"""
+
+# the fields of a location name Device|VRF|Interface, in order
+LOCATION_FIELDS = ('device', 'vrf', 'interface')
+# the field of the device group of a location, given by a device-group mapping
+GROUP_FIELD = 'group'
+# the fields that predicates can match
+PREDICATE_FIELDS = LOCATION_FIELDS + (GROUP_FIELD,)
+
+
+def location_fields(name: str, mapping: Dict[str, str] = None, grouped: bool = False) -> Dict[str, str]:
+    """
+    Split a location name into its Device|VRF|Interface fields, and add the
+    device group of the location if a device-group mapping is given. If the
+    location is already collapsed into a device group (grouped), the first
+    field is the group. Names with fewer parts, e.g., sinks, have fewer fields.
+    """
+    fields = dict(zip(LOCATION_FIELDS, name.split('|')))
+    if grouped:
+        fields[GROUP_FIELD] = fields.pop('device')
+    elif mapping is not None:
+        device = fields['device']
+        fields[GROUP_FIELD] = mapping.get(device, device)
+    return fields
+
+
+class AttributeIndex:
+    """
+    An inverted index from location attributes to interned symbols, shared by
+    all FECs of a network change like its symbol table. Location names are
+    split into their Device|VRF|Interface fields, and the device group of a
+    location is looked up in the device-group mapping, if one is given. If
+    locations are already collapsed into device groups (grouped), the first
+    field is the group, and a device matches the locations of its group.
+
+    The table can grow after the index is created, e.g., when spec symbols
+    are interned, so new symbols are indexed on the next lookup.
+    """
+    def __init__(self, symbols: SymbolTable, mapping: Dict[str, str] = None, grouped: bool = False):
+        self.symbols = symbols
+        self.mapping = mapping
+        self.grouped = grouped
+        self._index: Dict[str, Dict[str, Set[int]]] = {}
+        self._n_indexed = 0
+
+    def _fields(self, name: str) -> Dict[str, str]:
+        """
+        Get the fields of a location name.
+        """
+        return location_fields(name, self.mapping, self.grouped)
+
+    def _update(self):
+        """
+        Index the symbols interned since the last update.
+        """
+        for symbol in range(self._n_indexed, len(self.symbols)):
+            for field, value in self._fields(self.symbols.name(symbol)).items():
+                self._index.setdefault(field, {}).setdefault(value, set()).add(symbol)
+        self._n_indexed = len(self.symbols)
+
+    def is_indexed(self, field: str) -> bool:
+        """
+        Check whether a field can be looked up in the index.
+        """
+        field = field.lower()
+        if field == GROUP_FIELD:
+            return self.grouped or self.mapping is not None
+        return field in LOCATION_FIELDS
+
+    def lookup(self, field: str, value: str) -> Union[Set[int], None]:
+        """
+        Get the symbols whose field has the given value, or None if the field
+        is not indexed. The returned set must not be modified.
+        """
+        if not self.is_indexed(field):
+            return None
+        field = field.lower()
+        self._update()
+        if self.grouped and field == 'device':
+            field, value = GROUP_FIELD, self.mapping.get(value, value)
+        return self._index.get(field, {}).get(value, set())
@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Any, Union
 
 from .networkpath import NetworkPath
 from .forwardinggraph import ForwardingGraph
+from .symboltable import SymbolTable
+from .attributeindex import AttributeIndex
 
 
 class FEC(ABC):
@@ -31,6 +33,20 @@ class FEC(ABC):
         """
         raise NotImplementedError
 
+    def get_symbol_table(self) -> Union[SymbolTable, None]:
+        """
+        Get the symbol table that interns the locations of the FEC, or None if
+        locations are given by their names.
+        """
+        return None
+
+    def get_attribute_index(self) -> Union[AttributeIndex, None]:
+        """
+        Get the index from location attributes to the symbols of the FEC, or
+        None if locations are not indexed.
+        """
+        return None
+
 
 class PathFEC(FEC):
     """
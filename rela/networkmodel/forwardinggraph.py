@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Set, Dict
+from typing import Any, Set, Dict, Iterator, Tuple
 
 class ForwardingGraph(ABC):
     """
@@ -26,6 +26,15 @@ class ForwardingGraph(ABC):
         """
         raise NotImplementedError
     
+    def get_edges(self, node: Any) -> Iterator[Tuple[Any, Any]]:
+        """
+        Iterate over the out edges of a node as (next_node, edge) pairs,
+        without building the dictionary of get_out_edges.
+        """
+        for next_node, edges in self.get_out_edges(node).items():
+            for edge in edges:
+                yield next_node, edge
+
     @abstractmethod
     def is_source(self, node: Any) -> bool:
         """
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+import itertools
 from typing import Dict, Iterator, List, Union, Any
 
 from .networkpath import NetworkPath
@@ -31,6 +32,14 @@ class NetworkChange(ABC):
         """
         raise NotImplementedError
     
+    def iterate_range(self, start: int, stop: int) -> Iterator[FEC]:
+        """
+        Iterate the FECs #start to #stop - 1. By default, the FECs before
+        start are iterated and dropped; network changes with random access
+        override this.
+        """
+        return itertools.islice(self.iterate(), start, stop)
+
     @abstractmethod
     def count_fec(self) -> int:
         """
@@ -2,5 +2,6 @@ from .devicegrouplevel import RelaDeviceGroupLevelForwardingGraph
 from .devicelevel import RelaDeviceLevelForwardingGraph
 from .linklevel import RelaLinkLevelForwardingGraph
 from .graphfec import RelaGraphFEC
-from .graphnc import RelaGraphNC
+from .graphnc import RelaGraphNC, LazyRelaGraphNC
+from .binary import BinaryRelaGraphNC, convert_json
 from .iptraffickey import IpTrafficKey
\ No newline at end of file
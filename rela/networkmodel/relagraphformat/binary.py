@@ -0,0 +1,357 @@
+from __future__ import annotations
+from array import array
+import collections.abc
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from ..networkchange import NetworkChange
+from ..forwardinggraph import ForwardingGraph
+from ..symboltable import SymbolTable, Location
+from ..attributeindex import AttributeIndex
+
+from .graphfec import RelaGraphFEC
+from .iptraffickey import IpTrafficKey
+from .jsonstream import JSONArrayReader
+from .devicegrouplevel import RelaDeviceGroupLevelForwardingGraph, DeviceGroupRewrite
+from .devicelevel import RelaDeviceLevelForwardingGraph
+from .linklevel import RelaLinkLevelForwardingGraph
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements a compact binary format of network changes
+in Rela format, a converter from the JSON format, and a network change that
+memory-maps a binary file. A binary file is converted once and can be
+verified at any precision, without parsing JSON again.
+
+Layout of a file, in little-endian byte order:
+    header          magic, version, number of FECs, number of strings
+    FEC index       u64[n_fecs + 1], offsets of the FEC records in words
+    FEC records     u32 words, see _encode_fec
+    string offsets  u32[n_strings + 1], byte offsets into the string data
+    string data     UTF-8 names of nodes, edge labels and IPs
+A FEC that cannot be converted is stored as an empty record, and loaded as a
+None placeholder, as in RelaGraphNC.
+"""
+
+MAGIC = b'RELAGNC\0'
+VERSION = 1
+_HEADER = struct.Struct('<8sIIII')
+
+
+class _StringTable:
+    """
+    Interns the strings of a file being converted.
+    """
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        id = self.ids.get(name)
+        if id is None:
+            id = len(self.ids)
+            self.ids[name] = id
+        return id
+
+
+def _encode_graph(graph: dict, strings: _StringTable, words: array):
+    """
+    Encode a forwarding graph in compressed sparse row format:
+        n_nodes, n_edges, n_labels, n_sources, n_sinks,
+        nodes[n_nodes], edge offsets of each node[n_nodes + 1],
+        next nodes[n_edges], label offsets of each edge[n_edges + 1],
+        edge labels[n_labels], sources[n_sources], sinks[n_sinks]
+    where the label of an interface is interned as {next_node}|{interface},
+    as in RelaLinkLevelForwardingGraph.parse.
+    """
+    nodes, node_offsets, next_nodes, edge_offsets, labels = [], [0], [], [0], []
+    for node, out_edges in graph['nodeToOutEdgesMap'].items():
+        nodes.append(strings.intern(node))
+        for next_node, interface_names in out_edges.items():
+            next_nodes.append(strings.intern(next_node))
+            labels.extend(strings.intern(f"{next_node}|{name}") for name in interface_names)
+            edge_offsets.append(len(labels))
+        node_offsets.append(len(next_nodes))
+    sources = [strings.intern(node) for node in graph['sourceNodes']]
+    sinks = [strings.intern(node) for node in graph['sinkNodes']]
+    words.extend([len(nodes), len(next_nodes), len(labels), len(sources), len(sinks)])
+    for part in [nodes, node_offsets, next_nodes, edge_offsets, labels, sources, sinks]:
+        words.extend(part)
+
+
+def _encode_fec(slice: dict, strings: _StringTable) -> array:
+    """
+    Encode a FEC as n_keys, (srcIp, dstIp, qos) of each IP traffic key, and
+    the graphs before and after the change.
+    """
+    words = array('I', [len(slice['ipTrafficKeys'])])
+    for key in slice['ipTrafficKeys']:
+        words.extend([strings.intern(key['srcIp']), strings.intern(key['dstIp']), key['qos']])
+    _encode_graph(slice['graphBefore'], strings, words)
+    _encode_graph(slice['graphAfter'], strings, words)
+    return words
+
+
+def _little_endian(data: array) -> bytes:
+    if sys.byteorder != 'little':
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data.tobytes()
+
+
+def convert_json(json_file: str, bin_file: str) -> int:
+    """
+    Convert a network change from the JSON format to the binary format. The
+    JSON file is streamed, so only the compact encoding is kept in memory.
+    Returns the number of FECs.
+    """
+    strings = _StringTable()
+    index = array('Q', [0])
+    records = array('I')
+    for i, slice in enumerate(JSONArrayReader(json_file)):
+        try:
+            records.extend(_encode_fec(slice, strings))
+        except Exception as e:
+            logging.getLogger(__name__).warn(f"Error converting FEC #{i} in {json_file}: {e}")
+        index.append(len(records))
+
+    data = [name.encode('utf8') for name in strings.ids]
+    offsets = array('I', [0])
+    for name in data:
+        offsets.append(offsets[-1] + len(name))
+    with open(bin_file, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(index) - 1, len(data), 0))
+        f.write(_little_endian(index))
+        f.write(_little_endian(records))
+        f.write(_little_endian(offsets))
+        f.write(b''.join(data))
+    return len(index) - 1
+
+
+def _words(buffer: memoryview, typecode: str) -> Sequence[int]:
+    """
+    View a little-endian buffer as an array of integers, without copying it
+    on little-endian machines.
+    """
+    if sys.byteorder == 'little':
+        return buffer.cast(typecode)
+    data = array(typecode, bytes(buffer))
+    data.byteswap()
+    return data
+
+
+class _Slices(collections.abc.Sequence):
+    """
+    The FECs of a binary network change by index, decoded on access.
+    """
+    def __init__(self, network_change: BinaryRelaGraphNC):
+        self.network_change = network_change
+
+    def __len__(self) -> int:
+        return self.network_change.count_fec()
+
+    def __getitem__(self, i: int) -> Union[RelaGraphFEC, None]:
+        return self.network_change.get_slice(i)
+
+
+@dataclass
+class BinaryRelaGraphNC(NetworkChange):
+    """
+    An implementation of NetworkChange for Rela format that memory-maps a file
+    in the binary format, and decodes each FEC when it is accessed. The pages
+    of the file are shared by all processes that map it, and names are
+    decoded and interned once per string of the file.
+    """
+    bin_file: str
+    name: str
+    precision: str
+    mapping: dict = None
+    symbols: SymbolTable = None
+    index: AttributeIndex = None
+    rewrite: DeviceGroupRewrite = None
+    _offsets: Sequence[int] = field(default=None, repr=False)
+    _records: Sequence[int] = field(default=None, repr=False)
+    _string_offsets: Sequence[int] = field(default=None, repr=False)
+    _string_data: memoryview = field(default=None, repr=False)
+    # string id -> name, interned location, and device group location
+    _names: List[str] = field(default=None, repr=False)
+    _locations: List[Location] = field(default=None, repr=False)
+    _groups: Dict[int, Location] = field(default_factory=dict, repr=False)
+    # IP traffic key -> index of its FEC
+    _keys: Dict[IpTrafficKey, int] = field(default_factory=dict, repr=False)
+    _views: Dict[str, BinaryRelaGraphNC] = field(default_factory=dict, repr=False)
+
+    @property
+    def slices(self) -> Sequence[Union[RelaGraphFEC, None]]:
+        return _Slices(self)
+
+    def get_fec(self, key: IpTrafficKey) -> Union[RelaGraphFEC, None]:
+        """
+        Get the FEC of an IP traffic key, or None if no FEC has it. The
+        packed keys of all FECs are indexed on the first lookup, and the
+        index is shared by the views of this network change.
+        """
+        if not self._keys:
+            for i in range(self.count_fec()):
+                start, end = self._offsets[i], self._offsets[i + 1]
+                if start == end:
+                    continue
+                keys = self._records[start + 1:start + 1 + 3 * self._records[start]].tolist()
+                for k in range(0, len(keys), 3):
+                    self._keys.setdefault(IpTrafficKey(self._name(keys[k]), self._name(keys[k + 1]), keys[k + 2]), i)
+        i = self._keys.get(key)
+        return self.get_slice(i) if i is not None else None
+
+    def iterate(self) -> Iterator[RelaGraphFEC]:
+        for i in range(self.count_fec()):
+            yield self.get_slice(i)
+
+    def iterate_range(self, start: int, stop: int) -> Iterator[RelaGraphFEC]:
+        for i in range(start, min(stop, self.count_fec())):
+            yield self.get_slice(i)
+
+    def __reduce__(self):
+        # the mapped file cannot be sent to other processes, so they map it
+        # again, with their own symbol table
+        return BinaryRelaGraphNC.from_file, (self.bin_file, self.precision, None, self.mapping)
+
+    def count_fec(self) -> int:
+        return len(self._offsets) - 1
+
+    def get_name(self) -> str:
+        return self.name
+
+    def view(self, precision: str, index: AttributeIndex = None) -> BinaryRelaGraphNC:
+        """
+        Get this network change at another precision, see RelaGraphNC.view.
+        The binary format keeps the interface-level graphs, so any precision
+        can be viewed, and views share the mapped file and the decoded names.
+        """
+        if precision == self.precision:
+            return self
+        view = self._views.get(precision)
+        if view is None:
+            if precision == 'devicegroup' and self.mapping is None:
+                raise ValueError("Mapping file is required for devicegroup level forwarding graph")
+            if index is None:
+                index = AttributeIndex(self.symbols, self.mapping, grouped=True) if precision == 'devicegroup' else self.index
+            view = replace(self, precision=precision, index=index)
+            self._views[precision] = view
+        return view
+
+    def get_slice(self, i: int) -> Union[RelaGraphFEC, None]:
+        """
+        Decode FEC #i, or None if it could not be converted.
+        """
+        start, end = self._offsets[i], self._offsets[i + 1]
+        if start == end:
+            return None
+        words = self._records[start:end]
+        n_keys = words[0]
+        keys = words[1:1 + 3 * n_keys].tolist()
+        ip_traffic_keys = [IpTrafficKey(self._name(keys[k]), self._name(keys[k + 1]), keys[k + 2]) for k in range(0, len(keys), 3)]
+        graph_before, pos = self._decode_graph(words, 1 + 3 * n_keys)
+        graph_after, _ = self._decode_graph(words, pos)
+        return RelaGraphFEC(ip_traffic_keys, graph_before, graph_after, self.symbols, self.index)
+
+    def _name(self, id: int) -> str:
+        name = self._names[id]
+        if name is None:
+            name = bytes(self._string_data[self._string_offsets[id]:self._string_offsets[id + 1]]).decode('utf8')
+            self._names[id] = name
+        return name
+
+    def _location(self, id: int) -> Location:
+        location = self._locations[id]
+        if location is None:
+            location = self.symbols.intern(self._name(id))
+            self._locations[id] = location
+        return location
+
+    def _group(self, id: int) -> Location:
+        """
+        Get the device group location of a node, keeping the VRF name, as in
+        RelaDeviceGroupLevelForwardingGraph.parse.
+        """
+        location = self._groups.get(id)
+        if location is None:
+            location = self.rewrite.name(self._name(id))
+            self._groups[id] = location
+        return location
+
+    def _decode_graph(self, words: Sequence[int], pos: int) -> Tuple[ForwardingGraph, int]:
+        """
+        Decode a graph encoded by _encode_graph at the given position, at the
+        precision of this network change. Returns the graph and the position
+        after it.
+        """
+        n_nodes, n_edges, n_labels, n_sources, n_sinks = words[pos:pos + 5]
+        pos += 5
+        parts = []
+        for n in [n_nodes, n_nodes + 1, n_edges, n_edges + 1, n_labels, n_sources, n_sinks]:
+            parts.append(words[pos:pos + n].tolist())
+            pos += n
+        nodes, node_offsets, next_nodes, edge_offsets, labels, sources, sinks = parts
+
+        if self.precision in ['interface', 'device']:
+            location = self._location
+            next_locations = [location(next_node) for next_node in next_nodes]
+            if self.precision == 'device':
+                cls, label_offsets, edge_labels = RelaDeviceLevelForwardingGraph, None, None
+            else:
+                cls, label_offsets, edge_labels = RelaLinkLevelForwardingGraph, [0], []
+                for e, next_node in enumerate(next_locations):
+                    # sink nodes have no interface name
+                    if edge_offsets[e] == edge_offsets[e + 1]:
+                        edge_labels.append(next_node)
+                    else:
+                        edge_labels.extend(location(label) for label in labels[edge_offsets[e]:edge_offsets[e + 1]])
+                    label_offsets.append(len(edge_labels))
+            return cls.from_csr([location(node) for node in nodes], node_offsets, next_locations, label_offsets, edge_labels, map(location, sources), map(location, sinks)), pos
+        group, graph = self._group, {}
+        for k, node in enumerate(nodes):
+            graph.setdefault(group(node), set()).update(group(next_node) for next_node in next_nodes[node_offsets[k]:node_offsets[k + 1]])
+        return RelaDeviceGroupLevelForwardingGraph(graph, set(map(group, sources)), set(map(group, sinks))), pos
+
+    @staticmethod
+    def from_file(bin_file: str, precision: str = 'interface', mapping_file: str = None, mapping: dict = None, symbols: SymbolTable = None, index: AttributeIndex = None) -> BinaryRelaGraphNC:
+        """
+        Memory-map a network change in the binary format, see
+        RelaGraphNC.from_json.
+        """
+        if precision not in ['interface', 'device', 'devicegroup']:
+            raise ValueError(f"Unknown precision for Hoyan Graph: {precision}, should be 'interface' or 'device'")
+        if mapping is None and mapping_file is not None:
+            with open(mapping_file) as f:
+                mapping = json.load(f)
+        if precision == 'devicegroup' and mapping is None:
+            raise ValueError("Mapping file is required for devicegroup level forwarding graph")
+        if symbols is None:
+            symbols = SymbolTable()
+        if index is None:
+            index = AttributeIndex(symbols, mapping, grouped=precision == 'devicegroup')
+
+        with open(bin_file, 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, version, n_fecs, n_strings, _ = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{bin_file} is not a network change in binary format version {VERSION}")
+        pos = _HEADER.size
+        offsets = _words(buffer[pos:pos + 8 * (n_fecs + 1)], 'Q')
+        pos += 8 * (n_fecs + 1)
+        records = _words(buffer[pos:pos + 4 * offsets[-1]], 'I')
+        pos += 4 * offsets[-1]
+        string_offsets = _words(buffer[pos:pos + 4 * (n_strings + 1)], 'I')
+        pos += 4 * (n_strings + 1)
+        return BinaryRelaGraphNC(
+            bin_file, os.path.basename(bin_file), precision, mapping, symbols, index,
+            DeviceGroupRewrite(mapping, symbols) if mapping is not None else None,
+            offsets, records, string_offsets, buffer[pos:], [None] * n_strings, [None] * n_strings
+        )
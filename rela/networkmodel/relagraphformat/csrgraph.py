@@ -0,0 +1,186 @@
+from __future__ import annotations
+from array import array
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Tuple, Union
+
+from ..forwardinggraph import ForwardingGraph
+from ..symboltable import Location
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements the immutable, array-backed base class of
+the forwarding graphs of Rela format.
+"""
+
+# the precisions of Rela graphs, from the finest to the coarsest
+PRECISIONS = ('interface', 'device', 'devicegroup')
+
+class CSRForwardingGraph(ForwardingGraph):
+    """
+    Base class of the immutable forwarding graphs of Rela format. Nodes are
+    numbered by their position, and the out edges of all nodes are stored in
+    compressed sparse row (CSR) arrays: the edges of node k lead to the nodes
+    _next[_edge_offsets[k]:_edge_offsets[k + 1]], and the labels of edge e
+    are _labels[_label_offsets[e]:_label_offsets[e + 1]], or the next node
+    itself in graphs without labels. The nodes are computed once when the
+    graph is built, and the alphabet once when it is first requested.
+
+    A graph is built from the adjacency of its nodes, {node: {next_node:
+    labels}} if LABELED, or {node: next_nodes} otherwise.
+    """
+    LABELED = False
+    PRECISION = None
+
+    __slots__ = ('_nodes', '_positions', '_edge_offsets', '_next', '_label_offsets', '_labels', 'sources', 'sinks', '_node_set', '_alphabet')
+
+    def __init__(self, graph: Dict[Location, Iterable], sources: Iterable[Location], sinks: Iterable[Location]):
+        edge_offsets, next_nodes, label_offsets, labels = [0], [], [0], []
+        for out_edges in graph.values():
+            next_nodes.extend(out_edges)
+            edge_offsets.append(len(next_nodes))
+            if self.LABELED:
+                for edges in out_edges.values():
+                    labels.extend(edges)
+                    label_offsets.append(len(labels))
+        self._init_csr(list(graph), edge_offsets, next_nodes, label_offsets, labels, sources, sinks)
+
+    @classmethod
+    def from_csr(cls, nodes: List[Location], edge_offsets: List[int], next_nodes: List[Location], label_offsets: List[int], labels: List[Location], sources: Iterable[Location], sinks: Iterable[Location]) -> CSRForwardingGraph:
+        """
+        Build a graph from its CSR arrays, where the nodes with out edges are
+        distinct, and next nodes are given by location instead of position.
+        The labels are ignored unless LABELED.
+        """
+        graph = cls.__new__(cls)
+        graph._init_csr(nodes, edge_offsets, next_nodes, label_offsets, labels, sources, sinks)
+        return graph
+
+    def _init_csr(self, nodes: List[Location], edge_offsets: List[int], next_nodes: List[Location], label_offsets: List[int], labels: List[Location], sources: Iterable[Location], sinks: Iterable[Location]):
+        # nodes with out edges come first, then the other nodes they lead to
+        n_nodes = len(nodes)
+        nodes = list(nodes)
+        positions = {node: k for k, node in enumerate(nodes)}
+        def position(node: Location) -> int:
+            k = positions.get(node)
+            if k is None:
+                k = positions[node] = len(nodes)
+                nodes.append(node)
+            return k
+        next = array('I', map(position, next_nodes))
+        sinks = frozenset(sinks)
+        init = super().__setattr__
+        init('_nodes', tuple(nodes))
+        init('_positions', positions)
+        init('_edge_offsets', array('I', edge_offsets))
+        init('_next', next)
+        init('_label_offsets', array('I', label_offsets) if self.LABELED else None)
+        init('_labels', tuple(labels) if self.LABELED else None)
+        init('sources', frozenset(sources))
+        init('sinks', sinks)
+        init('_node_set', frozenset(nodes[:n_nodes]).union(sinks))
+        init('_alphabet', None)
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __getstate__(self) -> Tuple:
+        return tuple(getattr(self, name) for name in CSRForwardingGraph.__slots__)
+
+    def __setstate__(self, state: Tuple):
+        for name, value in zip(CSRForwardingGraph.__slots__, state):
+            super().__setattr__(name, value)
+
+    def _compute_alphabet(self) -> FrozenSet[Location]:
+        return self._node_set
+
+    def _edge_range(self, node: Location) -> range:
+        k = self._positions.get(node)
+        if k is None or k + 1 >= len(self._edge_offsets):
+            return range(0)
+        return range(self._edge_offsets[k], self._edge_offsets[k + 1])
+
+    def _edge_labels(self, e: int) -> Union[Tuple[Location, ...], Tuple[Location]]:
+        if self._labels is None:
+            return (self._nodes[self._next[e]],)
+        return self._labels[self._label_offsets[e]:self._label_offsets[e + 1]]
+
+    def get_alphabet(self) -> FrozenSet[Location]:
+        if self._alphabet is None:
+            super().__setattr__('_alphabet', self._compute_alphabet())
+        return self._alphabet
+
+    def get_nodes(self) -> FrozenSet[Location]:
+        return self._node_set
+
+    def get_out_edges(self, node: Location) -> Dict[Location, FrozenSet[Location]]:
+        """
+        Represent the out edges of a node as a dictionary of
+        {next_node: edges_from_node_to_next_node)}.
+        """
+        return {self._nodes[self._next[e]]: frozenset(self._edge_labels(e)) for e in self._edge_range(node)}
+
+    def get_edges(self, node: Location) -> Iterator[Tuple[Location, Location]]:
+        for e in self._edge_range(node):
+            next_node = self._nodes[self._next[e]]
+            for label in self._edge_labels(e):
+                yield next_node, label
+
+    def iter_adjacency(self) -> Iterator[Tuple[Location, List[Location]]]:
+        """
+        Iterate over the nodes with out edges and their next nodes.
+        """
+        for k in range(len(self._edge_offsets) - 1):
+            yield self._nodes[k], [self._nodes[n] for n in self._next[self._edge_offsets[k]:self._edge_offsets[k + 1]]]
+
+    def project(self, precision: str, rewrite: Callable[[Location], Location] = None) -> CSRForwardingGraph:
+        """
+        Project the graph onto a coarser precision, see the subclasses. The
+        rewrite maps device locations to device group locations, e.g., a
+        DeviceGroupRewrite, and is required for the devicegroup precision.
+        """
+        if precision == self.PRECISION:
+            return self
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision for Hoyan Graph: {precision}, should be one of {PRECISIONS}")
+        raise ValueError(f"Cannot project a {self.PRECISION} level graph onto {precision} level")
+
+    def _view(self, cls: type, **changes) -> CSRForwardingGraph:
+        """
+        Get a graph of another class that shares the arrays of this graph,
+        except for the given slots.
+        """
+        graph = cls.__new__(cls)
+        for name in CSRForwardingGraph.__slots__:
+            object.__setattr__(graph, name, changes.get(name, getattr(self, name)))
+        return graph
+
+    def is_source(self, node: Location) -> bool:
+        return node in self.sources
+
+    def is_sink(self, node: Location) -> bool:
+        return node in self.sinks
+
+    @property
+    def graph(self) -> Dict[Location, Union[Dict[Location, list], set]]:
+        """
+        The adjacency the graph is built from, see the class documentation.
+        """
+        graph = {}
+        for node in self._nodes[:len(self._edge_offsets) - 1]:
+            if self.LABELED:
+                graph[node] = {self._nodes[self._next[e]]: list(self._edge_labels(e)) for e in self._edge_range(node)}
+            else:
+                graph[node] = {self._nodes[self._next[e]] for e in self._edge_range(node)}
+        return graph
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return (self.sources, self.sinks, self._node_set) == (other.sources, other.sinks, other._node_set) and \
+            all(self.get_out_edges(node) == other.get_out_edges(node) for node in self._node_set)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(graph={self.graph!r}, sources={set(self.sources)!r}, sinks={set(self.sinks)!r})"
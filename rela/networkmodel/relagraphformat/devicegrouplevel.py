@@ -1,64 +1,93 @@
 from __future__ import annotations
-from dataclasses import dataclass
 from typing import Dict, Set
 
-from ..forwardinggraph import ForwardingGraph
+from ..symboltable import SymbolTable, Location
+from .csrgraph import CSRForwardingGraph
 
-@dataclass
-class RelaDeviceGroupLevelForwardingGraph(ForwardingGraph):
+
+class DeviceGroupRewrite:
     """
-    An implementation of ForwardingGraph for Rela format. It represents a
-    set of device-group-level forwarding paths.
+    The rewrite of locations from device names to device group names, while
+    keeping the VRF name. Names that are not Device|VRF are kept as is. Each
+    name and each location is rewritten once, and the table is shared by all
+    FECs of a network change.
     """
-    graph: Dict[str, Set[str]]
-    sources: Set[str]
-    sinks: Set[str]
+    def __init__(self, mapping: dict, symbols: SymbolTable = None):
+        self.mapping = mapping
+        self.symbols = symbols
+        self._names: Dict[str, Location] = {}
+        self._locations: Dict[Location, Location] = {}
+
+    def name(self, name: str) -> Location:
+        """
+        Rewrite a location name, and intern the group location if the table
+        has a symbol table.
+        """
+        group = self._names.get(name)
+        if group is None:
+            words = name.split('|')
+            group_name = f"{self.mapping.get(words[0], words[0])}|{words[1]}" if len(words) == 2 else name
+            group = self.symbols.intern(group_name) if self.symbols is not None else group_name
+            self._names[name] = group
+        return group
 
-    def get_alphabet(self) -> Set[str]:
-        return set(self.graph.keys()).union(self.sinks)
-    
-    def get_nodes(self) -> Set[str]:
-        return set(self.graph.keys()).union(self.sinks)
-    
-    def get_out_edges(self, node: str) -> Dict[str, Set[str]]:
+    def __call__(self, location: Location) -> Location:
         """
-        Represent the out edges of a node as a dictionary of 
-        {next_node: edges_from_node_to_next_node)}.
+        Rewrite a location, given by its interned symbol or by its name.
         """
-        next_nodes = self.graph.get(node, set())
-        return {next_node: set([next_node]) for next_node in next_nodes}
-    
-    def is_source(self, node: str) -> bool:
-        return node in self.sources
-    
-    def is_sink(self, node: str) -> bool:
-        return node in self.sinks
-    
+        group = self._locations.get(location)
+        if group is None:
+            group = self.name(self.symbols.name(location) if self.symbols is not None else location)
+            self._locations[location] = group
+        return group
+
+
+class RelaDeviceGroupLevelForwardingGraph(CSRForwardingGraph):
+    """
+    An implementation of ForwardingGraph for Rela format. It represents a
+    set of device-group-level forwarding paths. The label of each edge is its next
+    node.
+    """
+    PRECISION = 'devicegroup'
+
+    __slots__ = ()
+
+    def __init__(self, graph: Dict[Location, Set[Location]], sources: Set[Location], sinks: Set[Location]):
+        super().__init__(graph, sources, sinks)
+
     @staticmethod
-    def parse(mapping: dict, input: dict) -> RelaDeviceGroupLevelForwardingGraph:
-        # extract device-level graph
+    def parse(mapping: dict, input: dict, symbols: SymbolTable = None, rewrite: DeviceGroupRewrite = None) -> RelaDeviceGroupLevelForwardingGraph:
+        """
+        Parse a forwarding graph and collapse devices into device groups.
+        Locations are interned into the given symbol table, or kept as names if
+        no table is given. A rewrite table can be given to share it with the
+        other graphs of a network change.
+        """
+        if rewrite is None:
+            rewrite = DeviceGroupRewrite(mapping, symbols)
+        replace = rewrite.name
+
+        # rewrite device names to device group names
         graph = {}
         for node, out_edges in input["nodeToOutEdgesMap"].items():
-            graph[node] = set(out_edges.keys())
-
-        def replace(node: str) -> str:
-            """
-            Replace device names with device group names, while keeping the
-            VRF name.
-            """
-            words = node.split('|')
-            if len(words) != 2:
-                return node
-            device = words[0]
-            return f"{mapping.get(device, device)}|{words[1]}"
+            graph.setdefault(replace(node), set()).update(map(replace, out_edges))
+        return RelaDeviceGroupLevelForwardingGraph(
+            graph=graph,
+            sources=set(map(replace, input["sourceNodes"])),
+            sinks=set(map(replace, input["sinkNodes"]))
+        )
 
-        # rewrite device names to device group names
-        rewritten_graph = {}
-        for node, out_edges in graph.items():
-            old = rewritten_graph.get(replace(node), set())
-            rewritten_graph[replace(node)] = set([replace(next_node) for next_node in out_edges]).union(old)
+    @staticmethod
+    def rewrite(graph: CSRForwardingGraph, rewrite: DeviceGroupRewrite) -> RelaDeviceGroupLevelForwardingGraph:
+        """
+        Collapse the nodes of a device- or interface-level graph into device
+        groups. Edge labels are dropped, as in parse.
+        """
+        rewritten = {}
+        for node, next_nodes in graph.iter_adjacency():
+            rewritten.setdefault(rewrite(node), set()).update(map(rewrite, next_nodes))
         return RelaDeviceGroupLevelForwardingGraph(
-            graph=rewritten_graph,
-            sources=set([replace(node) for node in input["sourceNodes"]]),
-            sinks=set([replace(node) for node in input["sinkNodes"]])
-        )
\ No newline at end of file
+            graph=rewritten,
+            sources=set(map(rewrite, graph.sources)),
+            sinks=set(map(rewrite, graph.sinks))
+        )
@@ -1,52 +1,48 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Dict, Set
+from typing import Callable, Dict, Set
 
-from ..forwardinggraph import ForwardingGraph
+from ..symboltable import SymbolTable, Location
+from .csrgraph import CSRForwardingGraph
+from .devicegrouplevel import RelaDeviceGroupLevelForwardingGraph
 
 
-@dataclass
-class RelaDeviceLevelForwardingGraph(ForwardingGraph):
+class RelaDeviceLevelForwardingGraph(CSRForwardingGraph):
     """
     An implementation of ForwardingGraph for Rela format. It represents a
-    set of device-level forwarding paths.
+    set of device-level forwarding paths. The label of each edge is its next
+    node.
     """
-    graph: Dict[str, Set[str]]
-    sources: Set[str]
-    sinks: Set[str]
+    PRECISION = 'device'
 
-    def get_alphabet(self) -> Set[str]:
-        return set(self.graph.keys()).union(self.sinks)
-    
-    def get_nodes(self) -> Set[str]:
-        return set(self.graph.keys()).union(self.sinks)
-    
-    def get_out_edges(self, node: str) -> Dict[str, Set[str]]:
+    __slots__ = ()
+
+    def __init__(self, graph: Dict[Location, Set[Location]], sources: Set[Location], sinks: Set[Location]):
+        super().__init__(graph, sources, sinks)
+
+    def project(self, precision: str, rewrite: Callable[[Location], Location] = None) -> CSRForwardingGraph:
         """
-        Represent the out edges of a node as a dictionary of 
-        {next_node: edges_from_node_to_next_node)}.
+        Project the graph onto the device group level, by rewriting its nodes.
         """
-        next_nodes = self.graph.get(node, set())
-        return {next_node: set([next_node]) for next_node in next_nodes}
-    
-    def is_source(self, node: str) -> bool:
-        return node in self.sources
-    
-    def is_sink(self, node: str) -> bool:
-        return node in self.sinks
-    
+        if precision == 'devicegroup':
+            if rewrite is None:
+                raise ValueError("Mapping file is required for devicegroup level forwarding graph")
+            return RelaDeviceGroupLevelForwardingGraph.rewrite(self, rewrite)
+        return super().project(precision, rewrite)
+
     @staticmethod
-    def parse(input: dict) -> RelaDeviceLevelForwardingGraph:
-        graph = {}
+    def parse(input: dict, symbols: SymbolTable = None) -> RelaDeviceLevelForwardingGraph:
+        """
+        Parse a forwarding graph. Locations are interned into the given symbol
+        table, or kept as names if no table is given.
+        """
+        intern = symbols.intern if symbols is not None else lambda name: name
+        nodes, edge_offsets, next_nodes = [], [0], []
         for node, out_edges in input["nodeToOutEdgesMap"].items():
-            graph[node] = set(out_edges.keys())
-        return RelaDeviceLevelForwardingGraph(
-            graph=graph,
-            sources=set(input["sourceNodes"]),
-            sinks=set(input["sinkNodes"])
+            nodes.append(intern(node))
+            next_nodes.extend(map(intern, out_edges))
+            edge_offsets.append(len(next_nodes))
+        return RelaDeviceLevelForwardingGraph.from_csr(
+            nodes, edge_offsets, next_nodes, None, None,
+            sources=map(intern, input["sourceNodes"]),
+            sinks=map(intern, input["sinkNodes"])
         )
-            
-
-
-
-
@@ -1,9 +1,11 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Callable, FrozenSet, List
 
 from ..fec import GraphFEC
 from ..forwardinggraph import ForwardingGraph
+from ..symboltable import SymbolTable, Location
+from ..attributeindex import AttributeIndex
 from .iptraffickey import IpTrafficKey
 
 @dataclass
@@ -16,6 +18,10 @@ class RelaGraphFEC(GraphFEC):
     ip_traffic_keys: List[IpTrafficKey]
     graph_before: ForwardingGraph
     graph_after: ForwardingGraph
+    symbols: SymbolTable = None
+    index: AttributeIndex = None
+    # the graphs are immutable, so their alphabet is computed once
+    _alphabet: FrozenSet = field(default=None, init=False, repr=False, compare=False)
 
     def get_before_state(self) -> ForwardingGraph:
         return self.graph_before
@@ -23,8 +29,30 @@ class RelaGraphFEC(GraphFEC):
     def get_after_state(self) -> ForwardingGraph:
         return self.graph_after
     
-    def compute_alphabet(self) -> set:
-        return self.graph_before.get_alphabet().union(self.graph_after.get_alphabet())
+    def compute_alphabet(self) -> FrozenSet:
+        if self._alphabet is None:
+            self._alphabet = self.graph_before.get_alphabet().union(self.graph_after.get_alphabet())
+        return self._alphabet
     
+    def project(self, precision: str, rewrite: Callable[[Location], Location] = None, index: AttributeIndex = None) -> RelaGraphFEC:
+        """
+        Get this FEC at a coarser precision, see CSRForwardingGraph.project.
+        The projected FEC shares the symbol table of this FEC, and uses the
+        given attribute index, e.g., a grouped index for device groups.
+        """
+        return RelaGraphFEC(
+            ip_traffic_keys=self.ip_traffic_keys,
+            graph_before=self.graph_before.project(precision, rewrite),
+            graph_after=self.graph_after.project(precision, rewrite),
+            symbols=self.symbols,
+            index=index if index is not None else self.index
+        )
+
     def get_ip_traffic_keys(self) -> List[str]:
-        return [key.dstIp for key in self.ip_traffic_keys]
\ No newline at end of file
+        return [key.dstIp for key in self.ip_traffic_keys]
+    
+    def get_symbol_table(self) -> SymbolTable:
+        return self.symbols
+
+    def get_attribute_index(self) -> AttributeIndex:
+        return self.index
\ No newline at end of file
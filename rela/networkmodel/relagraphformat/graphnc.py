@@ -1,16 +1,19 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import functools
 import json
 import os
 import logging
-from typing import List, Union, Iterator
+from typing import Dict, List, Tuple, Union, Iterator
 
 from ..networkchange import NetworkChange
+from ..symboltable import SymbolTable
+from ..attributeindex import AttributeIndex
 
 from .graphfec import RelaGraphFEC
 from .iptraffickey import IpTrafficKey
-from .devicegrouplevel import RelaDeviceGroupLevelForwardingGraph
+from .jsonstream import JSONArrayReader
+from .devicegrouplevel import RelaDeviceGroupLevelForwardingGraph, DeviceGroupRewrite
 from .devicelevel import RelaDeviceLevelForwardingGraph
 from .linklevel import RelaLinkLevelForwardingGraph
 
@@ -25,6 +28,12 @@ class RelaGraphNC(NetworkChange):
     """
     slices: List[RelaGraphFEC]
     name: str
+    symbols: SymbolTable = None
+    index: AttributeIndex = None
+    precision: str = None
+    mapping: dict = None
+    rewrite: DeviceGroupRewrite = None
+    _views: Dict[str, RelaGraphNC] = field(default_factory=dict, repr=False)
     
     def get_fec(self, key: IpTrafficKey) -> Union[RelaGraphFEC, None]:
         # TODO
@@ -34,44 +43,174 @@ class RelaGraphNC(NetworkChange):
         for slice in self.slices:
             yield slice
 
+    def iterate_range(self, start: int, stop: int) -> Iterator[RelaGraphFEC]:
+        return iter(self.slices[start:stop])
+
     def count_fec(self) -> int:
         return len(self.slices)
     
     def get_name(self) -> str:
         return self.name
 
+    def view(self, precision: str, index: AttributeIndex = None) -> RelaGraphNC:
+        """
+        Get this network change at a coarser precision without loading it
+        again, e.g., device-level graphs from interface-level ones, see
+        CSRForwardingGraph.project. Views share the symbol table and the
+        device-group rewrite table, and are memoized. The index of a view is
+        the index of this network change, or for device groups a new grouped
+        index, unless one is given.
+        """
+        if precision == self.precision:
+            return self
+        view = self._views.get(precision)
+        if view is None:
+            if precision == 'devicegroup':
+                if self.mapping is None:
+                    raise ValueError("Mapping file is required for devicegroup level forwarding graph")
+                if self.rewrite is None:
+                    self.rewrite = DeviceGroupRewrite(self.mapping, self.symbols)
+                if index is None:
+                    index = AttributeIndex(self.symbols, self.mapping, grouped=True)
+            if index is None:
+                index = self.index
+            slices = [fec.project(precision, self.rewrite, index) if fec is not None else None for fec in self.slices]
+            view = RelaGraphNC(slices, self.name, self.symbols, index, precision, self.mapping, self.rewrite)
+            self._views[precision] = view
+        return view
+
     @staticmethod
-    def from_json(json_file: str, precision: str = 'interface', mapping_file: str = None) -> RelaGraphNC:
-        if precision == 'interface':
-            graph_parser = RelaLinkLevelForwardingGraph.parse
-        elif precision == 'device':
-            graph_parser = RelaDeviceLevelForwardingGraph.parse
-        elif precision == 'devicegroup':
-            if mapping_file is None:
-                raise ValueError("Mapping file is required for devicegroup level forwarding graph")
+    def from_json(json_file: str, precision: str = 'interface', mapping_file: str = None, mapping: dict = None, symbols: SymbolTable = None, index: AttributeIndex = None) -> RelaGraphNC:
+        """
+        Load a network change. The device-group mapping is read from the
+        mapping file unless it is given already loaded. By default, all FECs
+        of this network change share a new symbol table and a new index of
+        location attributes, which also uses the mapping; a table and an
+        index can also be given to share them with other network changes,
+        e.g., all files loaded by a worker process. A network change loaded
+        at interface precision can also be viewed at the coarser ones.
+        """
+        stream = LazyRelaGraphNC.from_json(json_file, precision, mapping_file, mapping, symbols, index)
+        return RelaGraphNC(list(stream.iterate()), stream.name, stream.symbols, stream.index, precision, stream.mapping, stream.rewrite)
+
+
+def _graph_parser(precision: str, mapping: dict, symbols: SymbolTable, rewrite: DeviceGroupRewrite = None):
+    if precision == 'interface':
+        return functools.partial(RelaLinkLevelForwardingGraph.parse, symbols=symbols)
+    elif precision == 'device':
+        return functools.partial(RelaDeviceLevelForwardingGraph.parse, symbols=symbols)
+    elif precision == 'devicegroup':
+        if mapping is None:
+            raise ValueError("Mapping file is required for devicegroup level forwarding graph")
+        return functools.partial(RelaDeviceGroupLevelForwardingGraph.parse, mapping, symbols=symbols, rewrite=rewrite)
+    else:
+        raise ValueError(f"Unknown precision for Hoyan Graph: {precision}, should be 'interface' or 'device'")
+
+
+@dataclass
+class LazyRelaGraphNC(NetworkChange):
+    """
+    An implementation of NetworkChange for Rela format that reads the FECs of
+    a file one by one while they are iterated, instead of loading them all.
+    Only the FEC being verified is kept alive, so files of any size can be
+    verified in bounded memory, and verification starts without waiting for
+    the whole file to be parsed. Each iteration reads the file again, and
+    ranges of FECs are read where the previous range stopped, see
+    iterate_range.
+    """
+    json_file: str
+    name: str
+    precision: str
+    mapping: dict = None
+    symbols: SymbolTable = None
+    index: AttributeIndex = None
+    rewrite: DeviceGroupRewrite = None
+    _count: int = None
+    # the index of the next element of the file and the reader of the
+    # elements, for reading ranges of FECs
+    _cursor: Tuple[int, Iterator[dict]] = field(default=None, repr=False)
+
+    def __getstate__(self) -> dict:
+        # the reader of the file cannot be sent to other processes
+        return {**self.__dict__, '_cursor': None}
+
+    def get_fec(self, key: IpTrafficKey) -> Union[RelaGraphFEC, None]:
+        """
+        Get the FEC of an IP traffic key, or None if no FEC has it. The file
+        is read from the start until the key is found, and only that FEC is
+        parsed into forwarding graphs.
+        """
+        for i, slice in enumerate(JSONArrayReader(self.json_file)):
+            if any(IpTrafficKey.parse(k) == key for k in slice['ipTrafficKeys']):
+                return self._parse(i, slice, _graph_parser(self.precision, self.mapping, self.symbols, self.rewrite))
+        return None
+
+    def _parse(self, i: int, slice: dict, graph_parser) -> Union[RelaGraphFEC, None]:
+        try:
+            return RelaGraphFEC(
+                ip_traffic_keys=[IpTrafficKey.parse(key) for key in slice['ipTrafficKeys']],
+                graph_before=graph_parser(slice['graphBefore']),
+                graph_after=graph_parser(slice['graphAfter']),
+                symbols=self.symbols,
+                index=self.index
+            )
+        except Exception as e:
+            logging.getLogger(__name__).warn(f"Error parsing FEC #{i} in {self.json_file}: {e}")
+            return None # placeholder to keep the same number of FECs
+
+    def iterate(self) -> Iterator[RelaGraphFEC]:
+        graph_parser = _graph_parser(self.precision, self.mapping, self.symbols, self.rewrite)
+        count = 0
+        for i, slice in enumerate(JSONArrayReader(self.json_file)):
+            count += 1
+            yield self._parse(i, slice, graph_parser)
+        self._count = count
+
+    def iterate_range(self, start: int, stop: int) -> Iterator[RelaGraphFEC]:
+        """
+        Iterate the FECs #start to #stop - 1. A range that starts at or
+        after the end of the previous one continues reading the file from
+        there, e.g., the increasing ranges verified by a worker process, and
+        other ranges read it again from the start. The FECs in between are
+        decoded but not parsed into forwarding graphs.
+        """
+        if start >= stop:
+            return
+        if self._cursor is None or self._cursor[0] > start:
+            self._cursor = (0, iter(JSONArrayReader(self.json_file)))
+        graph_parser = _graph_parser(self.precision, self.mapping, self.symbols, self.rewrite)
+        i, elements = self._cursor
+        for slice in elements:
+            self._cursor = (i + 1, elements)
+            if i >= start:
+                yield self._parse(i, slice, graph_parser)
+            i += 1
+            if i >= stop:
+                return
+
+    def count_fec(self) -> int:
+        # counting decodes the file without building the forwarding graphs
+        if self._count is None:
+            self._count = JSONArrayReader(self.json_file).count()
+        return self._count
+
+    def get_name(self) -> str:
+        return self.name
+
+    @staticmethod
+    def from_json(json_file: str, precision: str = 'interface', mapping_file: str = None, mapping: dict = None, symbols: SymbolTable = None, index: AttributeIndex = None) -> LazyRelaGraphNC:
+        """
+        Open a network change for streaming, see RelaGraphNC.from_json.
+        """
+        if mapping is None and mapping_file is not None:
             with open(mapping_file) as f:
                 mapping = json.load(f)
-            graph_parser = functools.partial(RelaDeviceGroupLevelForwardingGraph.parse, mapping)
-        else:
-            raise ValueError(f"Unknown precision for Hoyan Graph: {precision}, should be 'interface' or 'device'")
-        
-        with open(json_file) as f:
-            data = json.load(f)
-
-        slices = []
-        for i, slice in enumerate(data):
-            try:
-                fec = RelaGraphFEC(
-                    ip_traffic_keys=[IpTrafficKey.parse(key) for key in slice['ipTrafficKeys']],
-                    graph_before=graph_parser(slice['graphBefore']),
-                    graph_after=graph_parser(slice['graphAfter'])
-                )
-            except Exception as e:
-                logging.getLogger(__name__).warn(f"Error parsing FEC #{i} in {json_file}: {e}")
-                fec = None # placeholder to keep the same number of FECs
-
-            slices.append(fec)
-        
-        name = os.path.basename(json_file)
-        return RelaGraphNC(slices, name)
-
+        if symbols is None:
+            symbols = SymbolTable()
+        if index is None:
+            index = AttributeIndex(symbols, mapping, grouped=precision == 'devicegroup')
+        # fail early on an invalid precision
+        _graph_parser(precision, mapping, symbols)
+        # the device-group rewrite is shared by all graphs of the file
+        rewrite = DeviceGroupRewrite(mapping, symbols) if mapping is not None else None
+        return LazyRelaGraphNC(json_file, os.path.basename(json_file), precision, mapping, symbols, index, rewrite)
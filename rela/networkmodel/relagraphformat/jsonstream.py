@@ -0,0 +1,109 @@
+import json
+from typing import Any, Iterator, TextIO
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements an incremental reader of JSON files whose
+top level is an array, which decodes the elements one by one without loading
+the whole file.
+"""
+
+# the number of characters read from the file at a time
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = ' \t\n\r'
+
+
+class JSONArrayReader:
+    """
+    Iterates over the elements of the top-level JSON array of a file. Only the
+    element being decoded is buffered, so memory is bounded by the largest
+    element instead of the file size. Each iteration reads the file again.
+    """
+    def __init__(self, file: str, chunk_size: int = CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self) -> Iterator[Any]:
+        with open(self.file) as f:
+            yield from _Scanner(f, self.chunk_size, self._decoder).elements()
+
+    def count(self) -> int:
+        """
+        Count the elements of the array.
+        """
+        return sum(1 for _ in self)
+
+
+class _Scanner:
+    def __init__(self, f: TextIO, chunk_size: int, decoder: json.JSONDecoder):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = decoder
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> bool:
+        """
+        Read more of the file into the buffer, dropping the consumed part.
+        The read size grows with the buffer, so that decoding a large element
+        is retried a logarithmic number of times. Returns False at the end of
+        the file.
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        Skip whitespace and get the next character, or '' at the end of the
+        file.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ''
+
+    def _expect(self, chars: str) -> str:
+        c = self._peek()
+        if c == '' or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} at top level of JSON array, got {c!r}")
+        self.pos += 1
+        return c
+
+    def _decode(self) -> Any:
+        # raw_decode does not skip leading whitespace
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a value that ends the buffer may be cut, e.g., a number
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+    def elements(self) -> Iterator[Any]:
+        self._expect('[')
+        if self._peek() == ']':
+            return
+        while True:
+            yield self._decode()
+            if self._expect(',]') == ']':
+                return
@@ -1,64 +1,63 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Dict, List, Set
+from typing import Callable, Dict, FrozenSet, List, Set
 
-from ..forwardinggraph import ForwardingGraph
+from ..symboltable import SymbolTable, Location
+from .csrgraph import CSRForwardingGraph
+from .devicelevel import RelaDeviceLevelForwardingGraph
 
 
-@dataclass
-class RelaLinkLevelForwardingGraph(ForwardingGraph):
+class RelaLinkLevelForwardingGraph(CSRForwardingGraph):
     """
     An implementation of ForwardingGraph for Rela format. It represents a
-    set of link-level forwarding paths.
+    set of link-level forwarding paths. The edge labels between each pair of
+    nodes are computed once when the graph is parsed.
+    Edge label format: {next_node}|{interface_name}
     """
-    graph: Dict[str, Dict[str, List[str]]]
-    sources: Set[str]
-    sinks: Set[str]
+    LABELED = True
+    PRECISION = 'interface'
 
-    def get_alphabet(self) -> Set[str]:
-        alphabet = set()
-        for node in self.graph.keys():
-            for next_node in self.graph[node].keys():
-                for interface_name in self.graph[node][next_node]:
-                    alphabet.add(f"{next_node}|{interface_name}")
-                # Handle sink nodes with no interface name
-                if len(self.graph[node][next_node]) == 0:
-                    alphabet.add(next_node)
-        
+    __slots__ = ()
+
+    def __init__(self, graph: Dict[Location, Dict[Location, List[Location]]], sources: Set[Location], sinks: Set[Location]):
+        super().__init__(graph, sources, sinks)
+
+    def _compute_alphabet(self) -> FrozenSet[Location]:
         # First hop in Rela format is Device|Vrf, no need to add interface name
-        alphabet.update(self.sources)           
-        return alphabet
-    
-    def get_nodes(self) -> Set[str]:
-        return set(self.graph.keys()).union(self.sinks)
-    
-    def get_out_edges(self, node: str) -> Dict[str, Set[str]]:
+        return frozenset(self._labels).union(self.sources)
+
+    def project(self, precision: str, rewrite: Callable[[Location], Location] = None) -> CSRForwardingGraph:
         """
-        Represent the out edges of a node as a dictionary of
-        {next_node: edges_from_node_to_next_node)}.
-        Edge label format: {next_node}|{interface_name}
+        Project the graph onto the device level, which shares the nodes and
+        edges of this graph without their interface labels, or onto the
+        device group level.
         """
-        next_nodes = self.graph.get(node, set())
-        res = {}
-        for next_node in next_nodes:
-            interface_names = self.graph[node][next_node]
-            edges_to_next_node = {f"{next_node}|{interface_name}" for interface_name in interface_names}
-            # Handle sink nodes with no interface name
-            if len(interface_names) == 0:
-                edges_to_next_node = {next_node}
-            res[next_node] = edges_to_next_node
-        return res
-    
-    def is_source(self, node: str) -> bool:
-        return node in self.sources
-    
-    def is_sink(self, node: str) -> bool:
-        return node in self.sinks
-    
+        if precision == 'device':
+            return self._view(RelaDeviceLevelForwardingGraph, _label_offsets=None, _labels=None, _alphabet=None)
+        if precision == 'devicegroup':
+            return self.project('device').project(precision, rewrite)
+        return super().project(precision, rewrite)
+
     @staticmethod
-    def parse(input: dict) -> RelaLinkLevelForwardingGraph:
-        return RelaLinkLevelForwardingGraph(
-            graph=input["nodeToOutEdgesMap"],
-            sources=set(input["sourceNodes"]),
-            sinks=set(input["sinkNodes"])
+    def parse(input: dict, symbols: SymbolTable = None) -> RelaLinkLevelForwardingGraph:
+        """
+        Parse a forwarding graph. Locations and edge labels are interned into
+        the given symbol table, or kept as names if no table is given.
+        """
+        intern = symbols.intern if symbols is not None else lambda name: name
+        nodes, edge_offsets, next_nodes, label_offsets, labels = [], [0], [], [0], []
+        for node, out_edges in input["nodeToOutEdgesMap"].items():
+            nodes.append(intern(node))
+            for next_node, interface_names in out_edges.items():
+                next_nodes.append(intern(next_node))
+                # Handle sink nodes with no interface name
+                if len(interface_names) == 0:
+                    labels.append(next_nodes[-1])
+                else:
+                    labels += [intern(f"{next_node}|{interface_name}") for interface_name in interface_names]
+                label_offsets.append(len(labels))
+            edge_offsets.append(len(next_nodes))
+        return RelaLinkLevelForwardingGraph.from_csr(
+            nodes, edge_offsets, next_nodes, label_offsets, labels,
+            sources=map(intern, input["sourceNodes"]),
+            sinks=map(intern, input["sinkNodes"])
         )
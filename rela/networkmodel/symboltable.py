@@ -0,0 +1,57 @@
+from typing import Dict, Iterable, List, Union
+
+# a network location, given either by its interned ID or by its name
+Location = Union[int, str]
+
+
+class SymbolTable:
+    """
+    A table that interns network locations (device, VRF and interface names)
+    as dense integer IDs. A table is built once per loaded network change and
+    shared by all of its FECs, so that forwarding graphs and automata work on
+    integers instead of location strings. IDs are mapped back to names only
+    when results are reported.
+    """
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def intern(self, name: str) -> int:
+        """
+        Get the ID of a name, assigning a new ID if the name is unseen.
+        """
+        symbol = self._ids.get(name)
+        if symbol is None:
+            symbol = len(self._names)
+            self._ids[name] = symbol
+            self._names.append(name)
+        return symbol
+
+    def get(self, name: str) -> Union[int, None]:
+        """
+        Get the ID of a name, or None if the name is unseen.
+        """
+        return self._ids.get(name)
+
+    def name(self, symbol: Union[int, str]) -> str:
+        """
+        Get the name of an ID. The ID can also be given in its decimal string
+        form, which is how it appears in HFST labels. Other strings, such as
+        the '?' wildcard of automata, are not IDs and are returned as is.
+        """
+        if isinstance(symbol, str) and not symbol.isdigit():
+            return symbol
+        return self._names[int(symbol)]
+
+    def names(self, symbols: Iterable[Union[int, str]]) -> List[str]:
+        """
+        Get the names of a sequence of IDs, see name.
+        """
+        return [self.name(symbol) for symbol in symbols]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def __len__(self) -> int:
+        return len(self._names)
+
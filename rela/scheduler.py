@@ -0,0 +1,146 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+import logging
+import time
+from tqdm import tqdm
+
+from .networkmodel.fec import FEC
+from .networkmodel.forwardinggraph import ForwardingGraph
+from .language.regularir import Spec
+from .language.regularir.simplifier import count_nodes
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements a cost-aware scheduler that verifies the
+FECs of a directory of network changes in batches over a process pool.
+"""
+
+# the number of batches per worker, so that the tail of the schedule is made
+# of small batches that idle workers can take over
+BATCHES_PER_WORKER = 4
+
+
+def state_size(state: Any) -> int:
+    """
+    Get the size of a network state: the number of nodes and edge labels of a
+    forwarding graph, or the total length of a list of paths.
+    """
+    if isinstance(state, ForwardingGraph):
+        nodes = state.get_nodes()
+        return len(nodes) + sum(1 for node in nodes for _ in state.get_edges(node))
+    return sum(len(path) for path in state)
+
+
+def estimate_cost(spec: Spec, fec: FEC) -> int:
+    """
+    Estimate the cost of verifying a spec on a FEC, by the size of its network
+    states times the size of the spec.
+    """
+    return (state_size(fec.get_before_state()) + state_size(fec.get_after_state())) * count_nodes(spec)
+
+
+@dataclass
+class Batch:
+    """
+    A batch of FECs of one file, and the estimated cost of verifying them.
+    """
+    file: str
+    indices: List[int]
+    cost: int
+
+
+def make_batches(costs: Dict[str, Dict[int, int]], n_workers: int) -> List[Batch]:
+    """
+    Split the FECs of each file, given by the estimated cost of each index,
+    into batches of consecutive indices of about the same cost, such that
+    there are BATCHES_PER_WORKER batches per worker. Returns the batches from
+    the largest to the smallest.
+    """
+    total = sum(sum(file_costs.values()) for file_costs in costs.values())
+    target = max(1, total // (n_workers * BATCHES_PER_WORKER))
+    batches = []
+    for file, file_costs in costs.items():
+        batch = Batch(file, [], 0)
+        for i in sorted(file_costs):
+            batch.indices.append(i)
+            batch.cost += file_costs[i]
+            if batch.cost >= target:
+                batches.append(batch)
+                batch = Batch(file, [], 0)
+        if batch.indices:
+            batches.append(batch)
+    batches.sort(key=lambda batch: batch.cost, reverse=True)
+    return batches
+
+
+@dataclass
+class ScheduleReport:
+    """
+    The parallel efficiency of a schedule: the time spent running batches,
+    divided by the wall-clock time times the number of workers. The time
+    spent loading network changes is not counted as busy, but reported
+    separately.
+    """
+    n_workers: int
+    n_batches: int
+    wall_time: float
+    busy_time: float
+    load_time: float = 0.0
+
+    @property
+    def efficiency(self) -> float:
+        return self.busy_time / (self.wall_time * self.n_workers) if self.wall_time > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f'{self.n_batches} batches on {self.n_workers} workers in {self.wall_time:.2f}s, loading: {self.load_time:.2f}s, parallel efficiency: {self.efficiency:.1%}'
+
+
+def _timed(fn: Callable, file: str, indices: List[int]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    res = fn(file, indices)
+    return res, time.perf_counter() - start
+
+
+def run_batches(executor: Executor, n_workers: int, fn: Callable[[str, List[int]], Any], batches: List[Batch]) -> Tuple[List[Tuple[Batch, Any]], List[Batch], ScheduleReport]:
+    """
+    Run fn(file, indices) on each batch in the executor, largest batches first.
+    At most n_workers batches are in flight, and a worker that becomes idle
+    takes the largest remaining batch, so no batch waits behind a slow one
+    assigned in advance. If a result has a load_time, e.g., a
+    VerificationResult, the time spent loading is reported apart from the
+    busy time. Returns the results, the batches that raised an exception,
+    which are logged and left out of the results, and the parallel
+    efficiency.
+    """
+    pending = list(reversed(batches)) # the largest batch is popped first
+    running = {}
+    results = []
+    failed = []
+    busy_time = 0.0
+    load_time = 0.0
+    start = time.perf_counter()
+    with tqdm(total=len(batches), position=0, leave=True) as progress:
+        while pending or running:
+            while pending and len(running) < n_workers:
+                batch = pending.pop()
+                running[executor.submit(_timed, fn, batch.file, batch.indices)] = batch
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = running.pop(future)
+                progress.update(1)
+                try:
+                    res, elapsed = future.result()
+                except Exception as e:
+                    logging.getLogger(__name__).error(f"Error processing {len(batch.indices)} FECs of {batch.file}: {e}")
+                    failed.append(batch)
+                    continue
+                batch_load_time = getattr(res, 'load_time', 0.0)
+                busy_time += elapsed - batch_load_time
+                load_time += batch_load_time
+                results.append((batch, res))
+    report = ScheduleReport(n_workers, len(batches), time.perf_counter() - start, busy_time, load_time)
+    return results, failed, report
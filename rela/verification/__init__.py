@@ -1,2 +1,2 @@
-from .verificationresult import VerificationResult
+from .verificationresult import VerificationResult, TierReport
 from .specverifier import SpecVerifier
\ No newline at end of file
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+import hashlib
+
+from ..automata.cache import graph_hash, path_set_hash
+from ..language.regularir import Spec, SAnd, SOr, SNot, SPrefixITE
+from ..language.ip.guard import IPGuard
+from ..networkmodel.fec import FEC, PathFEC
+
+
+"""
+@author: agent
+@date: 2026.10.17
+@description: This file implements the structural fingerprint of FECs used to
+deduplicate verification. Two FECs with the same fingerprint have the same
+verdict for a spec, so only one representative of each group is verified.
+"""
+
+def _collect_guards(expr: Spec, guards: List[IPGuard]) -> List[IPGuard]:
+    """
+    Collect the guards of all SPrefixITE sub-specs in a fixed order.
+    """
+    if isinstance(expr, SPrefixITE):
+        guards.append(expr.guard)
+    if isinstance(expr, (SAnd, SOr, SPrefixITE)):
+        _collect_guards(expr.p, guards)
+        _collect_guards(expr.q, guards)
+    elif isinstance(expr, SNot):
+        _collect_guards(expr.p, guards)
+    return guards
+
+def fec_fingerprint(expr: Spec, fec: FEC, portable: bool = True) -> str:
+    """
+    Compute the fingerprint of a FEC for a spec: the canonical hashes of the
+    before and after states, and the outcome of every guard of the spec on the
+    IP traffic keys of the FEC, which determines the SPrefixITE branches taken.
+    If portable, interned symbols are hashed by name, so fingerprints can be
+    compared across network changes; otherwise only fingerprints of FECs that
+    share a symbol table are comparable.
+    """
+    guards = _collect_guards(expr, [])
+    ips = fec.get_ip_traffic_keys() if guards else []
+    branches = tuple(any(guard.contains(ip) for ip in ips) for guard in guards)
+    if isinstance(fec, PathFEC):
+        before = path_set_hash(fec.get_before_state())
+        after = path_set_hash(fec.get_after_state())
+    else:
+        symbols = fec.get_symbol_table() if portable else None
+        before = graph_hash(fec.get_before_state(), symbols)
+        after = graph_hash(fec.get_after_state(), symbols)
+    return hashlib.blake2b(repr((before, after, branches)).encode('utf8'), digest_size=16).hexdigest()
+
+def group_by_fingerprint(fingerprints: Dict[Any, str]) -> Dict[Any, List[Any]]:
+    """
+    Group cases by their fingerprints. Returns a mapping from the
+    representative of each group, i.e., its first case, to all members of the
+    group (including the representative).
+    """
+    groups: Dict[str, List[Any]] = {}
+    for case, fingerprint in fingerprints.items():
+        groups.setdefault(fingerprint, []).append(case)
+    return {members[0]: members for members in groups.values()}
@@ -1,18 +1,23 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import time
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 import logging
 from tqdm import tqdm
 import multiprocessing
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-from ..automata.utils import fst_eq, fst_subseteq
-from ..automata import FSTConstructor, FSA
+from ..automata import FSTConstructor, FSA, AutomataBackend, AutomataCache, SubexpressionCache, get_backend
+from ..automata.plan import SpecPlanner, VerificationPlan, AtomicPlan, Verdict
 from ..networkmodel.networkchange import NetworkChange, NetworkPath
 from ..networkmodel.fec import FEC
 from ..language.regularir.rirvisitor import SpecVisitor
-from ..language.regularir import SEqual, SSubsetEq, Spec, SPrefixITE
+from ..language.regularir import Spec
+from ..language.regularir.simplifier import RIRSimplifier
+from ..language.hashcons import NodeTable
 from .verificationresult import VerificationResult
+from .dedup import fec_fingerprint
 
 
 """
@@ -22,10 +27,69 @@ from .verificationresult import VerificationResult
 compliance for Rela RIR spec.
 """
 
+# the number of ranges of FECs per worker in parallel verification
+RANGES_PER_WORKER = 4
+# the maximum number of FECs of a range, and the number of ranges per worker
+# that are submitted ahead of the fingerprinting of the FECs
+MAX_RANGE_SIZE = 64
+IN_FLIGHT_PER_WORKER = 2
+
+
+# the network change, plan, backend and automata caches of a worker process
+# of a parallel verification, set once by _init_range_worker
+_range_worker = None
+
+def _init_range_worker(network_change: NetworkChange, plan: VerificationPlan, backend: str, cache: bool, memo: bool):
+    """
+    Initialize a worker process of a parallel verification. The network
+    change is sent to the worker once (a binary one is mapped again), so
+    that tasks only carry FEC indices, and all FECs verified by the worker
+    share its symbol table, which the caches of the worker are keyed by.
+    """
+    global _range_worker
+    _range_worker = (network_change, plan, get_backend(backend), AutomataCache() if cache else None, SubexpressionCache() if memo else None)
+
+def _verify_range(indices: Sequence[int]) -> Tuple[Dict[int, Verdict], int, int]:
+    """
+    Verify the FECs of the given increasing indices in a worker process.
+    Returns the verdict of each FEC that was not skipped, and the hits and
+    misses of the automata cache.
+    """
+    network_change, plan, backend, cache, memo = _range_worker
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    selected = indices if isinstance(indices, range) else set(indices)
+    verdicts = {}
+    start, stop = indices[0], indices[-1] + 1
+    for i, fec in zip(range(start, stop), network_change.iterate_range(start, stop)):
+        if i not in selected or fec is None:
+            continue
+        try:
+            verdicts[i] = SpecVerifier._verify_single_fec(plan, fec, backend, cache, memo)
+        except Exception:
+            continue
+    if cache is None:
+        return verdicts, 0, 0
+    return verdicts, cache.hits - hits, cache.misses - misses
+
+
 @dataclass
 class SpecVerifier(SpecVisitor):
     network_change: NetworkChange
     selected_indices: List[int] = None
+    backend: str = 'hfst'
+    cache: AutomataCache = field(default_factory=AutomataCache)
+    memo: SubexpressionCache = field(default_factory=SubexpressionCache)
+    # verify one representative of FECs with the same fingerprint
+    dedup: bool = True
+    # rewrite specs into simpler equivalent ones before verification, or None
+    simplifier: Optional[RIRSimplifier] = field(default_factory=RIRSimplifier)
+    # share structurally equal subexpressions of specs, or None
+    nodes: Optional[NodeTable] = field(default_factory=NodeTable)
+    # verify ranges of FECs in a pool of this many processes if more than one
+    n_workers: int = 1
+    # the plans of specs, keyed by spec node, which can be shared by verifiers
+    # that share nodes, e.g., in a worker process, or None
+    plans: Optional[Dict[int, Tuple[Spec, VerificationPlan]]] = field(default_factory=dict)
 
     @staticmethod
     def _extract_alphabet(fec: FEC) -> set:
@@ -35,18 +99,18 @@ class SpecVerifier(SpecVisitor):
         return fec.compute_alphabet()
     
     @staticmethod
-    def verify(spec: Spec, network_change: NetworkChange) -> VerificationResult:
+    def verify(spec: Spec, network_change: NetworkChange, backend: str = 'hfst') -> VerificationResult:
         """
         Verify the given spec on the given network change.
         """
-        verifier = SpecVerifier(network_change)
+        verifier = SpecVerifier(network_change, backend=backend)
         return spec.accept(verifier)
     
-    def _verify_atomic_spec(self, expr: Spec) -> VerificationResult:
+    def _verify_spec(self, expr: Spec) -> VerificationResult:
         res = True
 
         logger = logging.getLogger(__name__)
-        logger.info(f'Verifying atomic spec: {expr}')
+        logger.info(f'Verifying spec: {expr}')
         N = self.network_change.count_fec()
         if N == 0:
             logger.warn(f'No FEC found, verification skipped')
@@ -64,136 +128,230 @@ class SpecVerifier(SpecVisitor):
             skipped_cases=[]
         )
         
+        if self.simplifier is not None:
+            nodes_before, nodes_after = self.simplifier.nodes_before, self.simplifier.nodes_after
+            spec = self.simplifier.simplify(expr)
+            logger.info(f'Simplified spec from {self.simplifier.nodes_before - nodes_before} to {self.simplifier.nodes_after - nodes_after} nodes')
+        else:
+            spec = expr
+        if self.nodes is not None:
+            spec = self.nodes.intern(spec)
+        # the spec is lowered once, and its plan is executed for each FEC
+        plan = self._lower(spec)
+
+        backend = get_backend(self.backend)
+        hits, misses = self.cache.hits, self.cache.misses
         start = time.perf_counter()
+        if self.n_workers > 1:
+            n_distinct = self._verify_parallel(res, spec, plan)
+        else:
+            n_distinct = self._verify_serial(res, spec, plan, backend)
+        end = time.perf_counter()
+        res.cache_hits += self.cache.hits - hits
+        res.cache_misses += self.cache.misses - misses
+
+        logger.info(f'Verification completed, flow equivalent classes: {N}, time per FEC: {(end - start) / N:.6f}, distinct FECs: {n_distinct}, automata cache hits: {res.cache_hits}, misses: {res.cache_misses}')
+        return res
+
+    def _lower(self, spec: Spec) -> VerificationPlan:
+        """
+        Get the plan of a spec, reusing the plan of the same spec node.
+        """
+        if self.plans is None:
+            return SpecPlanner.lower(spec)
+        # specs are unhashable, so they are keyed by id, keeping a reference
+        # so that the id is not reused
+        entry = self.plans.get(id(spec))
+        if entry is None:
+            entry = (spec, SpecPlanner.lower(spec))
+            self.plans[id(spec)] = entry
+        return entry[1]
+
+    @staticmethod
+    def _record(res: VerificationResult, i: int, verdict: Optional[Verdict]):
+        """
+        Record the verdict of FEC #i, or a skipped case if the verdict is None.
+        """
+        if verdict is None:
+            res.n_skipped += 1
+            res.skipped_cases.append(i)
+            return
+        slice_res, witness = verdict
+        if slice_res:
+            res.n_passed += 1
+            res.passed_cases.append(i)
+        else:
+            res.n_failed += 1
+            res.failed_cases.append(i)
+            if witness is not None:
+                res.witnesses.append((i, witness))
+
+    def _verify_serial(self, res: VerificationResult, spec: Spec, plan: VerificationPlan, backend: AutomataBackend) -> int:
+        """
+        Verify the FECs one by one in this process. Returns the number of
+        distinct FECs.
+        """
+        N = self.network_change.count_fec()
+        verdicts = {} # fingerprint -> verdict of the representative FEC
         pid = multiprocessing.current_process()._identity[0] if multiprocessing.current_process()._identity else 0
         for i, fec in enumerate(tqdm(self.network_change.iterate(), total=N, position=pid, disable=(pid > 10), desc=self.network_change.get_name(), leave=False)):
             if self.selected_indices is not None and i not in self.selected_indices:
-                res.n_skipped += 1
-                res.skipped_cases.append(i)
+                SpecVerifier._record(res, i, None)
                 continue
             try:
-                slice_res = SpecVerifier._verify_atomic_spec_single_fec(expr, fec)
+                if self.dedup:
+                    fingerprint = fec_fingerprint(spec, fec, portable=False)
+                    if fingerprint not in verdicts:
+                        verdicts[fingerprint] = None # skipped unless verified
+                        verdicts[fingerprint] = SpecVerifier._verify_single_fec(plan, fec, backend, self.cache, self.memo)
+                    if verdicts[fingerprint] is None:
+                        raise Exception('representative FEC was skipped')
+                    verdict = verdicts[fingerprint]
+                else:
+                    verdict = SpecVerifier._verify_single_fec(plan, fec, backend, self.cache, self.memo)
             except Exception as e:
                 #logger.warn(f'Exception raised when verifying FEC #{i}: {e}')
                 #import traceback
                 #traceback.print_exc()
-                res.n_skipped += 1
-                res.skipped_cases.append(i)
-                continue
-            res.n_failed += 1 if not slice_res else 0
-            res.n_passed += 1 if slice_res else 0
-            if slice_res:
-                res.passed_cases.append(i)
-            if not slice_res:
-                res.failed_cases.append(i)
-        end = time.perf_counter()
+                verdict = None
+            SpecVerifier._record(res, i, verdict)
+        return len(verdicts) if self.dedup else N
 
-        logger.info(f'Verification completed, flow equivalent classes: {N}, time per FEC: {(end - start) / N:.6f}')
-        return res
-    
-    @staticmethod
-    def _construct_fsas(expr: Spec, alphabet: set, fec: FEC) -> Tuple[FSA, FSA]:
+    def _verify_parallel(self, res: VerificationResult, spec: Spec, plan: VerificationPlan) -> int:
         """
-        Construct the FSA for the left and right side of the spec.
+        Verify the FECs in a pool of n_workers processes, each of which gets
+        the network change once. The FECs to verify (one per fingerprint if
+        dedup is set) are split into ranges of increasing indices, each range
+        is verified by one task that only carries the indices, and the
+        verdicts are recorded in the order of the FECs, as in _verify_serial.
+        With dedup, the FECs are iterated here to fingerprint them, and
+        ranges are submitted meanwhile, with at most IN_FLIGHT_PER_WORKER
+        ranges per worker pending. Returns the number of distinct FECs.
         """
-        constructor = FSTConstructor(alphabet, fec)
-        left_fsa = expr.p.accept(constructor)
-        right_fsa = expr.q.accept(constructor)
-        return left_fsa, right_fsa
+        # a few ranges per worker, so that workers that finish early take more
+        N = self.network_change.count_fec()
+        size = min(MAX_RANGE_SIZE, max(1, -(-N // (self.n_workers * RANGES_PER_WORKER))))
+        representatives = [] # index of the FEC whose verdict each FEC takes, or None
+        verdicts = {}
+        pending = set()
+
+        def to_verify() -> Iterator[int]:
+            """
+            Get the indices of the FECs to verify, and record the
+            representative of each FEC.
+            """
+            if not self.dedup:
+                for i in range(N):
+                    selected = self.selected_indices is None or i in self.selected_indices
+                    representatives.append(i if selected else None)
+                    if selected:
+                        yield i
+                return
+            fingerprints = {} # fingerprint -> index of the representative FEC
+            for i, fec in enumerate(self.network_change.iterate()):
+                if self.selected_indices is not None and i not in self.selected_indices:
+                    representatives.append(None)
+                    continue
+                try:
+                    fingerprint = fec_fingerprint(spec, fec, portable=False)
+                except Exception:
+                    representatives.append(None)
+                    continue
+                if fingerprint in fingerprints:
+                    representatives.append(fingerprints[fingerprint])
+                    continue
+                fingerprints[fingerprint] = i
+                representatives.append(i)
+                yield i
+
+        def collect(futures):
+            for future in futures:
+                range_verdicts, hits, misses = future.result()
+                verdicts.update(range_verdicts)
+                res.cache_hits += hits
+                res.cache_misses += misses
+
+        n_tasks = 0
+        initargs = (self.network_change, plan, self.backend, self.cache is not None, self.memo is not None)
+        with ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_range_worker, initargs=initargs) as executor:
+            def submit(indices: List[int]):
+                nonlocal pending
+                while len(pending) >= self.n_workers * IN_FLIGHT_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                # consecutive indices are sent as a range
+                if indices[-1] - indices[0] == len(indices) - 1:
+                    indices = range(indices[0], indices[-1] + 1)
+                pending.add(executor.submit(_verify_range, indices))
+
+            indices = [] # the indices of the FECs of the next range
+            for i in to_verify():
+                indices.append(i)
+                n_tasks += 1
+                if len(indices) == size:
+                    submit(indices)
+                    indices = []
+            if indices:
+                submit(indices)
+            collect(pending)
+
+        for i, representative in enumerate(representatives):
+            SpecVerifier._record(res, i, verdicts.get(representative))
+        return n_tasks
 
     @staticmethod
-    def _verify_atomic_spec_single_fec(expr: Spec, fec: FEC) -> bool:
+    def _verify_single_fec(plan: VerificationPlan, fec: FEC, backend: AutomataBackend, cache: AutomataCache = None, memo: SubexpressionCache = None) -> Verdict:
         """
-        Verify an atomic spec on a single fec.
+        Verify the plan of a spec on a single fec in one pass, where all
+        atomic specs share the alphabet and the preState and postState
+        automata of the FEC. Returns the verdict, and for a failed spec, a
+        path that distinguishes the two sides of a failed atomic spec.
         """
         alphabet = SpecVerifier._extract_alphabet(fec)
-        
-        # selects a sub-spec by testing whether this FEC overlaps with the guard
-        while isinstance(expr, SPrefixITE):
-            ips = fec.get_ip_traffic_keys()
-            then_branch = False
-            for ip in ips:
-                if expr.guard.contains(ip):
-                    then_branch = True
-                    break
-            expr = expr.p if then_branch else expr.q
-            
+        constructor = FSTConstructor(alphabet, fec, backend, fec.get_symbol_table(), cache, memo)
+        return plan.evaluate(fec, partial(SpecVerifier._check_atomic_plan, constructor))
+
+    @staticmethod
+    def _check_atomic_plan(constructor: FSTConstructor, atomic_plan: AtomicPlan) -> Verdict:
+        """
+        Check an atomic spec on the FEC of a constructor.
+        """
+        backend = constructor.backend
 
         # construct FSTs for the left and right side of the spec
-        left_fsa, right_fsa = SpecVerifier._construct_fsas(expr, alphabet, fec)
+        left_fsa, right_fsa = constructor.execute(atomic_plan)
 
         # check automata equivalence
-        if isinstance(expr, SEqual):
-            res = fst_eq(left_fsa, right_fsa)
-        elif isinstance(expr, SSubsetEq):
-            res = fst_subseteq(left_fsa, right_fsa)
+        witness = None
+        if atomic_plan.relation == 'eq':
+            witness = backend.fst_eq_witness(left_fsa, right_fsa)
+            res = witness is None
+        elif atomic_plan.relation == 'subseteq':
+            witness = backend.fst_subseteq_witness(left_fsa, right_fsa)
+            res = witness is None
         else:
             raise Exception('invalid set operator')
-        
-        return res
 
+        symbols = constructor.symbols
+        if witness is not None and symbols is not None:
+            witness = symbols.names(witness)
+        
+        return res, witness
 
     def visit_s_equal(self, expr: Spec) -> VerificationResult:
-        return self._verify_atomic_spec(expr)
+        return self._verify_spec(expr)
     
     def visit_s_subset_eq(self, expr: Spec) -> VerificationResult:
-        return self._verify_atomic_spec(expr)
+        return self._verify_spec(expr)
     
     def visit_s_ite(self, expr):
-        return self._verify_atomic_spec(expr)
+        return self._verify_spec(expr)
     
     def visit_s_not(self, expr: Spec) -> VerificationResult:
-        p_res = expr.p.accept(self)
-        return VerificationResult(
-            data=p_res.data,
-            spec=str(expr),
-            n_total=p_res.n_total,
-            n_passed=p_res.n_failed,
-            n_failed=p_res.n_passed,
-            n_skipped=p_res.n_skipped,
-            passed_cases=p_res.failed_cases,
-            failed_cases=p_res.passed_cases,
-            skipped_cases=p_res.skipped_cases
-        )
+        return self._verify_spec(expr)
     
     def visit_s_and(self, expr: Spec) -> VerificationResult:
-        p_res = expr.p.accept(self)
-        q_res = expr.q.accept(self)
-        skipped_cases = set(p_res.skipped_cases) | set(q_res.skipped_cases)
-        passed_cases = set(p_res.passed_cases) & set(q_res.passed_cases)
-        passed_cases = passed_cases - skipped_cases
-        failed_cases = set(p_res.failed_cases) | set(q_res.failed_cases)
-        failed_cases = failed_cases - skipped_cases
-        return VerificationResult(
-            data=p_res.data,
-            spec=str(expr),
-            n_total=p_res.n_total,
-            n_passed=len(passed_cases),
-            n_failed=len(failed_cases),
-            n_skipped=len(skipped_cases),
-            passed_cases=list(passed_cases),
-            failed_cases=list(failed_cases),
-            skipped_cases=list(skipped_cases)
-        )
+        return self._verify_spec(expr)
     
     def visit_s_or(self, expr: Spec) -> VerificationResult:
-        p_res = expr.p.accept(self)
-        q_res = expr.q.accept(self)
-        skipped_cases = set(p_res.skipped_cases) | set(q_res.skipped_cases)
-        passed_cases = set(p_res.passed_cases) | set(q_res.passed_cases)
-        passed_cases = passed_cases - skipped_cases
-        failed_cases = set(p_res.failed_cases) & set(q_res.failed_cases)
-        failed_cases = failed_cases - skipped_cases
-        return VerificationResult(
-            data=p_res.data,
-            spec=str(expr),
-            n_total=p_res.n_total,
-            n_passed=len(passed_cases),
-            n_failed=len(failed_cases),
-            n_skipped=len(skipped_cases),
-            passed_cases=list(passed_cases),
-            failed_cases=list(failed_cases),
-            skipped_cases=list(skipped_cases)
-        )
-    
-    
+        return self._verify_spec(expr)
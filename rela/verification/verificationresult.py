@@ -1,4 +1,30 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+@dataclass
+class TierReport:
+    """
+    The FECs verified at one precision of a tiered verification, see
+    rela.main.verify_network_change, and the time spent verifying them.
+    """
+    precision: str
+    n_verified: int = 0
+    n_passed: int = 0
+    n_failed: int = 0
+    n_skipped: int = 0
+    time: float = 0.0
+
+    def merge(self, other: 'TierReport'):
+        """
+        Add the counts and the time of the same tier of another result.
+        """
+        self.n_verified += other.n_verified
+        self.n_passed += other.n_passed
+        self.n_failed += other.n_failed
+        self.n_skipped += other.n_skipped
+        self.time += other.time
+
+    def __str__(self):
+        return f'{self.precision}: {self.n_passed} passed, {self.n_failed} failed, {self.n_skipped} skipped of {self.n_verified} FECs in {self.time:.2f}s'
 
 @dataclass
 class VerificationResult:
@@ -11,6 +37,16 @@ class VerificationResult:
     passed_cases: list
     failed_cases: list
     skipped_cases: list
+    # (case, witness) pairs, where the witness is a path that distinguishes
+    # the two sides of a failed spec
+    witnesses: list = field(default_factory=list)
+    # lookups of network state automata in the automata cache
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # the report of each tier of a tiered verification, from the coarsest
+    tiers: list = field(default_factory=list)
+    # the time spent loading network changes, in seconds, if measured
+    load_time: float = 0.0
 
     def __bool__(self):
         return self.n_failed == 0 and self.n_passed > 0
@@ -0,0 +1,72 @@
+import argparse
+import sys
+import os
+import time
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(this_dir)
+sys.path.append(project_dir)
+
+from rela.main import load_network_change
+from rela.verification.specverifier import SpecVerifier
+from specs.dict import defined_specs
+
+def parse() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-d",
+        "--data",
+        type=str,
+        default="dataset/graph_change_anonymized/chunk_22_112.json",
+        help="Path to the file to be checked",
+    )
+    parser.add_argument(
+        "-P",
+        "--precision",
+        type=str,
+        default="interface",
+        choices=["interface", "device", "devicegroup"],
+        help="Precision of the verification",
+    )
+    parser.add_argument(
+        "-m",
+        "--mapping-file",
+        type=str,
+        required=False,
+        help="Path to the mapping file from device to device group",
+    )
+    parser.add_argument(
+        "--spec",
+        type=str,
+        default="preserve_fe",
+        choices=defined_specs.keys(),
+        help="Spec to be verified",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of runs of each backend, of which the fastest is reported",
+    )
+    return parser.parse_args()
+
+def main():
+    """
+    Compare the time of verifying a spec on a single file with each automata
+    backend. The file is loaded once, and each run uses new caches.
+    """
+    args = parse()
+    state = load_network_change(args.data, 'graph', args.precision, args.mapping_file)
+    spec = defined_specs[args.spec]
+    for backend in ['hfst', 'native']:
+        elapsed = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            res = spec.accept(SpecVerifier(state, backend=backend))
+            elapsed.append(time.perf_counter() - start)
+        print(f'{backend}: {min(elapsed):.2f}s, {res.n_passed}/{res.n_total} cases passed')
+
+
+if __name__ == "__main__":
+    main()
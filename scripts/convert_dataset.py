@@ -0,0 +1,67 @@
+import argparse
+import sys
+import os
+import logging
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(this_dir)
+sys.path.append(project_dir)
+
+from rela.networkmodel.relagraphformat.binary import convert_json
+
+def parse() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Convert network changes in graph format (JSON) to the binary format, which is verified with --format binary")
+    parser.add_argument(
+        "-d",
+        "--data",
+        type=str,
+        required=True,
+        help="Path to the file or directory of files to be converted",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=True,
+        help="Path to the output file, or the output directory if data is a directory",
+    )
+    parser.add_argument(
+        "-n",
+        "--n-cpus",
+        type=int,
+        required=False,
+        help="Number of CPUs to use for converting a directory",
+    )
+    return parser.parse_args()
+
+def binary_name(file: str) -> str:
+    """
+    Name the binary file of a JSON file, e.g., chunk_0.json -> chunk_0.bin.
+    """
+    return os.path.splitext(file)[0] + '.bin'
+
+def main():
+    args = parse()
+    if not os.path.isdir(args.data):
+        n_fecs = convert_json(args.data, args.output)
+        print(f'Converted {n_fecs} FECs to {args.output}')
+        return
+
+    os.makedirs(args.output, exist_ok=True)
+    files = [file for file in os.listdir(args.data) if file.endswith('.json')]
+    n_fecs = 0
+    with ProcessPoolExecutor(max_workers=args.n_cpus) as executor:
+        futures = {executor.submit(convert_json, os.path.join(args.data, file), os.path.join(args.output, binary_name(file))): file for file in files}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                n_fecs += future.result()
+            except Exception as e:
+                print(f'Exception raised when converting {futures[future]}: {e}')
+    print(f'Converted {n_fecs} FECs in {len(files)} files to {args.output}')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -3,6 +3,8 @@ import sys
 import os
 import logging
 import json
+import dataclasses
+from functools import partial
 from tqdm import tqdm
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
@@ -10,7 +12,8 @@ this_dir = os.path.dirname(os.path.abspath(__file__))
 project_dir = os.path.dirname(this_dir)
 sys.path.append(project_dir)
 
-from rela.main import generate_counterexamples
+from rela.main import generate_counterexamples, init_worker, generate_counterexamples_in_worker, estimate_in_worker
+from rela.scheduler import make_batches, run_batches
 from specs.dict import defined_specs
 from rela.language import *
 from rela.counterexample.counterexample import CounterExampleGenerationResult, CounterExample
@@ -57,8 +60,8 @@ def parse() -> argparse.Namespace:
         "--format",
         type=str,
         required=True,
-        choices=["path", "graph"],
-        help="Format of the file to be checked, path or graph",
+        choices=["path", "graph", "binary"],
+        help="Format of the file to be checked, path, graph, or binary (see scripts/convert_dataset.py)",
     )
     parser.add_argument(
         "-P",
@@ -75,6 +78,15 @@ def parse() -> argparse.Namespace:
         required=False,
         help="Path to the mapping file for devicegroup level forwarding graph",
     )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        required=False,
+        choices=["hfst", "native"],
+        default="hfst",
+        help="Automata backend, hfst or native",
+    )
     parser.add_argument(
         "-n",
         "--n-cpus",
@@ -112,6 +124,9 @@ def parse() -> argparse.Namespace:
 def to_key(counterexample: CounterExample) -> tuple:
     return (frozenset(counterexample.before_paths), frozenset(counterexample.after_paths), frozenset(counterexample.left_paths), frozenset(counterexample.right_paths), counterexample.spec)
 
+def generate_batch(data: str, file: str, indices: list) -> CounterExampleGenerationResult:
+    return generate_counterexamples_in_worker(os.path.join(data, file), indices)
+
 def main():
     args = parse()
     if args.precision == 'devicegroup' and args.mapping_file is None:
@@ -157,29 +172,44 @@ def main():
             error_cases=[],
             counter_examples=[]
         )
-        with ProcessPoolExecutor(max_workers=args.n_cpus, initializer=tqdm.set_lock, initargs=(tqdm.get_lock(),)) as executor:
-            futures = {}
-            for file, indices in failed_cases_by_file.items():
-                in_file = os.path.join(args.data, file)
-                out_file = os.path.join(args.output, file) if args.output is not None else None
-                future = executor.submit(generate_counterexamples, spec, in_file, args.format, args.precision, indices, out_file, args.mapping_file)
-                futures[future] = file
-            
-            for f in tqdm(as_completed(futures.keys()), total=len(failed_cases_by_file), position=0, leave=True):
+        n_workers = args.n_cpus if args.n_cpus is not None else os.cpu_count()
+        # workers load the spec and the mapping once, and tasks only carry
+        # file names and FEC indices
+        initargs = (spec, args.format, args.precision, args.mapping_file, args.backend, 'default', tqdm.get_lock())
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=initargs) as executor:
+            # estimate the cost of each failed case to schedule batches by cost
+            futures = {executor.submit(estimate_in_worker, os.path.join(args.data, file), indices): file for file, indices in failed_cases_by_file.items()}
+            costs = {}
+            for f in as_completed(futures.keys()):
                 try:
-                    chunk_res = f.result()
-                    res.n_cases += chunk_res.n_cases
-                    res.error_cases.extend(chunk_res.error_cases)
-                    res.counter_examples.extend(chunk_res.counter_examples)
+                    costs[futures[f]] = f.result()[2]
                 except Exception as e:
                     print(f'Exception raised when generating counterexamples for {futures[f]}: {e}')
-                    continue
+
+            batches = make_batches(costs, n_workers)
+            batch_results, failed, report = run_batches(executor, n_workers, partial(generate_batch, args.data), batches)
+            # the failed cases of the batches that raised an exception are errors
+            for batch in failed:
+                res.n_cases += len(batch.indices)
+                res.error_cases.extend((batch.file, i) for i in batch.indices)
+            counter_examples_by_file = {}
+            for batch, chunk_res in sorted(batch_results, key=lambda result: (result[0].file, result[0].indices[0])):
+                res.n_cases += chunk_res.n_cases
+                res.error_cases.extend(chunk_res.error_cases)
+                res.counter_examples.extend(chunk_res.counter_examples)
+                counter_examples_by_file.setdefault(batch.file, []).extend(chunk_res.counter_examples)
+
+        if args.output is not None:
+            for file, counter_examples in counter_examples_by_file.items():
+                with open(os.path.join(args.output, file), 'w') as f:
+                    json.dump([dataclasses.asdict(c) for c in counter_examples], f, indent=2)
 
         logging.getLogger().setLevel(logging.INFO)
+        print(f'Schedule: {report}')
     else:
         #failed_cases = [case[1] for case in failed_cases]
         out_file = args.output if args.output is not None else None
-        res = generate_counterexamples(spec, args.data, args.format, args.precision, failed_cases, out_file, args.mapping_file)
+        res = generate_counterexamples(spec, args.data, args.format, args.precision, failed_cases, out_file, args.mapping_file, args.backend)
 
     print(f'Generated {len(res.counter_examples)} counterexamples for {res.n_cases} failed cases')
     if len(res.error_cases) > 0:
@@ -4,6 +4,7 @@ import os
 from dataclasses import asdict
 import logging
 import json
+from functools import partial
 from tqdm import tqdm
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
@@ -11,10 +12,13 @@ this_dir = os.path.dirname(os.path.abspath(__file__))
 project_dir = os.path.dirname(this_dir)
 sys.path.append(project_dir)
 
-from rela.main import verify_network_change
-from specs.dict import defined_specs
+from rela.main import verify_network_change, check_tiers, init_worker, verify_in_worker, fingerprint_in_worker, estimate_in_worker
+from rela.scheduler import make_batches, run_batches
+from specs.dict import defined_specs, sound_precisions
 from rela.language import *
-from rela.verification import VerificationResult
+from rela.verification import VerificationResult, TierReport
+from rela.verification.dedup import group_by_fingerprint
+from rela.language.regularir import Spec
 
 def parse() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
@@ -46,8 +50,8 @@ def parse() -> argparse.Namespace:
         "--format",
         type=str,
         required=True,
-        choices=["path", "graph"],
-        help="Format of the file to be checked, path or graph",
+        choices=["path", "graph", "binary"],
+        help="Format of the file to be checked, path, graph, or binary (see scripts/convert_dataset.py)",
     )
     parser.add_argument(
         "-P",
@@ -64,13 +68,22 @@ def parse() -> argparse.Namespace:
         required=False,
         help="Path to the mapping file for devicegroup level forwarding graph",
     )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        required=False,
+        choices=["hfst", "native"],
+        default="hfst",
+        help="Automata backend, hfst or native",
+    )
     parser.add_argument(
         "-n",
         "--n-cpus",
         type=int,
         required=False,
         default=None,
-        help="Number of CPUs to use",
+        help="Number of CPUs to use, all by default for a directory, and one by default for a single file",
     )
     parser.add_argument(
         "-S",
@@ -86,8 +99,195 @@ def parse() -> argparse.Namespace:
         required=False,
         help="Use previous verification result to skip passed cases",
     )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Verify every FEC, instead of one FEC per group of structurally identical FECs across files",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the FECs of a single file one by one while verifying them, instead of loading the whole file",
+    )
+    parser.add_argument(
+        "-T",
+        "--tiers",
+        type=str,
+        nargs="+",
+        required=False,
+        choices=["device", "devicegroup"],
+        help="Verify at these coarser precisions first, and only verify the FECs that do not pass at the given precision; the spec must be sound at them (see specs/dict.py)",
+    )
     return parser.parse_args()
 
+def empty_result(data: str, spec: str, n_total: int = 0) -> VerificationResult:
+    return VerificationResult(
+        data=data,
+        spec=spec,
+        n_total=n_total,
+        n_passed=0,
+        n_failed=0,
+        n_skipped=0,
+        passed_cases=[],
+        failed_cases=[],
+        skipped_cases=[]
+    )
+
+def merge_result(res: VerificationResult, chunk_res: VerificationResult):
+    """
+    Merge the result of a single file into the result of the directory.
+    """
+    res.n_total += chunk_res.n_total
+    res.n_passed += chunk_res.n_passed
+    res.n_failed += chunk_res.n_failed
+    res.n_skipped += chunk_res.n_skipped
+    res.passed_cases += [(chunk_res.data, case) for case in chunk_res.passed_cases]
+    res.failed_cases += [(chunk_res.data, case) for case in chunk_res.failed_cases]
+    res.skipped_cases += [(chunk_res.data, case) for case in chunk_res.skipped_cases]
+    res.witnesses += [((chunk_res.data, case), witness) for case, witness in chunk_res.witnesses]
+    res.cache_hits += chunk_res.cache_hits
+    res.cache_misses += chunk_res.cache_misses
+    res.load_time += chunk_res.load_time
+    merge_tiers(res.tiers, chunk_res.tiers)
+
+def merge_tiers(tiers: list, chunk_tiers: list):
+    """
+    Merge the tier reports of a file or a batch into those of the directory.
+    """
+    if not tiers:
+        tiers += [TierReport(tier.precision) for tier in chunk_tiers]
+    for tier, chunk_tier in zip(tiers, chunk_tiers):
+        tier.merge(chunk_tier)
+
+def run_files(executor: ProcessPoolExecutor, fn, data: str, selected: dict) -> dict:
+    """
+    Run fn(file, selected_indices=indices) on each selected file in the data
+    directory in parallel, and collect the results by file. Files that raise
+    an exception are left out.
+    """
+    futures = {}
+    for file, indices in selected.items():
+        future = executor.submit(fn, os.path.join(data, file), selected_indices=indices)
+        futures[future] = file
+
+    results = {}
+    for f in tqdm(as_completed(futures.keys()), total=len(futures), position=0, leave=True):
+        try:
+            results[futures[f]] = f.result()
+        except Exception as e:
+            print(f'Exception raised when verifying {futures[f]}: {e}')
+    return results
+
+def verify_batch(fn, data: str, file: str, indices: list) -> VerificationResult:
+    return fn(os.path.join(data, file), selected_indices=indices)
+
+def verify_scheduled(executor: ProcessPoolExecutor, n_workers: int, args: argparse.Namespace, spec: Spec, costs: dict) -> tuple:
+    """
+    Verify the FECs given by their estimated cost in each file, in batches
+    scheduled by cost. Returns the batch results, the failed batches and the
+    schedule report.
+    """
+    batches = make_batches(costs, n_workers)
+    return run_batches(executor, n_workers, partial(verify_batch, partial(verify_in_worker, dedup=False), args.data), batches)
+
+def merge_batches(spec: Spec, files: dict, batch_results: list) -> dict:
+    """
+    Merge the results of the batches of each file into the result of the file.
+    files maps each file to its name and number of FECs; FECs that are not
+    in a verified batch are skipped. Returns the result of each file.
+    """
+    results = {file: empty_result(name, str(spec), n_total) for file, (name, n_total) in files.items()}
+    verified = {file: set() for file in files}
+    for batch, chunk_res in batch_results:
+        indices = set(batch.indices)
+        res = results[batch.file]
+        res.passed_cases += chunk_res.passed_cases
+        res.failed_cases += chunk_res.failed_cases
+        res.skipped_cases += [i for i in chunk_res.skipped_cases if i in indices]
+        res.witnesses += chunk_res.witnesses
+        res.cache_hits += chunk_res.cache_hits
+        res.cache_misses += chunk_res.cache_misses
+        res.load_time += chunk_res.load_time
+        merge_tiers(res.tiers, chunk_res.tiers)
+        verified[batch.file] |= indices
+    for file, res in results.items():
+        res.skipped_cases += [i for i in range(res.n_total) if i not in verified[file]]
+        for cases in [res.passed_cases, res.failed_cases, res.skipped_cases, res.witnesses]:
+            cases.sort()
+        res.n_passed = len(res.passed_cases)
+        res.n_failed = len(res.failed_cases)
+        res.n_skipped = len(res.skipped_cases)
+    return results
+
+def verify_all(executor: ProcessPoolExecutor, n_workers: int, args: argparse.Namespace, spec: Spec, selected: dict) -> tuple:
+    """
+    Verify the selected FECs of all files in batches scheduled by cost.
+    Returns the result of each file, the failed batches, whose FECs are
+    skipped, and the schedule report.
+    """
+    estimates = run_files(executor, estimate_in_worker, args.data, selected)
+    batch_results, failed, report = verify_scheduled(executor, n_workers, args, spec, {file: costs for file, (_, _, costs) in estimates.items()})
+    files = {file: (name, n_total) for file, (name, n_total, _) in estimates.items()}
+    return merge_batches(spec, files, batch_results), failed, report
+
+def verify_deduplicated(executor: ProcessPoolExecutor, n_workers: int, args: argparse.Namespace, spec: Spec, selected: dict) -> tuple:
+    """
+    Verify the selected FECs of all files, verifying only one representative
+    FEC of each group of FECs with the same fingerprint across files, and fan
+    the verdict of the representative out to the other members. Returns the
+    result of each file, in the same format as verify_network_change, the
+    failed batches, whose representatives and their members are skipped, and
+    the schedule report.
+    """
+    # 1. fingerprint the FECs of all files and group them
+    fingerprints = run_files(executor, fingerprint_in_worker, args.data, selected)
+    groups = group_by_fingerprint({(file, i): fingerprint for file, (_, _, fps, _) in fingerprints.items() for i, fingerprint in fps.items()})
+
+    # 2. verify the representatives in batches scheduled by cost
+    representatives = {}
+    for file, i in groups:
+        representatives.setdefault(file, {})[i] = fingerprints[file][3][i]
+    batch_results, failed, report = verify_scheduled(executor, n_workers, args, spec, representatives)
+    verdicts = {}
+    cache_stats = {}
+    load_times = {}
+    tiers = {}
+    for batch, chunk_res in batch_results:
+        witnesses = dict(chunk_res.witnesses)
+        verdicts.update({(batch.file, i): (True, None) for i in chunk_res.passed_cases})
+        verdicts.update({(batch.file, i): (False, witnesses.get(i)) for i in chunk_res.failed_cases})
+        hits, misses = cache_stats.get(batch.file, (0, 0))
+        cache_stats[batch.file] = (hits + chunk_res.cache_hits, misses + chunk_res.cache_misses)
+        load_times[batch.file] = load_times.get(batch.file, 0.0) + chunk_res.load_time
+        merge_tiers(tiers.setdefault(batch.file, []), chunk_res.tiers)
+
+    # 3. fan out the verdicts; FECs without a verified representative are skipped
+    results = {file: empty_result(name, str(spec), n_total) for file, (name, n_total, _, _) in fingerprints.items()}
+    for representative, members in groups.items():
+        verdict = verdicts.get(representative)
+        for file, i in members:
+            chunk_res = results[file]
+            if verdict is None:
+                chunk_res.skipped_cases.append(i)
+            elif verdict[0]:
+                chunk_res.passed_cases.append(i)
+            else:
+                chunk_res.failed_cases.append(i)
+                if verdict[1] is not None:
+                    chunk_res.witnesses.append((i, verdict[1]))
+    for file, (_, n_total, fps, _) in fingerprints.items():
+        chunk_res = results[file]
+        chunk_res.skipped_cases += [i for i in range(n_total) if i not in fps]
+        for cases in [chunk_res.passed_cases, chunk_res.failed_cases, chunk_res.skipped_cases, chunk_res.witnesses]:
+            cases.sort()
+        chunk_res.n_passed = len(chunk_res.passed_cases)
+        chunk_res.n_failed = len(chunk_res.failed_cases)
+        chunk_res.n_skipped = len(chunk_res.skipped_cases)
+        chunk_res.cache_hits, chunk_res.cache_misses = cache_stats.get(file, (0, 0))
+        chunk_res.load_time = load_times.get(file, 0.0)
+        chunk_res.tiers = tiers.get(file, [])
+    return results, failed, report
+
 def main():
     args = parse()
     if args.precision == 'devicegroup' and args.mapping_file is None:
@@ -98,6 +298,11 @@ def main():
     else:
         raise ValueError('Spec is not specified')
 
+    tiers = args.tiers or []
+    sound = sound_precisions.get(args.spec, ())
+    check_tiers(tiers, sound)
+    if 'devicegroup' in tiers and args.mapping_file is None:
+        raise ValueError('Mapping file is required for devicegroup level forwarding graph')
 
     if args.previous_result:
         with open(args.previous_result, 'r') as f:
@@ -120,49 +325,35 @@ def main():
     if os.path.isdir(args.data):
         logging.getLogger().setLevel(logging.ERROR)
         files = os.listdir(args.data)
-        res = VerificationResult(
-            data=args.data,
-            spec=str(spec),
-            n_total=0,
-            n_passed=0,
-            n_failed=0,
-            n_skipped=0,
-            passed_cases=[],
-            failed_cases=[],
-            skipped_cases=[]
-        )
-
-        with ProcessPoolExecutor(max_workers=args.n_cpus, initializer=tqdm.set_lock, initargs=(tqdm.get_lock(),)) as executor:
-            futures = {}
-            for file in files:
-                if prev_failed_cases is not None and file not in prev_failed_cases:
-                    continue
-                indices = prev_failed_cases[file] if prev_failed_cases is not None else None
-                future = executor.submit(verify_network_change, spec, os.path.join(args.data, file), args.format, args.precision, args.alg, args.mapping_file, indices)
-                futures[future] = file
-            
-            for f in tqdm(as_completed(futures.keys()), total=len(files), position=0, leave=True):
-                try:
-                    chunk_res = f.result()
-                except Exception as e:
-                    print(f'Exception raised when verifying {futures[f]}: {e}')
-                    continue
-
-                chunk_res = f.result()
-                res.n_total += chunk_res.n_total
-                res.n_passed += chunk_res.n_passed
-                res.n_failed += chunk_res.n_failed
-                res.n_skipped += chunk_res.n_skipped
-                res.passed_cases += [(chunk_res.data, case) for case in chunk_res.passed_cases]
-                res.failed_cases += [(chunk_res.data, case) for case in chunk_res.failed_cases]
-                res.skipped_cases += [(chunk_res.data, case) for case in chunk_res.skipped_cases]
+        res = empty_result(args.data, str(spec))
+        selected = {file: prev_failed_cases[file] if prev_failed_cases is not None else None
+                    for file in files if prev_failed_cases is None or file in prev_failed_cases}
+
+        n_workers = args.n_cpus if args.n_cpus is not None else os.cpu_count()
+        # workers load the spec and the mapping once, and tasks only carry
+        # file names and FEC indices
+        initargs = (spec, args.format, args.precision, args.mapping_file, args.backend, args.alg, tqdm.get_lock(), tiers, sound)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=initargs) as executor:
+            if args.no_dedup:
+                chunk_results, failed, report = verify_all(executor, n_workers, args, spec, selected)
+            else:
+                chunk_results, failed, report = verify_deduplicated(executor, n_workers, args, spec, selected)
+            for chunk_res in chunk_results.values():
+                merge_result(res, chunk_res)
 
         logging.getLogger().setLevel(logging.INFO)
+        print(f'Schedule: {report}')
+        for batch in failed:
+            print(f'Skipped {len(batch.indices)} FECs of {batch.file} that raised an exception: {batch.indices}')
     else:
-        res = verify_network_change(spec, args.data, args.format, args.precision, args.alg, args.mapping_file, prev_failed_cases)
+        # the FECs of a single file are verified in parallel only if asked
+        n_workers = args.n_cpus if args.n_cpus is not None else 1
+        res = verify_network_change(spec, args.data, args.format, args.precision, args.alg, args.mapping_file, prev_failed_cases, args.backend, not args.no_dedup, n_workers, args.stream, tiers, sound)
 
 
     print(f'Verification result: {res}')
+    for tier in res.tiers:
+        print(f'  {tier}')
 
 
     if args.output:
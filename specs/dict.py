@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Tuple
 
 import rela.language.regularir.regularir as rir
 from .rirspecs import *
@@ -7,4 +7,17 @@ from .fespecs import *
 defined_specs : Dict[str, rir.Spec] = {
     'preserve': preserve_rir(),
     'preserve_fe': preserve_fe(),
-}
\ No newline at end of file
+    'path_length': path_length_rir(),
+}
+
+# the coarse precisions at which each spec is sound for tiered verification
+# (--tiers), i.e., a FEC that passes the spec at such a precision also passes
+# it at the finer ones. Preservation is not sound at any coarse precision, as
+# changes of interfaces or devices within a device group are not visible. A
+# path length bound is sound at both, as each path at a finer precision is
+# viewed as a path of the same length.
+sound_precisions: Dict[str, Tuple[str, ...]] = {
+    'preserve': (),
+    'preserve_fe': (),
+    'path_length': ('device', 'devicegroup'),
+}
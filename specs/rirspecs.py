@@ -2,3 +2,12 @@ from rela.language.regularir.regularir import *
 
 def preserve_rir():
     return preState == postState
+
+def path_length_rir(max_length: int = 8):
+    """
+    Every path after the change visits at most max_length locations.
+    """
+    paths = pEpsilon
+    for _ in range(max_length):
+        paths = PUnion(pEpsilon, PConcat(pDot, paths))
+    return SSubsetEq(postState, paths)
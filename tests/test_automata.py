@@ -1,7 +1,9 @@
 import pytest
 import hfst
 from rela.automata.utils import fst_zero, fst_one, fst_from_symbol, fst_from_symbols, fst_intersect, fst_union, fst_concat, fst_from_fsa_product, fst_complement, fst_from_neg_symbols, fst_from_path_set, fst_image
-from rela.automata import FSTConstructor
+from rela.automata import FSTConstructor, AutomataCache
+from rela.automata.cache import path_set_hash
+from rela.networkmodel.symboltable import SymbolTable
 from rela.networkmodel import SimpleNC
 from rela.language.regularir import PNegSymbols, RIdentity, RProduct, PSymbol, RConcat, PStar, PComplement, RUnion, PEmptySet, RStar, pDot
 
@@ -142,6 +144,14 @@ def test_from_path_set_escape():
     assert len(p.lookup('R23R3')) == 0
     assert len(p.lookup('R4')) == 0
 
+def test_from_path_set_large():
+    paths = [['WAN', f'B{i % 4}', f'S{i}', f'L{j}'] for i in range(100) for j in range(20)]
+    p = fst_from_path_set(paths)
+    # shared prefixes are merged: root, WAN, 4 borders, 100 spines, 2000 leaves
+    assert p.number_of_states() == 1 + 1 + 4 + 100 + 2000
+    assert len(p.lookup('WANB3S7L19')) > 0
+    assert len(p.lookup('WANB2S7L19')) == 0
+
 def test_from_network_state_fattree():
     paths = [['L4', ['S3', 'S4'], 'L3'], [['L1', 'L2'], ['S1', 'S2'], ['B1', 'B2'], ['S3', 'S4'], 'L3'], ['WAN', ['B1', 'B2'], ['S3', 'S4'], 'L3']]
     p = fst_from_path_set(paths)
@@ -158,6 +168,24 @@ def test_compose_relation():
     t.lookup_optimize()
     assert t.lookup('a')[0][0] == 'b'
 
+def test_compose_relation_dead_states():
+    # the branch on 'c' never reaches a final state
+    b = hfst.HfstBasicTransducer()
+    for _ in range(3):
+        b.add_state()
+    b.add_transition(0, 1, 'a', 'a', 0)
+    b.add_transition(0, 2, 'c', 'c', 0)
+    b.add_transition(2, 3, 'c', 'c', 0)
+    b.set_final_weight(1, 0)
+    p1 = hfst.HfstTransducer(b)
+    p2 = hfst.regex('b')
+
+    t = fst_from_fsa_product(p1, p2)
+    assert t.number_of_states() == 4
+    t.lookup_optimize()
+    assert t.lookup('a')[0][0] == 'b'
+    assert len(t.lookup('c')) == 0
+
 def test_apply_relation():
     p = hfst.regex('a')
     r = hfst.regex('a:b')
@@ -230,4 +258,22 @@ def test_rstar():
     assert len(set(t_no_star.lookup('B1'))) == 1 and list(set(t_no_star.lookup('B1')))[0][0] == 'B2'
     assert len(set(t_no_star.lookup('B1B1'))) == 2 # B2B1 and B1B2
     t.lookup_optimize()
-    assert len(set(t.lookup('B1B1'))) == 1 and list(set(t.lookup('B1B1')))[0][0] == 'B2B2'
\ No newline at end of file
+    assert len(set(t.lookup('B1B1'))) == 1 and list(set(t.lookup('B1B1')))[0][0] == 'B2B2'
+def test_automata_cache():
+    cache = AutomataCache(max_size=2)
+    assert path_set_hash([['a', ['c', 'b']]]) == path_set_hash([['a', ['b', 'c']], ['a', ['b', 'c']]])
+    assert path_set_hash([['a', 'b']]) != path_set_hash([['a'], ['b']])
+
+    cache.put('x', 1)
+    cache.put('y', 2)
+    assert cache.get('x') == 1
+    cache.put('z', 3) # evicts y, the least recently used
+    assert cache.get('y') is None
+    assert cache.get('x') == 1 and cache.get('z') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    # entries only match lookups with the same symbol table
+    symbols = SymbolTable()
+    cache.put('s', 4, symbols)
+    assert cache.get('s') is None and cache.get('s', SymbolTable()) is None
+    assert cache.get('s', symbols) == 4
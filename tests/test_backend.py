@@ -0,0 +1,276 @@
+import pytest
+from rela.automata import FSTConstructor, get_backend
+from rela.automata.native import NativeFST, fst_from_acyclic_forwarding_graph
+from rela.networkmodel import SimpleNC
+from rela.networkmodel.relagraphformat import RelaGraphNC, RelaLinkLevelForwardingGraph
+from rela.verification.specverifier import SpecVerifier
+from rela.counterexample.counterexample import CounterExampleGenerator
+from rela.compilation.compiler import RelaCompiler
+from rela.language.regularir import *
+import rela.language.frontend as fe
+
+native = get_backend('native')
+DATASET = 'dataset/graph_change_anonymized/chunk_22_112.json'
+MAPPING = 'dataset/dg_mapping_anonymized.json'
+
+def test_get_backend():
+    assert get_backend('hfst').name == 'hfst'
+    assert get_backend('native').name == 'native'
+    with pytest.raises(ValueError):
+        get_backend('foo')
+
+def test_native_basic_operations():
+    a = native.fst_from_symbol('a')
+    b = native.fst_from_symbol('b')
+    assert isinstance(a, NativeFST)
+    assert a.accepts(['a']) and not a.accepts(['b']) and not a.accepts([])
+
+    t = native.fst_concat(a, b)
+    assert t.accepts(['a', 'b']) and not t.accepts(['a'])
+
+    t = native.fst_union(a, b)
+    assert t.accepts(['a']) and t.accepts(['b']) and not t.accepts(['a', 'b'])
+
+    t = native.fst_star(a)
+    assert t.accepts([]) and t.accepts(['a', 'a', 'a']) and not t.accepts(['b'])
+
+    t = native.fst_intersect(native.fst_union(a, b), b)
+    assert t.accepts(['b']) and not t.accepts(['a'])
+
+    t = native.fst_complement(a, {'a', 'b'})
+    assert not t.accepts(['a'])
+    assert t.accepts([]) and t.accepts(['b']) and t.accepts(['a', 'b'])
+
+    t = native.fst_from_neg_symbols({'a'}, {'a', 'b', 'c'})
+    assert not t.accepts(['a']) and t.accepts(['b']) and t.accepts(['c'])
+
+    assert native.fst_eq(native.fst_concat(), native.fst_zero())
+    assert native.fst_eq(native.fst_star(native.fst_zero()), native.fst_one())
+    assert native.fst_subseteq(a, native.fst_union(a, b))
+    assert not native.fst_subseteq(native.fst_union(a, b), a)
+
+    with pytest.raises(Exception):
+        native.fst_from_symbol('')
+    with pytest.raises(Exception):
+        native.fst_complement(a, None)
+
+def test_native_relations():
+    a = native.fst_from_symbol('a')
+    b = native.fst_from_symbol('b')
+    c = native.fst_from_symbol('c')
+
+    r = native.fst_from_fsa_product(a, b)
+    assert native.fst_eq(native.fst_image(a, r), b)
+    assert native.fst_eq(native.fst_image(b, r), native.fst_zero())
+    assert native.fst_eq(native.fst_reverse_image(b, r), a)
+
+    r2 = native.fst_from_fsa_product(b, c)
+    assert native.fst_eq(native.fst_image(a, native.fst_compose(r, r2)), c)
+
+    # the first relation takes priority for inputs in its domain
+    r3 = native.fst_priority_union(r, native.fst_union(a, b))
+    assert native.fst_eq(native.fst_image(native.fst_union(a, b), r3), b)
+
+def test_native_minimize():
+    paths = [['a', 'b', 'd'], ['a', 'c', 'd'], ['b', 'b', 'd']]
+    t = native.fst_from_path_set(paths)
+    m = native.fst_minimize(t)
+    assert native.fst_eq(t, m)
+    assert m.number_of_states() == 5
+    assert sorted(native.fst_extract_paths(m)) == sorted(paths)
+
+def test_native_acyclic_forwarding_graph():
+    # A and B both reach C, and C and D are interchangeable sinks
+    graph = RelaLinkLevelForwardingGraph(
+        graph={'A': {'C': ['x'], 'D': ['y']}, 'B': {'C': ['x'], 'D': ['y']}, 'C': {}, 'D': {}},
+        sources={'A', 'B'},
+        sinks={'C', 'D'})
+    t = fst_from_acyclic_forwarding_graph(graph)
+    assert t.number_of_states() == 3
+    assert t.accepts(['A', 'x']) and t.accepts(['B', 'y']) and not t.accepts(['A'])
+    assert native.fst_eq(t, native.fst_from_path_set([[['A', 'B'], ['x', 'y']]]))
+
+    # nodes that cannot reach a sink are dropped; graphs are immutable, so
+    # they are rebuilt from a copy of their adjacency
+    edges = graph.graph
+    edges['A']['E'] = ['z']
+    edges['E'] = {}
+    graph = RelaLinkLevelForwardingGraph(edges, graph.sources, graph.sinks)
+    t = fst_from_acyclic_forwarding_graph(graph)
+    assert t.number_of_states() == 3 and not t.accepts(['A', 'z'])
+
+    # cycles fall back to the general construction
+    edges['C'] = {'A': ['w']}
+    graph = RelaLinkLevelForwardingGraph(edges, graph.sources, graph.sinks)
+    assert fst_from_acyclic_forwarding_graph(graph) is None
+    for backend in ['hfst', 'native']:
+        b = get_backend(backend)
+        t = b.fst_from_forwarding_graph(graph)
+        xw = b.fst_concat(b.fst_from_symbol('x'), b.fst_from_symbol('w'))
+        assert b.fst_eq(t, b.fst_concat(b.fst_from_symbols({'A', 'B'}), b.fst_star(xw), b.fst_from_symbols({'x', 'y'})))
+
+@pytest.mark.parametrize('backend', ['hfst', 'native'])
+def test_backend_relations_fattree(backend):
+    paths = [['L2', ['S1', 'S2'], 'L1'], [['L3', 'L4'], ['S3', 'S4'], ['B1', 'B2'], ['S1', 'S2'], 'L1'], ['WAN', ['B1', 'B2'], ['S1', 'S2'], 'L1']]
+    alphabet = {'WAN', 'B1', 'B2', 'S1', 'S2', 'S3', 'S4', 'L1', 'L2', 'L3', 'L4'}
+    b = get_backend(backend)
+    constructor = FSTConstructor(alphabet, None, b)
+
+    p = b.fst_from_path_set(paths)
+    res = b.fst_image(p, RIdentity(PStar(PNegSymbols('B1'))).accept(constructor))
+    expected = b.fst_from_path_set([['L2', ['S1', 'S2'], 'L1'], [['L3', 'L4'], ['S3', 'S4'], 'B2', ['S1', 'S2'], 'L1'], ['WAN', 'B2', ['S1', 'S2'], 'L1']])
+    assert b.fst_eq(res, expected)
+
+@pytest.mark.parametrize('backend', ['hfst', 'native'])
+def test_backend_eq_witness(backend):
+    b = get_backend(backend)
+    x, y, z = b.fst_from_symbol('x'), b.fst_from_symbol('y'), b.fst_from_symbol('z')
+    xy_or_xz = b.fst_union(b.fst_concat(x, y), b.fst_concat(x, z))
+    assert b.fst_eq_witness(xy_or_xz, b.fst_concat(x, b.fst_from_symbols({'y', 'z'}))) is None
+    assert b.fst_eq_witness(b.fst_star(x), b.fst_concat(x, b.fst_star(x))) == []
+    assert b.fst_eq_witness(xy_or_xz, b.fst_concat(x, y)) == ['x', 'z']
+
+    # the witness is a shortest distinguishing string
+    long = b.fst_concat(x, x, x, y)
+    assert b.fst_eq_witness(b.fst_union(long, b.fst_concat(x, z)), long) == ['x', 'z']
+
+@pytest.mark.parametrize('backend', ['hfst', 'native'])
+def test_backend_subseteq_witness(backend):
+    b = get_backend(backend)
+    x, y, z = b.fst_from_symbol('x'), b.fst_from_symbol('y'), b.fst_from_symbol('z')
+    xy = b.fst_concat(x, y)
+    xy_or_xz = b.fst_union(xy, b.fst_concat(x, z))
+    assert b.fst_subseteq_witness(xy, xy_or_xz) is None
+    assert b.fst_subseteq_witness(xy_or_xz, xy) == ['x', 'z']
+    assert b.fst_subseteq_witness(b.fst_star(x), b.fst_concat(x, b.fst_star(x))) == []
+    assert b.fst_subseteq_witness(b.fst_concat(b.fst_star(x), y), b.fst_concat(b.fst_star(x), b.fst_from_symbols({'y', 'z'}))) is None
+
+    # the inputs are left untouched
+    assert b.fst_eq(xy_or_xz, b.fst_concat(x, b.fst_from_symbols({'y', 'z'})))
+    assert b.fst_eq(xy, b.fst_concat(x, y))
+
+@pytest.mark.parametrize('backend', ['hfst', 'native'])
+def test_backend_wildcards(backend):
+    b = get_backend(backend)
+    a, x, y, z = b.fst_from_symbol('a'), b.fst_from_symbol('x'), b.fst_from_symbol('y'), b.fst_from_symbol('z')
+    dots = b.fst_star(b.fst_from_wildcard({'a'}))
+    universe = b.fst_star(b.fst_from_wildcard(set()))
+    xy = b.fst_concat(x, y)
+
+    # wildcards match symbols they have never seen
+    assert b.fst_eq(b.fst_image(xy, dots), xy)
+    assert b.fst_eq(b.fst_intersect(dots, xy), xy)
+    assert b.fst_eq(b.fst_image(b.fst_concat(x, a), dots), b.fst_zero())
+    assert b.fst_eq(b.fst_image(xy, b.fst_from_fsa_product(dots, z)), z)
+
+    # subtracting from all strings is an involution, and minimization keeps
+    # the language
+    not_a = b.fst_minus(universe, a)
+    assert b.fst_subseteq(b.fst_union(x, xy, b.fst_one()), not_a)
+    assert b.fst_subseteq_witness(a, not_a) == ['a']
+    assert b.fst_eq(b.fst_minus(universe, not_a), a)
+    assert b.fst_eq(b.fst_minimize(b.fst_minus(universe, a)), not_a)
+    assert b.fst_eq(b.fst_minus(dots, not_a), b.fst_zero())
+
+    # wildcards with different exclusions are compared symbol by symbol
+    assert b.fst_eq_witness(dots, universe) == ['a']
+    assert b.fst_eq_witness(b.fst_star(b.fst_union(b.fst_from_wildcard({'a'}), a)), universe) is None
+
+    # bounded to an alphabet, wildcards and complements are the ones of
+    # fst_from_neg_symbols and fst_complement, which only leave the alphabet
+    # along the prefixes of the complemented strings
+    bound = b.fst_star(b.fst_from_symbols({'a', 'x', 'y'}))
+    assert b.fst_eq(b.fst_intersect(dots, bound), b.fst_star(b.fst_from_neg_symbols({'a'}, {'a', 'x', 'y'})))
+    a_star = b.fst_star(a)
+    expected = b.fst_union(a_star, b.fst_concat(x, a_star), b.fst_concat(xy, a, a_star))
+    assert b.fst_eq(b.fst_complement(xy, {'a'}), expected)
+    assert b.fst_eq(b.fst_minus(b.fst_concat(b.fst_prefixes(xy), a_star), xy), expected)
+    assert b.fst_eq(b.fst_prefixes(b.fst_zero()), b.fst_one())
+
+@pytest.mark.parametrize('backend', ['hfst', 'native'])
+def test_backend_lazy_image(backend):
+    b = get_backend(backend)
+    a, x, y, z = b.fst_from_symbol('a'), b.fst_from_symbol('x'), b.fst_from_symbol('y'), b.fst_from_symbol('z')
+    dots = b.fst_star(b.fst_from_wildcard(set()))
+    paths = b.fst_union(b.fst_concat(x, y), b.fst_concat(a, x, y))
+
+    # lazy relations relate the same string pairs as materialized ones
+    change = b.fst_lazy_concat(dots, b.fst_lazy_union(b.fst_lazy_product(y, z), b.fst_lazy_product(a, b.fst_one())), dots)
+    expected = b.fst_union(b.fst_concat(x, z), b.fst_concat(a, x, z), b.fst_concat(x, y))
+    assert b.fst_eq(b.fst_lazy_image(paths, change), expected)
+    change = b.fst_concat(dots, b.fst_union(b.fst_from_fsa_product(y, z), b.fst_from_fsa_product(a, b.fst_one())), dots)
+    assert b.fst_eq(b.fst_lazy_image(paths, change), expected)
+    assert b.fst_eq(b.fst_lazy_image(paths, b.fst_lazy_product(a, z)), b.fst_zero())
+
+def test_native_lazy_image_expansion():
+    b = get_backend('native')
+    x, y, z = b.fst_from_symbol('x'), b.fst_from_symbol('y'), b.fst_from_symbol('z')
+    unreachable = b.fst_lazy_product(z, y)
+    change = b.fst_lazy_union(b.fst_lazy_product(x, y), b.fst_lazy_concat(z, unreachable))
+    assert b.fst_eq(b.fst_lazy_image(x, change), y)
+    # the relation is not expanded past inputs that the FSA cannot read
+    assert unreachable._arcs == {}
+
+def test_verification_witness():
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    res = SpecVerifier.verify(preState == postState, state)
+    assert res.failed_cases == [0]
+    assert res.witnesses[0][0] == 0
+    witness = res.witnesses[0][1]
+    assert witness[0] == 'SPINE-3.DC3|vrf' and witness[-1] == 'drop'
+
+    # a composed spec keeps the witness of its failed cases only
+    assert (~(preState == postState)).accept(SpecVerifier(state)).witnesses == []
+    assert ((preState == postState) & (preState == preState)).accept(SpecVerifier(state)).witnesses == res.witnesses
+
+    counter_examples = (preState == postState).accept(CounterExampleGenerator({0: state.slices[0]})).counter_examples
+    assert tuple(witness) in [c.witness for c in counter_examples]
+
+conformance_cases = [
+    (P('b') * P('c') | I(~P('b')), [['a'], ['b']], [['a'], ['c']]),
+    (P('b') * P('c') | I(~P('b')), [['a'], ['b']], [['a'], ['b'], ['c']]),
+    ((P('b') * P('c')) // I(PStar(pDot)), [['a'], ['b']], [['a'], ['c']]),
+    ((P('b') * P('c')) // I(PStar(pDot)), [['a'], ['b']], [['a'], ['d']]),
+    (RCompose(I(P('a') | P('b')), P('b') * P('c') | I(~P('b'))), [['a'], ['b']], [['a'], ['c']]),
+    (I(PStar(pDot)) + (P('r2') * (P('r2') | P('r4'))) + I(PStar(pDot)), [['r1', 'r2', 'r3']], [['r1', 'r2', 'r3'], ['r1', 'r4', 'r3']]),
+    (I(PStar(pDot)) + (P('r2') * (P('r2') | P('r4'))) + I(PStar(pDot)), [['r1', 'r2', 'r3']], [['r1', 'r5', 'r3']]),
+    (RStar(RUnion(RIdentity(PNegSymbols('B1')), RProduct(PSymbol('B1'), PSymbol('B2')))), [['B1', 'B1']], [['B2', 'B2']]),
+]
+
+@pytest.mark.parametrize('change, before_paths, after_paths', conformance_cases)
+def test_backend_conformance_simple(change, before_paths, after_paths):
+    nc = SimpleNC.from_single_fec(before_paths, after_paths)
+    for spec in [preState >> change == postState, preState >> change <= postState, postState <= preState >> change]:
+        expected = SpecVerifier.verify(spec, nc, backend='hfst')
+        actual = SpecVerifier.verify(spec, nc, backend='native')
+        assert expected.n_skipped == 0
+        assert actual.passed_cases == expected.passed_cases
+        assert actual.failed_cases == expected.failed_cases
+
+def test_backend_conformance_counterexample():
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    spec = preState >> I(PStar(pDot)) == postState
+    failed_cases = {i: state.slices[i] for i in range(state.count_fec())}
+    expected = spec.accept(CounterExampleGenerator(failed_cases, 'hfst'))
+    actual = spec.accept(CounterExampleGenerator(failed_cases, 'native'))
+    assert len(actual.counter_examples) == len(expected.counter_examples) == 1
+    for field in ['before_paths', 'after_paths', 'left_paths', 'right_paths']:
+        assert set(getattr(actual.counter_examples[0], field)) == set(getattr(expected.counter_examples[0], field))
+
+dataset_specs = {
+    'preserve_rir': preState == postState,
+    'preserve_fe': RelaCompiler.compile(fe.PStar(fe.pDot) % fe.Preserve()),
+    'add_else_preserve': RelaCompiler.compile((fe.PStar(fe.pDot) % fe.Add(fe.P('x'))) | (fe.PStar(fe.pDot) % fe.Preserve())),
+    'drop_any': RelaCompiler.compile((fe.PStar(fe.pDot) % fe.Preserve()) + (fe.P('drop') % fe.Any(fe.pDot))),
+    'subset': preState <= preState | postState,
+}
+
+@pytest.mark.parametrize('precision', ['interface', 'device', 'devicegroup'])
+def test_backend_conformance_dataset(precision):
+    state = RelaGraphNC.from_json(DATASET, precision, MAPPING)
+    for spec in dataset_specs.values():
+        expected = spec.accept(SpecVerifier(state, backend='hfst'))
+        actual = spec.accept(SpecVerifier(state, backend='native'))
+        assert expected.n_skipped == actual.n_skipped == 0
+        assert sorted(actual.passed_cases) == sorted(expected.passed_cases)
+        assert sorted(actual.failed_cases) == sorted(expected.failed_cases)
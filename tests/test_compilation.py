@@ -59,3 +59,11 @@ def test_fe_compilation_else():
     assert str(spec) == 'a : add(b);\nelse .* : preserve;'
     compiled = RelaCompiler.compile(spec)
     assert str(compiled) == 'preState ▶ (I(a + b) + (a x b) + I(~(a + b)) o I(.*)) = postState ▶ (I(a + b) + I(~(a + b)) o I(.*))'
+
+def test_fe_compilation_shared_regex():
+    spec = (P('a') | P('b')) % Add(P('c')) + (P('a') | P('b')) % Preserve()
+    compiled = RelaCompiler.compile(spec)
+    assert str(compiled) == 'preState ▶ (I(a + b + c) + ((a + b) x c))I(a + b) = postState ▶ I(a + b + c)I(a + b)'
+    # equal regexes are compiled once
+    add, preserve = compiled.p.rel.args
+    assert add.args[1].p is preserve.arg
@@ -3,6 +3,12 @@ from rela.verification.specverifier import SpecVerifier
 from rela.language.regularir import *
 
     
+def _names(state, symbols):
+    return set(state.symbols.names(symbols))
+
+def _out_edges(state, graph, node):
+    return {state.symbols.name(next_node): _names(state, edges) for next_node, edges in graph.get_out_edges(state.symbols.get(node)).items()}
+
 
 def test_load_rela_graph_format_interface_level():
     state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json')
@@ -19,40 +25,40 @@ def test_load_rela_graph_format_interface_level():
     # check forwarding graph format
     before_graph = fec.get_before_state()
     # check alphabet
-    assert before_graph.get_alphabet() == set(
+    assert _names(state, before_graph.get_alphabet()) == set(
         ['SPINE-3.DC3|vrf', 
          'BORDER-1.DC1|vrf|GigabitEthernet3/1/1', 
          'BORDER-2.DC1|vrf|GigabitEthernet3/0/1', 
          'drop'])
     # check nodes
-    assert before_graph.get_nodes() == set(
+    assert _names(state, before_graph.get_nodes()) == set(
         ['SPINE-3.DC3|vrf',
          'BORDER-1.DC1|vrf',
          'BORDER-2.DC1|vrf',
          'drop'])
     # check out edges
-    assert before_graph.get_out_edges('SPINE-3.DC3|vrf') == {
+    assert _out_edges(state, before_graph, 'SPINE-3.DC3|vrf') == {
         'BORDER-1.DC1|vrf': set(['BORDER-1.DC1|vrf|GigabitEthernet3/1/1']),
         'BORDER-2.DC1|vrf': set(['BORDER-2.DC1|vrf|GigabitEthernet3/0/1']),
     }
-    assert before_graph.get_out_edges('BORDER-1.DC1|vrf') == {
+    assert _out_edges(state, before_graph, 'BORDER-1.DC1|vrf') == {
         'drop': set(['drop']),
     }
-    assert before_graph.get_out_edges('BORDER-2.DC1|vrf') == {
+    assert _out_edges(state, before_graph, 'BORDER-2.DC1|vrf') == {
         'drop': set(['drop']),
     }
     # check sink
-    assert before_graph.is_sink('drop') == True
-    assert before_graph.is_sink('BORDER-1.DC1|vrf') == False
-    assert before_graph.is_sink('BORDER-2.DC1|vrf') == False
-    assert before_graph.is_sink('SPINE-3.DC3|vrf') == False
-    assert before_graph.is_sink('') == False
+    assert before_graph.is_sink(state.symbols.get('drop')) == True
+    assert before_graph.is_sink(state.symbols.get('BORDER-1.DC1|vrf')) == False
+    assert before_graph.is_sink(state.symbols.get('BORDER-2.DC1|vrf')) == False
+    assert before_graph.is_sink(state.symbols.get('SPINE-3.DC3|vrf')) == False
+    assert before_graph.is_sink(state.symbols.get('')) == False
     # check source
-    assert before_graph.is_source('drop') == False
-    assert before_graph.is_source('BORDER-1.DC1|vrf') == False
-    assert before_graph.is_source('BORDER-2.DC1|vrf') == False
-    assert before_graph.is_source('SPINE-3.DC3|vrf') == True
-    assert before_graph.is_source('') == False
+    assert before_graph.is_source(state.symbols.get('drop')) == False
+    assert before_graph.is_source(state.symbols.get('BORDER-1.DC1|vrf')) == False
+    assert before_graph.is_source(state.symbols.get('BORDER-2.DC1|vrf')) == False
+    assert before_graph.is_source(state.symbols.get('SPINE-3.DC3|vrf')) == True
+    assert before_graph.is_source(state.symbols.get('')) == False
 
 def test_load_rela_graph_format_device_level():
     state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
@@ -69,40 +75,40 @@ def test_load_rela_graph_format_device_level():
     # check forwarding graph format
     before_graph = fec.get_before_state()
     # check alphabet
-    assert before_graph.get_alphabet() == set(
+    assert _names(state, before_graph.get_alphabet()) == set(
         ['SPINE-3.DC3|vrf',
             'BORDER-1.DC1|vrf',
             'BORDER-2.DC1|vrf',
             'drop'])
     # check nodes
-    assert before_graph.get_nodes() == set(
+    assert _names(state, before_graph.get_nodes()) == set(
         ['SPINE-3.DC3|vrf',
             'BORDER-1.DC1|vrf',
             'BORDER-2.DC1|vrf',
             'drop'])
     # check out edges
-    assert before_graph.get_out_edges('SPINE-3.DC3|vrf') == {
+    assert _out_edges(state, before_graph, 'SPINE-3.DC3|vrf') == {
         'BORDER-1.DC1|vrf': set(['BORDER-1.DC1|vrf']),
         'BORDER-2.DC1|vrf': set(['BORDER-2.DC1|vrf']),
     }
-    assert before_graph.get_out_edges('BORDER-1.DC1|vrf') == {
+    assert _out_edges(state, before_graph, 'BORDER-1.DC1|vrf') == {
         'drop': set(['drop']),
     }
-    assert before_graph.get_out_edges('BORDER-2.DC1|vrf') == {
+    assert _out_edges(state, before_graph, 'BORDER-2.DC1|vrf') == {
         'drop': set(['drop']),
     }
     # check sink
-    assert before_graph.is_sink('drop') == True
-    assert before_graph.is_sink('BORDER-1.DC1|vrf') == False
-    assert before_graph.is_sink('BORDER-2.DC1|vrf') == False
-    assert before_graph.is_sink('SPINE-3.DC3|vrf') == False
-    assert before_graph.is_sink('') == False
+    assert before_graph.is_sink(state.symbols.get('drop')) == True
+    assert before_graph.is_sink(state.symbols.get('BORDER-1.DC1|vrf')) == False
+    assert before_graph.is_sink(state.symbols.get('BORDER-2.DC1|vrf')) == False
+    assert before_graph.is_sink(state.symbols.get('SPINE-3.DC3|vrf')) == False
+    assert before_graph.is_sink(state.symbols.get('')) == False
     # check source
-    assert before_graph.is_source('drop') == False
-    assert before_graph.is_source('BORDER-1.DC1|vrf') == False
-    assert before_graph.is_source('BORDER-2.DC1|vrf') == False
-    assert before_graph.is_source('SPINE-3.DC3|vrf') == True
-    assert before_graph.is_source('') == False
+    assert before_graph.is_source(state.symbols.get('drop')) == False
+    assert before_graph.is_source(state.symbols.get('BORDER-1.DC1|vrf')) == False
+    assert before_graph.is_source(state.symbols.get('BORDER-2.DC1|vrf')) == False
+    assert before_graph.is_source(state.symbols.get('SPINE-3.DC3|vrf')) == True
+    assert before_graph.is_source(state.symbols.get('')) == False
 
 
 def test_verify_rela_graph_format_interface_level():
@@ -168,3 +174,146 @@ def test_verify_rela_graph_format_device_group_level():
 
     assert spec.accept(verifier).is_passed() == True
 
+
+def test_rela_graph_format_symbol_table():
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    before_graph = state.slices[0].get_before_state()
+    assert state.slices[0].get_symbol_table() is state.symbols
+    assert all(isinstance(symbol, int) for symbol in before_graph.get_alphabet())
+
+    # names are interned once per load
+    symbol = state.symbols.get('drop')
+    assert state.symbols.intern('drop') == symbol
+    assert state.symbols.name(symbol) == state.symbols.name(str(symbol)) == 'drop'
+    assert state.symbols.get('UNSEEN-DEVICE|vrf') is None
+
+
+def test_rela_graph_format_attribute_index():
+    state = RelaGraphNC.from_json(
+        json_file='tests/data/example_rela_graph_network_state.json',
+        mapping_file='tests/data/example_rela_device_group_mapping.json')
+    index = state.slices[0].get_attribute_index()
+    assert index is state.index
+
+    assert _names(state, index.lookup('device', 'BORDER-1.DC1')) == {'BORDER-1.DC1|vrf', 'BORDER-1.DC1|vrf|GigabitEthernet3/1/1'}
+    assert 'BORDER-2.DC1|vrf' in _names(state, index.lookup('group', 'BORDER.DC1'))
+    assert 'BORDER-1.DC1|vrf|GigabitEthernet3/1/1' in _names(state, index.lookup('Interface', 'GigabitEthernet3/1/1'))
+    assert index.lookup('device', 'UNSEEN-DEVICE') == set()
+    assert index.lookup('region', 'DC1') is None
+
+    # predicates resolve through the index
+    verifier = SpecVerifier(state)
+    border = I(PStar(pDot)) + I(Pred('group', 'BORDER.DC1')) + I(PStar(pDot))
+    assert (preState >> border == preState).accept(verifier).is_passed() == True
+    spine = I(PStar(pDot)) + I(Pred('device', 'SPINE-3.DC3')) + I(PStar(pDot))
+    assert (postState >> spine == postState).accept(verifier).is_passed() == True
+
+    state = RelaGraphNC.from_json(
+        json_file='tests/data/example_rela_graph_network_state.json',
+        precision='devicegroup',
+        mapping_file='tests/data/example_rela_device_group_mapping.json')
+    # devices match the locations of their groups
+    assert _names(state, state.index.lookup('device', 'BORDER-2.DC1')) == {'BORDER.DC1|vrf'}
+
+
+def test_rela_graph_format_binary(tmp_path):
+    import pickle
+    from rela.networkmodel.relagraphformat import BinaryRelaGraphNC, IpTrafficKey, convert_json
+    from rela.networkmodel.symboltable import SymbolTable
+
+    json_file, mapping = 'tests/data/example_rela_graph_network_state.json', 'tests/data/example_rela_device_group_mapping.json'
+    bin_file = str(tmp_path / 'example.bin')
+    assert convert_json(json_file, bin_file) == 1
+
+    # one binary file is loaded at every precision, into the same graphs
+    for precision in ['interface', 'device', 'devicegroup']:
+        symbols = SymbolTable()
+        expected = RelaGraphNC.from_json(json_file, precision, mapping, symbols=symbols)
+        state = BinaryRelaGraphNC.from_file(bin_file, precision, mapping, symbols=symbols)
+        assert state.count_fec() == 1
+        fec, expected_fec = state.slices[0], expected.slices[0]
+        assert fec.ip_traffic_keys == expected_fec.ip_traffic_keys
+        assert fec.graph_before == expected_fec.graph_before
+        assert fec.graph_after == expected_fec.graph_after
+
+    state = BinaryRelaGraphNC.from_file(bin_file, precision='device')
+    unchange = I(PStar(PNegSymbols('BORDER-1.DC1|vrf', 'BORDER-2.DC1|vrf')))
+    assert (preState >> unchange == postState).accept(SpecVerifier(state)).is_passed() == False
+    spec = SPrefixITE(preState == postState, preState <= postState, IPGuard('14.0.0.0/8'))
+    assert spec.accept(SpecVerifier(state)).passed_cases == spec.accept(SpecVerifier(RelaGraphNC.from_json(json_file, 'device'))).passed_cases
+
+    # FECs are looked up by any of their IP traffic keys
+    dataset_file = str(tmp_path / 'dataset.bin')
+    convert_json('dataset/graph_change_anonymized/chunk_22_112.json', dataset_file)
+    dataset = BinaryRelaGraphNC.from_file(dataset_file, precision='device')
+    for fec in [dataset.slices[0], dataset.slices[57], dataset.slices[111]]:
+        for key in fec.ip_traffic_keys:
+            assert dataset.get_fec(key).ip_traffic_keys == fec.ip_traffic_keys
+    assert dataset.view('interface').get_fec(fec.ip_traffic_keys[0]).ip_traffic_keys == fec.ip_traffic_keys
+    assert dataset.get_fec(IpTrafficKey('0.0.0.0', '0.0.0.0', 0)) is None
+
+    # other processes map the file again
+    copy = pickle.loads(pickle.dumps(state))
+    assert copy.precision == 'device' and copy.slices[0].graph_after == state.slices[0].graph_after
+    assert spec.accept(SpecVerifier(state, n_workers=2)).passed_cases == spec.accept(SpecVerifier(state)).passed_cases
+
+
+def test_rela_graph_format_csr_graph():
+    import pickle
+    import pytest
+
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='interface')
+    fec = state.slices[0]
+    graph = fec.get_after_state()
+    spine = state.symbols.get('SPINE-3.DC3|vrf')
+
+    # graphs are immutable, and their alphabets are computed once
+    with pytest.raises(AttributeError):
+        graph.sources = set()
+    assert graph.get_alphabet() is graph.get_alphabet()
+    assert fec.compute_alphabet() is fec.compute_alphabet()
+    assert fec.compute_alphabet() == graph.get_alphabet() | fec.get_before_state().get_alphabet()
+
+    # edges are iterated without building sets, in the same graph
+    assert sorted(graph.get_edges(spine)) == sorted((next_node, edge) for next_node, edges in graph.get_out_edges(spine).items() for edge in edges)
+    assert list(graph.get_edges(state.symbols.get('drop'))) == []
+
+    # a graph is equal to the graph built from its adjacency, and pickled
+    # with its arrays for parallel verification
+    assert RelaLinkLevelForwardingGraph(graph.graph, graph.sources, graph.sinks) == graph
+    copy = pickle.loads(pickle.dumps(graph))
+    assert copy == graph and copy.get_out_edges(spine) == graph.get_out_edges(spine)
+    assert RelaDeviceLevelForwardingGraph({'A': {'B'}}, {'A'}, {'B'}) != RelaDeviceLevelForwardingGraph({'A': {'C'}}, {'A'}, {'C'})
+
+
+def test_rela_graph_format_views(tmp_path):
+    import pytest
+    from rela.networkmodel.relagraphformat import BinaryRelaGraphNC, convert_json
+
+    json_file, mapping = 'tests/data/example_rela_graph_network_state.json', 'tests/data/example_rela_device_group_mapping.json'
+    state = RelaGraphNC.from_json(json_file, 'interface', mapping)
+    bin_file = str(tmp_path / 'example.bin')
+    convert_json(json_file, bin_file)
+    binary = BinaryRelaGraphNC.from_file(bin_file, 'devicegroup', mapping, symbols=state.symbols)
+
+    # one load is viewed at every precision, with the graphs of a load at
+    # that precision
+    for precision in ['interface', 'device', 'devicegroup']:
+        expected = RelaGraphNC.from_json(json_file, precision, mapping, symbols=state.symbols).slices[0]
+        for view in [state.view(precision), binary.view(precision)]:
+            assert view.slices[0].graph_before == expected.graph_before
+            assert view.slices[0].graph_after == expected.graph_after
+            assert view.slices[0].ip_traffic_keys == expected.ip_traffic_keys
+    assert state.view('interface') is state and state.view('device') is state.view('device')
+
+    # device views share the nodes and edges of the interface-level graphs
+    assert state.view('device').slices[0].get_before_state().get_nodes() is state.slices[0].get_before_state().get_nodes()
+    with pytest.raises(ValueError):
+        state.view('device').view('interface')
+
+    # predicates on devices match their groups in a device group view
+    border = Pred('device', 'BORDER-1.DC1')
+    change = I(PStar(pDot)) + (border * (border | P('NEW-DEVICE|vrf'))) + I(PStar(pDot))
+    unchange = I(PStar(PIntersect(pDot, ~border)))
+    spec = preState >> (change | unchange) == postState
+    assert spec.accept(SpecVerifier(state.view('devicegroup'))).is_passed() == True
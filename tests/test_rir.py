@@ -145,3 +145,74 @@ def test_pspec_construction():
 
 
 
+
+def test_simplifier():
+    from rela.language.regularir.simplifier import RIRSimplifier, count_nodes
+    a, b, c = P('a'), P('b'), P('c')
+    simplifier = RIRSimplifier()
+
+    # flattening and folding
+    assert str(simplifier.simplify(PConcat(PConcat(a, pEpsilon), b, c))) == 'abc'
+    assert simplifier.simplify(PConcat(a, pEmptySet)) is pEmptySet
+    assert str(simplifier.simplify(PUnion(PUnion(a, pEmptySet), b))) == 'a + b'
+    assert simplifier.simplify(PStar(pEmptySet)) is pEpsilon
+    assert simplifier.simplify(~~preState) is preState
+    # ~~a is not a where a is not in the alphabet
+    assert simplifier.simplify(~~a).arg.arg is a
+    assert str(simplifier.simplify(a | PStar(pDot))) == 'a + .*'
+    assert simplifier.simplify(preState | PStar(pDot)).arg == pDot
+    assert simplifier.simplify(RConcat(I(a), rEmptySet)) is rEmptySet
+    assert simplifier.simplify(RUnion(rEmptySet, a * b)).p is a
+
+    # identities and images
+    assert str(simplifier.simplify(RCompose(I(a | b), I(~b)))) == 'I(a + b ∩ ~b)'
+    assert str(simplifier.simplify(I(a) | I(b) | (a * c))) == 'I(a + b) + (a x c)'
+    assert str(simplifier.simplify(I(PStar(pDot)) + I(a))) == 'I(.*a)'
+    assert str(simplifier.simplify(preState >> I(a | b))) == 'preState ∩ a + b'
+    assert str(simplifier.simplify(preState >> RCompose(I(~a), a * b))) == '(preState ∩ ~a) ▶ (a x b)'
+    assert simplifier.simplify(postState >> I(PStar(pDot))) is postState
+
+    # unchanged expressions are returned as is, and results are memoized
+    spec = preState >> (a * b | I(~a)) == postState
+    assert simplifier.simplify(spec) is spec
+    spec = preState >> RCompose(I(a), I(PStar(pDot))) == postState >> I(PStar(pDot))
+    assert str(simplifier.simplify(spec)) == 'preState ∩ a = postState'
+    assert simplifier.simplify(spec) is simplifier.simplify(spec)
+    assert count_nodes(spec) == 14 and count_nodes(simplifier.simplify(spec)) == 5
+    assert simplifier.nodes_after < simplifier.nodes_before
+
+    # shared subexpressions are simplified once
+    shared = PConcat(a, b, pEpsilon)
+    assert simplifier.simplify(preState <= shared).q is simplifier.simplify(postState == shared | c).q.args[0]
+
+def test_hashcons():
+    from rela.language.hashcons import NodeTable, MemoizingVisitor
+    from rela.language.regularir.alphabet_scanner import AlphabetScanner
+    nodes = NodeTable()
+    spec1 = preState >> (P('a') * P('b') | I(~P('a'))) == postState >> I(P('a') | P('b'))
+    spec2 = preState >> (P('a') * P('b') | I(~P('a'))) == postState >> I(P('a') | P('b'))
+    assert nodes.hash(spec1) == nodes.hash(spec2)
+    assert nodes.hash(P('a') + P('b')) != nodes.hash(P('a') | P('b'))
+    assert nodes.hash(PNegSymbols('a', 'b')) != nodes.hash(PNegSymbols('ab'))
+    assert nodes.hash(SPrefixITE(spec1, spec1, IPGuard('10.0.0.0/8'))) != nodes.hash(SPrefixITE(spec1, spec1, IPGuard('11.0.0.0/8')))
+    # hashes are stable across tables
+    assert NodeTable().hash(spec1) == nodes.hash(spec2)
+
+    # structurally equal nodes are interned to one object
+    interned = nodes.intern(spec1)
+    assert nodes.intern(spec2) is interned
+    assert str(interned) == str(spec1)
+    a = interned.p.rel.args[0].p
+    assert interned.p.rel.args[1].arg.arg is a
+    assert interned.q.rel.arg.args[0] is a
+    assert nodes.intern(preState) is preState
+    assert nodes.intern(interned) is interned
+
+    # a memoizing visitor visits shared nodes once
+    class CountingScanner(AlphabetScanner):
+        visits = 0
+        def visit_p_symbol(self, expr):
+            CountingScanner.visits += 1
+            return super().visit_p_symbol(expr)
+    assert interned.accept(CountingScanner()) == {'a', 'b'}
+    assert CountingScanner.visits == 2
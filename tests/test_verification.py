@@ -1,5 +1,8 @@
 from rela.networkmodel import SimpleNC
+from rela.networkmodel.simpleimpl.simpleimplementation import SimplePathFEC
+from rela.networkmodel.relagraphformat import RelaGraphNC
 from rela.verification.specverifier import SpecVerifier
+from rela.verification.dedup import fec_fingerprint, group_by_fingerprint
 from rela.language.regularir import *
 
 def test_verification_basic():
@@ -148,3 +151,343 @@ def test_verification_example_3():
     before_paths = [['a']]
     after_paths = [['a'], ['c']]
     assert SpecVerifier.verify(spec, SimpleNC.from_single_fec(before_paths, after_paths)).is_passed() == False
+
+def test_verification_automata_cache():
+    paths = [['a', 'b'], ['a', 'c']]
+    nc = SimpleNC.from_single_fec(paths, list(reversed(paths)))
+
+    # both network states have the same content and share one automaton
+    res = SpecVerifier.verify(preState == postState, nc)
+    assert res.is_passed()
+    assert (res.cache_hits, res.cache_misses) == (1, 1)
+
+    # the clauses of a composed spec share the state automata of the FEC
+    res = SpecVerifier.verify((preState == postState) & (postState <= preState), nc)
+    assert (res.cache_hits, res.cache_misses) == (1, 1)
+
+def test_verification_dedup():
+    nc = SimpleNC({
+        '0': SimplePathFEC([['a'], ['b']], [['a'], ['c']]),
+        '1': SimplePathFEC([['b'], ['a']], [['c'], ['a']]),
+        '2': SimplePathFEC([['a'], ['b']], [['a'], ['b']]),
+    })
+    fingerprints = {i: fec_fingerprint(preState == postState, fec) for i, fec in enumerate(nc.iterate())}
+    assert fingerprints[0] == fingerprints[1] != fingerprints[2]
+    assert group_by_fingerprint(fingerprints) == {0: [0, 1], 2: [2]}
+
+    spec = preState >> (P('b') * P('c') | I(~P('b'))) == postState
+    res = spec.accept(SpecVerifier(nc))
+    assert res.passed_cases == [0, 1] and res.failed_cases == [2]
+    assert res.witnesses in ([(2, ['b'])], [(2, ['c'])])
+    assert (res.cache_hits, res.cache_misses) == (2, 2) # FEC 2 reuses the automaton of ['a'], ['b']
+
+    expected = spec.accept(SpecVerifier(nc, dedup=False))
+    assert (expected.passed_cases, expected.failed_cases) == (res.passed_cases, res.failed_cases)
+
+def test_verification_dedup_guard():
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    fec = state.slices[0]
+    spec = preState == postState
+    assert fec_fingerprint(SPrefixITE(spec, spec, IPGuard('14.0.0.0/8')), fec) != fec_fingerprint(SPrefixITE(spec, spec, IPGuard('11.0.0.0/8')), fec)
+
+    # portable fingerprints are stable across loads with different symbol tables
+    other = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device').slices[0]
+    assert fec_fingerprint(spec, fec) == fec_fingerprint(spec, other)
+
+def test_verification_subexpression_memo():
+    nc = SimpleNC({
+        '0': SimplePathFEC([['a', 'b']], [['a', 'c']]),
+        '1': SimplePathFEC([['a', 'b']], [['a', 'b']]),
+        '2': SimplePathFEC([['b']], [['c']]),
+    })
+    spec = preState >> (P('b') * P('c') | I(~P('b'))) == postState
+    verifier = SpecVerifier(nc, dedup=False)
+    assert verifier.memo.dependencies(spec.p) == {'state', 'wildcard'}
+    assert verifier.memo.dependencies(P('b') * P('c') | I(~P('b'))) == {'wildcard'}
+    assert verifier.memo.dependencies(P('b') * P('c')) == set()
+    assert verifier.memo.dependencies(PPredicate('Device', 'b')) == {'alphabet'}
+
+    res = spec.accept(verifier)
+    assert len(res.passed_cases) == 2 and len(res.failed_cases) == 1
+    # the relation is built once per set of spec symbols missing from the
+    # alphabet, FECs 0 and 2 share one
+    assert verifier.memo.hits > 0
+
+    expected = spec.accept(SpecVerifier(nc, dedup=False, memo=None))
+    assert (expected.passed_cases, expected.failed_cases) == (res.passed_cases, res.failed_cases)
+
+def test_verification_plan():
+    import pickle
+    from rela.automata.plan import SpecPlanner
+
+    relation = P('b') * P('c') | I(~P('b'))
+    spec = preState >> (relation + relation) == postState
+    plan = pickle.loads(pickle.dumps(SpecPlanner.lower(spec)))
+    atomic = plan.leaves[0]
+    assert atomic.relation == 'eq'
+    # the shared relation is lowered once, and only the state-dependent
+    # instructions, the ones with wildcards and the bound of the wildcards to
+    # the alphabet differ between FECs
+    assert len(atomic.instructions) == 12
+    assert [atomic.instructions[i].op for i in atomic.dependent()] == ['pre_state', 'complement', 'lazy_union', 'lazy_concat', 'image', 'universe', 'intersect', 'post_state']
+    # registers are reused once their values are no longer read
+    assert atomic.n_registers < len(atomic.instructions)
+
+    nc = SimpleNC({
+        '0': SimplePathFEC([['a', 'b']], [['a', 'c']]),
+        '1': SimplePathFEC([['a', 'b']], [['a', 'b']]),
+    })
+    res = spec.accept(SpecVerifier(nc, dedup=False))
+    assert (res.passed_cases, res.failed_cases) == ([], [0, 1])
+
+    # a SPrefixITE selects its branch per FEC
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    fec = state.slices[0]
+    plan = SpecPlanner.lower(SPrefixITE(preState == postState, preState <= postState, IPGuard('0.0.0.0/0')))
+    assert plan.select(fec) is plan.leaves[0]
+    plan = SpecPlanner.lower(SPrefixITE(preState == postState, SAnd(preState == postState, preState == postState), IPGuard('255.255.255.255/32')))
+    try:
+        plan.select(fec)
+        assert False
+    except ValueError:
+        pass
+
+def test_verification_parallel():
+    nc = SimpleNC({
+        str(i): SimplePathFEC([['a', 'b', 'c'][:1 + i % 3]], [['a', 'c'] if i % 4 == 0 else ['a', 'b', 'c'][:1 + i % 3]])
+        for i in range(12)
+    })
+    spec = preState >> (P('b') * P('c') | I(~P('b'))) == postState
+    for dedup in [True, False]:
+        for selected_indices in [None, [1, 4, 5, 8]]:
+            expected = spec.accept(SpecVerifier(nc, selected_indices, dedup=dedup))
+            res = spec.accept(SpecVerifier(nc, selected_indices, dedup=dedup, n_workers=2))
+            assert (res.passed_cases, res.failed_cases, res.skipped_cases) == (expected.passed_cases, expected.failed_cases, expected.skipped_cases)
+            assert res.witnesses == expected.witnesses
+
+    # SPrefixITE branches and composed specs
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    specs = [
+        preState == postState,
+        SPrefixITE(preState == postState, preState <= postState, IPGuard('14.0.0.0/8')),
+        SAnd(preState <= postState, ~(preState == postState)),
+    ]
+    for spec in specs:
+        for dedup in [True, False]:
+            for selected_indices in [None, [0, 2]]:
+                expected = spec.accept(SpecVerifier(state, selected_indices, dedup=dedup))
+                res = spec.accept(SpecVerifier(state, selected_indices, dedup=dedup, n_workers=2))
+                assert (res.passed_cases, res.failed_cases, res.skipped_cases) == (expected.passed_cases, expected.failed_cases, expected.skipped_cases)
+                assert res.witnesses == expected.witnesses
+
+def test_verification_parallel_warm_workers():
+    # workers get the network change once, so the FECs of all their tasks
+    # share one symbol table, and the caches hit across tasks
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    nc = RelaGraphNC(state.slices * 16, 'repeated', state.symbols, state.index, state.precision)
+    spec = preState == postState
+    serial = spec.accept(SpecVerifier(nc, dedup=False))
+    n_lookups = serial.cache_hits + serial.cache_misses
+    res = spec.accept(SpecVerifier(nc, dedup=False, n_workers=2))
+    assert res.failed_cases == serial.failed_cases == list(range(16))
+    # 8 tasks of 2 FECs, and only the first task of each worker misses
+    assert res.cache_misses <= 2 * serial.cache_misses
+    assert res.cache_hits + res.cache_misses == n_lookups
+
+def test_verification_scheduler():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from rela.scheduler import estimate_cost, make_batches, run_batches
+    from rela.verification import VerificationResult
+
+    state = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    spec = preState == postState
+    assert estimate_cost(spec, state.slices[0]) > estimate_cost(spec, SimplePathFEC([['a', 'b']], [['a']]))
+
+    # batches of consecutive indices of about the same cost, largest first
+    costs = {'small': {0: 1, 1: 1, 2: 1}, 'large': {0: 10, 1: 1, 2: 1}}
+    batches = make_batches(costs, n_workers=1)
+    assert [(batch.file, batch.indices, batch.cost) for batch in batches] == [('large', [0], 10), ('small', [0, 1, 2], 3), ('large', [1, 2], 2)]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results, failed, report = run_batches(executor, 2, lambda file, indices: (file, indices), batches)
+    assert sorted(res for _, res in results) == sorted((batch.file, batch.indices) for batch in batches)
+    assert failed == [] and report.n_batches == 3 and 0 <= report.efficiency <= 1
+
+    # batches that raise an exception are returned as failed
+    def fail_large(file, indices):
+        if file == 'large':
+            raise ValueError(file)
+        return file, indices
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results, failed, _ = run_batches(executor, 2, fail_large, batches)
+    assert [batch for batch, _ in results] == [batches[1]]
+    assert sorted(failed, key=lambda batch: batch.cost) == [batches[2], batches[0]]
+
+    # the time spent loading is not busy time
+    def load_and_run(file, indices):
+        time.sleep(0.02)
+        return VerificationResult(file, '', 0, 0, 0, 0, [], [], [], load_time=0.01)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        _, _, report = run_batches(executor, 2, load_and_run, batches)
+    assert abs(report.load_time - 0.03) < 1e-9 and report.busy_time >= 0.03
+
+def test_verification_fused_boolean_spec():
+    from rela.automata.plan import SpecPlanner
+
+    fail, success = preState == postState, preState <= preState
+    spec = SOr(SAnd(fail, success), SNot(SAnd(success, fail)))
+    plan = SpecPlanner.lower(spec)
+    assert len(plan.leaves) == 4
+
+    # SAnd stops at the first failing conjunct, SOr at the first passing disjunct
+    checked = []
+    def check(atomic_plan):
+        checked.append(plan.leaves.index(atomic_plan))
+        return (atomic_plan.relation == 'subseteq', None if atomic_plan.relation == 'subseteq' else ['a'])
+    fec = SimplePathFEC([['a', 'b']], [['a', 'c']])
+    assert plan.evaluate(fec, check) == (True, None)
+    assert checked == [0, 2, 3]
+
+    nc = SimpleNC({
+        '0': SimplePathFEC([['a', 'b']], [['a', 'c']]),
+        '1': SimplePathFEC([['a', 'b']], [['a', 'b']]),
+    })
+    res = SAnd(fail, SNot(success)).accept(SpecVerifier(nc))
+    assert (res.passed_cases, res.failed_cases) == ([], [0, 1])
+    assert [case for case, _ in res.witnesses] == [0] and res.witnesses[0][1] in [['a', 'b'], ['a', 'c']]
+    res = SOr(fail, SNot(success)).accept(SpecVerifier(nc))
+    assert (res.passed_cases, res.failed_cases) == ([1], [0])
+
+def test_verification_worker_context():
+    import rela.main as main
+    from rela.main import init_worker, verify_in_worker, verify_network_change
+
+    file, mapping = 'tests/data/example_rela_graph_network_state.json', 'tests/data/example_rela_device_group_mapping.json'
+    spec = preState == postState
+    init_worker(spec, precision='devicegroup', mapping_file=mapping)
+    context = main._worker
+    expected = verify_network_change(spec, file, precision='devicegroup', mapping_file=mapping)
+    first = verify_in_worker(file)
+    n_symbols = len(context.symbols)
+    # the last network change is kept, e.g., for the next batch of the file
+    kept = verify_in_worker(file)
+    assert first.load_time > 0 and kept.load_time == 0
+    assert context.load(file) is context.loaded[1]
+    context.loaded = None
+    second = verify_in_worker(file)
+    assert second.load_time > 0
+    for res in [first, kept, second]:
+        assert (res.passed_cases, res.failed_cases, res.skipped_cases) == (expected.passed_cases, expected.failed_cases, expected.skipped_cases)
+
+    # files loaded by a worker share its symbol table, caches and plans
+    assert len(context.symbols) == n_symbols
+    assert len(context.plans) == 1
+    assert second.cache_misses == 0 and second.cache_hits > 0
+
+def test_verification_stream():
+    import json
+    from rela.networkmodel.relagraphformat import LazyRelaGraphNC, IpTrafficKey
+    from rela.networkmodel.relagraphformat.jsonstream import JSONArrayReader
+
+    file = 'tests/data/example_rela_graph_network_state.json'
+    with open(file) as f:
+        data = json.load(f)
+    # elements cut across reads are decoded once the rest is read
+    for chunk_size in [1, 7, 4096]:
+        assert list(JSONArrayReader(file, chunk_size)) == data
+
+    state = RelaGraphNC.from_json(file, precision='device')
+    lazy = LazyRelaGraphNC.from_json(file, precision='device')
+    assert lazy.count_fec() == state.count_fec()
+    spec = SPrefixITE(preState == postState, preState <= postState, IPGuard('14.0.0.0/8'))
+    expected = spec.accept(SpecVerifier(state))
+    for n_workers in [1, 2]:
+        for dedup in [True, False]:
+            res = spec.accept(SpecVerifier(lazy, dedup=dedup, n_workers=n_workers))
+            assert (res.passed_cases, res.failed_cases, res.skipped_cases) == (expected.passed_cases, expected.failed_cases, expected.skipped_cases)
+            assert res.witnesses == expected.witnesses
+
+    # ranges continue reading where the previous one stopped
+    file = 'dataset/graph_change_anonymized/chunk_22_112.json'
+    state = RelaGraphNC.from_json(file, precision='device')
+    lazy = LazyRelaGraphNC.from_json(file, precision='device', symbols=state.symbols)
+    for start, stop in [(0, 3), (3, 10), (50, 60), (5, 8), (111, 200)]:
+        fecs = list(lazy.iterate_range(start, stop))
+        assert [fec.graph_after for fec in fecs] == [fec.graph_after for fec in state.slices[start:stop]]
+        assert lazy._cursor[0] == min(stop, state.count_fec())
+
+    # FECs are looked up by streaming the file until their key
+    for fec in [state.slices[0], state.slices[57]]:
+        assert lazy.get_fec(fec.ip_traffic_keys[-1]).graph_after == fec.graph_after
+    assert lazy.get_fec(IpTrafficKey('0.0.0.0', '0.0.0.0', 0)) is None
+
+def test_verification_tiers():
+    import pytest
+    import rela.main as main
+    from rela.main import init_worker, verify_in_worker, verify_network_change
+    from rela.networkmodel.relagraphformat.csrgraph import PRECISIONS
+    from specs.dict import defined_specs, sound_precisions
+
+    file, mapping = 'dataset/graph_change_anonymized/chunk_22_112.json', 'dataset/dg_mapping_anonymized.json'
+    # a path length bound passed at a coarser precision is passed at the finer ones
+    spec, sound = defined_specs['path_length'], sound_precisions['path_length']
+    coarse = verify_network_change(spec, file, precision='devicegroup', mapping_file=mapping, backend='native')
+    fine = verify_network_change(spec, file, precision='interface', mapping_file=mapping, backend='native')
+    assert 0 < len(coarse.passed_cases) < coarse.n_total
+
+    # only the FECs that do not pass at device-group precision are verified
+    # again, and the verdicts are those of the finest precision
+    res = verify_network_change(spec, file, precision='interface', mapping_file=mapping, backend='native', tiers=['device', 'devicegroup'], sound_precisions=sound)
+    assert (res.passed_cases, res.failed_cases, res.skipped_cases) == (fine.passed_cases, fine.failed_cases, fine.skipped_cases)
+    assert [tier.precision for tier in res.tiers] == ['devicegroup', 'device', 'interface']
+    assert res.tiers[0].n_verified == res.n_total and res.tiers[1].n_verified == res.n_total - len(coarse.passed_cases)
+    assert res.tiers[-1].n_failed == res.n_failed
+
+    # selected FECs out of range are not verified
+    res = verify_network_change(spec, file, precision='device', mapping_file=mapping, backend='native', selected_indices=[1, 2, 500], tiers=['devicegroup'], sound_precisions=sound)
+    assert res.tiers[0].n_verified == 2 and res.n_skipped == res.n_total - 2
+
+    # workers view the files they load at the tiers
+    init_worker(spec, precision='device', mapping_file=mapping, backend='native', tiers=('devicegroup',), sound_precisions=sound)
+    assert main._worker.indices['devicegroup'].grouped
+    res = verify_in_worker(file)
+    expected = verify_network_change(spec, file, precision='device', mapping_file=mapping, backend='native', tiers=['devicegroup'], sound_precisions=sound)
+    assert (res.passed_cases, res.failed_cases, res.skipped_cases) == (expected.passed_cases, expected.failed_cases, expected.skipped_cases)
+    assert [tier.n_verified for tier in res.tiers] == [tier.n_verified for tier in expected.tiers]
+
+    # preservation is not sound at coarser precisions
+    preserve = defined_specs['preserve']
+    with pytest.raises(ValueError):
+        verify_network_change(preserve, file, precision='device', mapping_file=mapping, tiers=['devicegroup'], sound_precisions=sound_precisions['preserve'])
+    with pytest.raises(ValueError):
+        verify_network_change(preserve, file, precision='device', mapping_file=mapping, tiers=['devicegroup'])
+    with pytest.raises(ValueError):
+        init_worker(preserve, precision='device', mapping_file=mapping, tiers=('devicegroup',))
+    with pytest.raises(ValueError):
+        verify_network_change(spec, file, precision='device', mapping_file=mapping, tiers=['interface'], sound_precisions=PRECISIONS)
+    with pytest.raises(ValueError):
+        verify_network_change(spec, file, precision='device', mapping_file=mapping, tiers=['devicegroup'], stream=True, sound_precisions=sound)
+
+def test_verification_predicate_semantics():
+    import pytest
+    from rela.language.regularir import Pred
+
+    # the same paths as a graph and as a path set
+    graph_nc = RelaGraphNC.from_json('tests/data/example_rela_graph_network_state.json', precision='device')
+    before = [['SPINE-3.DC3|vrf', 'BORDER-1.DC1|vrf', 'drop'], ['SPINE-3.DC3|vrf', 'BORDER-2.DC1|vrf', 'drop']]
+    after = before + [['SPINE-3.DC3|vrf', 'NEW-DEVICE|vrf', 'drop']]
+    path_nc = SimpleNC.from_single_fec(before, after)
+
+    def verdict(nc, predicate):
+        paths = PStar(pDot) + predicate + PStar(pDot)
+        return SpecVerifier.verify(PIntersect(preState, paths) == PIntersect(postState, paths), nc, backend='native').is_passed()
+
+    # values match a field exactly, not a substring of the name
+    for predicate, expected in [(Pred('device', 'NEW-DEVICE'), False), (Pred('device', 'NEW'), True), (Pred('Device', 'BORDER-1.DC1'), True), (Pred('vrf', 'vrf'), False)]:
+        assert verdict(graph_nc, predicate) == verdict(path_nc, predicate) == expected
+
+    # unknown fields are rejected on both
+    for nc in [graph_nc, path_nc]:
+        with pytest.raises(ValueError):
+            verdict(nc, Pred('role', 'a'))